@@ -21,17 +21,59 @@ from __future__ import print_function
 #  - csv The Xilinx eye-scanner stores the result in csv format.
 #  - argparse needed to parse command line arguments
 #  - traceback handle exceptions
+#  - time measure the throughput of the batch analyzer
+#  - multiprocessing spread the batch analysis across the CPU cores
+#  - mmap read the (possibly huge) scan files without loading them into memory
+#  - hashlib, json name and describe the entries of the scan cache
+#  - collections ordered parameter spaces
+#  - sqlite3 persistent store of the scan results
+#  - uuid unique sentinels of the batched commands and unique temporary file names
+#  - asyncio, concurrent.futures, functools drive the TX/RX Vivado instances concurrently
+#  - threading tune many lanes in parallel
+#  - socket, socketserver serve warmed-up Vivado sessions from a local daemon
+#  - secrets, hmac the access token of the daemon
+#  - contextlib the no-op span of the disabled tracer
+#  - queue, atexit the background writer of the scan archive
+#  - sys exit code of the headless runs
 import os
 import re
 import csv
 import argparse
 import traceback
+import time
+import multiprocessing
+import mmap
+import hashlib
+import json
+import collections
+import sqlite3
+import uuid
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import socket
+import socketserver
+import secrets
+import hmac
+import contextlib
+import queue
+import atexit
+import sys
 
 # Import 3th party modules:
-#  - wexpect to launch ant interact with subprocesses.
+#  - wexpect to launch ant interact with subprocesses. (wexpect is Windows only, pexpect has the
+#    same interface on the other platforms, eg. to run the Vivado simulator of the tests.)
 #  - logging to write logs of running
+#  - numpy to store and evaluate the scan grids.
 import logging
-import wexpect
+try:
+    import wexpect
+    spawnOptions = {}
+except ImportError:
+    import pexpect as wexpect
+    spawnOptions = {'encoding': 'utf-8', 'echo': False}
+import numpy as np
 
 cleyeLogo = '''
        _                   
@@ -55,28 +97,251 @@ logging.basicConfig(level=logging.INFO)
 logging.basicConfig(filename='cleye.log', filemode='w', format='%(asctime)s - %(name)s: [%(levelname)s] %(message)s')
 
 
+class _Span():
+    ''' A running span of the Tracer. (See Tracer.span)
+    '''
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        
+        
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+        
+        
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.category, self.begin, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer():
+    ''' Collects the timing spans of the tuning phases (Vivado commands by verb, scan reading and
+    analysis, sweep points).
+    
+    The spans can be exported to the Chrome trace format (chrome://tracing, Perfetto) and
+    summarized per phase. When the tracer is disabled (default) span returns a shared no-op
+    context manager, so the instrumented code pays only a function call.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.origin = time.perf_counter()
+        
+        
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        
+        
+    def clear(self):
+        self.events = []
+        
+        
+    def span(self, name, category='cleye', **args):
+        if not self.enabled:
+            return _noSpan
+        return _Span(self, name, category, args)
+        
+        
+    def record(self, name, category, begin, end, args=None):
+        # list.append is atomic: the spans of parallel threads (lanes) can be recorded without lock.
+        self.events.append({
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (begin - self.origin) * 1e6,
+            'dur': (end - begin) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args or {},
+            })
+        
+        
+    def writeChromeTrace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+        logging.info('Trace of {} spans has been written to {}'.format(len(self.events), filename))
+        
+        
+    def summary(self):
+        ''' Returns the per phase (category, name) statistics of the spans (in seconds), sorted by
+        the total time.
+        '''
+        durations = collections.defaultdict(list)
+        for e in self.events:
+            durations[(e['cat'], e['name'])].append(e['dur'] / 1e6)
+        rows = []
+        for (category, name), d in durations.items():
+            d = np.array(d)
+            p50, p90, p99 = np.percentile(d, [50, 90, 99])
+            rows.append({'category': category, 'name': name, 'count': len(d), 'total': float(d.sum()),
+                'p50': float(p50), 'p90': float(p90), 'p99': float(p99), 'max': float(d.max())})
+        return sorted(rows, key=lambda r: -r['total'])
+        
+        
+    def printSummary(self):
+        print('{:<10} {:<24} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9}'.format(
+            'category', 'phase', 'count', 'total [s]', 'p50 [ms]', 'p90 [ms]', 'p99 [ms]', 'max [ms]'))
+        for r in self.summary():
+            print('{:<10} {:<24} {:>7} {:>10.3f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                r['category'], r['name'][:24], r['count'], r['total'],
+                r['p50'] * 1e3, r['p90'] * 1e3, r['p99'] * 1e3, r['max'] * 1e3))
+
+
+_noSpan = contextlib.nullcontext()
+
+# The tracer of the tuning phases. (Disabled by default, see the --trace option.)
+tracer = Tracer()
+
+
+def _commandVerb(cmd):
+    ''' Returns the verb of a console command for the tracing: the first word of the command, the
+    called command of 'set var [command ...]' and 'batch' for the batched commands (see doBatch).
+    '''
+    if cmd.startswith('set __cleye_batch '):
+        return 'batch'
+    m = re.match(r'\s*set\s+\S+\s+\[\s*(\S+)', cmd)
+    if m:
+        return m.group(1).rstrip(']')
+    words = cmd.split(None, 1)
+    return words[0] if words else '<empty>'
+
+
+class TranscriptRecorder():
+    ''' JSONL transcript of the Vivado sessions: every command with its output and timing, and the
+    scan files produced by the commands. (See ReplayVivado)
+    
+    The console methods only put the (unformatted) events to a queue; the events are encoded and
+    written by a daemon thread, so recording is not on the critical path. One line per event:
+     - spawn: session, executable, args
+     - startup: session, t, dt, before, match
+     - do: session, seq, t, dt, cmd, prompt, before, match
+     - file: session, seq (of the command which produced it), path, data
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.origin = time.time()
+        
+        
+    def start(self, filename):
+        ''' Starts recording to filename. '''
+        self.file = open(filename, 'w')
+        self.origin = time.time()
+        self.sessions = 0
+        self.thread = threading.Thread(target=self._run, name='TranscriptRecorder', daemon=True)
+        self.thread.start()
+        self.enabled = True
+        logging.info('Recording the Vivado sessions to ' + filename)
+        
+        
+    def newSession(self, executable='', args=[]):
+        with self.lock:
+            session = self.sessions
+            self.sessions += 1
+        self.queue.put({'kind': 'spawn', 'session': session, 'executable': executable, 'args': list(args)})
+        return session
+        
+        
+    def record(self, event):
+        self.queue.put(event)
+        
+        
+    def recordFile(self, vivado, filename):
+        ''' Records a scan file produced by the last command of a session (read in background). '''
+        if self.enabled and getattr(vivado, 'transcriptSession', None) is not None:
+            self.queue.put({'kind': 'file', 'session': vivado.transcriptSession, 'seq': vivado.transcriptSeq,
+                'path': filename})
+        
+        
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            try:
+                if event is None:
+                    break
+                if event['kind'] == 'file':
+                    # The line endings of the scan are kept.
+                    with open(event['path'], newline='') as f:
+                        event['data'] = f.read()
+                self.file.write(json.dumps(event) + '\n')
+            except (IOError, OSError) as e:
+                logging.error('Cannot record {}: {}'.format(event, e))
+            finally:
+                self.queue.task_done()
+                
+                
+    def close(self):
+        ''' Writes the pending events and stops recording. '''
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+# The recorder of the Vivado sessions. (Disabled by default, see the --record option.)
+transcript = TranscriptRecorder()
+atexit.register(transcript.close)
+
+
 class Vivado():
     def __init__(self, executable, args):
         self.childProc = None
-        self.childProc = wexpect.spawn(executable, args)
+        self.transcriptSession = transcript.newSession(executable, args) if transcript.enabled else None
+        self.transcriptSeq = -1
+        self.childProc = wexpect.spawn(executable, args, **spawnOptions)
+        
+        
+    def _record(self, kind, begin, **event):
+        ''' Records a console event to the transcript (see TranscriptRecorder). '''
+        if self.transcriptSession is None:
+            self.transcriptSession = transcript.newSession()
+        event.update({'kind': kind, 'session': self.transcriptSession, 't': begin - transcript.origin,
+            'dt': time.time() - begin})
+        if kind == 'do':
+            self.transcriptSeq += 1
+            event['seq'] = self.transcriptSeq
+        transcript.record(event)
         
         
     def waitStartup(self):
-        self.childProc.expect(vivadoPrompt)
+        begin = time.time()
+        with tracer.span('startup', 'vivado'):
+            self.childProc.expect(vivadoPrompt)
+        if transcript.enabled:
+            self._record('startup', begin, before=self.childProc.before, match=self.childProc.match.group(0))
         # print the texts
-        logging.debug(self.childProc.before + self.childProc.match.group(0))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(self.childProc.before + self.childProc.match.group(0))
         
         
-    def do(self, cmd, prompt=vivadoPrompt, puts=False, errmsgs=[]):
+    def do(self, cmd, prompt=vivadoPrompt, puts=False, errmsgs=[], timeout=-1):
         ''' do a simple command in Vivado console
+        timeout is the timeout of waiting for the prompt in seconds (-1: the default of wexpect, None: no timeout).
         '''
         if self.childProc.terminated:
             logging.error('The process has been terminated. Sending command is not possible.')
             raise Exception('The process has been terminated. Sending command is not possible.')
-        self.childProc.sendline(cmd)
+        begin = time.time()
+        # The span is tagged with the verb of the command (parsed only when tracing).
+        with tracer.span(_commandVerb(cmd), 'vivado') if tracer.enabled else _noSpan:
+            self.childProc.sendline(cmd)
+            if prompt:
+                self.childProc.expect(vivadoPrompt, timeout=timeout)
+        if transcript.enabled:
+            self._record('do', begin, cmd=cmd, prompt=bool(prompt), before=self.childProc.before if prompt else '',
+                match=self.childProc.match.group(0) if prompt else '')
         if prompt:
-            self.childProc.expect(vivadoPrompt)
-            logging.debug(cmd + self.childProc.before + self.childProc.match.group(0))
+            # The debug message is built only if it is logged.
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(cmd + self.childProc.before + self.childProc.match.group(0))
             for em in  errmsgs:
                 if em in self.childProc.before:
                     logging.error('during running command: ' + cmd + self.childProc.before)
@@ -87,6 +352,45 @@ class Vivado():
                 print(self.childProc.match.group(0), end='')
         
         
+    def doBatch(self, cmds, errmsgs=[], timeout=-1):
+        ''' Runs several commands in one console round trip.
+        
+        The commands are sent in one line, each of them wrapped in a catch and preceded by a unique
+        sentinel, so the output can be split back per command. (The commands must be single line
+        Tcl commands with balanced braces.) The output of a command is what it prints plus its
+        result, like in the console. A failing command prints 'ERROR: <message>' instead of
+        stopping the batch. Raises exception if the output of any command contains any of errmsgs.
+        Returns the list of the outputs.
+        '''
+        if not cmds:
+            return []
+        token = uuid.uuid4().hex[:16]
+        # The sentinel is printed using a variable, so the echo of the sent line never contains it.
+        parts = ['set __cleye_batch ' + token]
+        for i, cmd in enumerate(cmds):
+            parts.append('puts "<<$__cleye_batch:{}>>"'.format(i))
+            parts.append('if {{[catch {{{}}} __cleye_result]}} {{puts "ERROR: $__cleye_result"}} '
+                'elseif {{$__cleye_result ne ""}} {{puts $__cleye_result}}'.format(cmd))
+        parts.append('puts "<<$__cleye_batch:end>>"')
+        self.do('; '.join(parts), timeout=timeout)
+        
+        output = self.childProc.before
+        marks = list(re.finditer(r'<<{}:(\d+|end)>>'.format(token), output))
+        if len(marks) != len(cmds) + 1:
+            logging.error('Incomplete batch output: ' + output)
+            raise Exception('Incomplete batch output: ' + output)
+        
+        outputs = []
+        for cmd, begin, end in zip(cmds, marks[:-1], marks[1:]):
+            out = output[begin.end():end.start()].strip('\r\n')
+            for em in errmsgs:
+                if em in out:
+                    logging.error('during running command: ' + cmd + out)
+                    raise Exception('during running command: ' + cmd + out)
+            outputs.append(out)
+        return outputs
+        
+        
     def chooseDevice(self, devices, side, vivadoPrompt=vivadoPrompt, puts=False):
         ''' set the hw target (blaster) and device (FPGA) for TX and RX side.
         '''
@@ -95,25 +399,34 @@ class Vivado():
             print(str(i) + ' ' + dev)
 
         print('Choose device for {}: '.format(side), end='')
-        deviceId = input()
+        deviceId = int(input())
         device = devices[deviceId]
 
         errmsgs = ['DONE status = 0', 'The debug hub core was not detected.']
         self.do('set_device ' + device, vivadoPrompt, puts, errmsgs = errmsgs)
+        return device
 
 
-    def chooseSio(self, side, createLink=True, vivadoPrompt=vivadoPrompt, puts=False):
-        ''' Set the transceiver channel for TX/RX side.
+    def listSios(self, vivadoPrompt=vivadoPrompt, puts=False):
+        ''' Returns the transceiver channels (hw_sio_gts) of the current device.
         '''
         self.do('', vivadoPrompt, puts)
         errmsgs = ['No matching hw_sio_gts were found.']
         self.do('get_hw_sio_gts', vivadoPrompt, puts, errmsgs=errmsgs)
         sios = [x for x in self.childProc.before.splitlines() if x ]
-        sios = sios[0].split(' ')
+        return sios[0].split(' ')
+
+
+    def chooseSio(self, side, createLink=True, vivadoPrompt=vivadoPrompt, puts=False, sios=None):
+        ''' Set the transceiver channel for TX/RX side.
+        The channels of the current device are listed, unless they are given in sios.
+        '''
+        if sios is None:
+            sios = self.listSios(vivadoPrompt, puts)
         for i, sio in enumerate(sios):
             print(str(i) + ' ' + sio)
         print('Print choose a SIO for {} side : '.format(side), end='')
-        sioId = input()
+        sioId = int(input())
         sio = sios[sioId]
 
         if createLink:
@@ -155,6 +468,31 @@ class Vivado():
         self.do(cmd, vivadoPrompt, puts)
         
         
+    def get_properties(self, propNames, objectNames):
+        ''' Reads many properties of many objects in one console round trip.
+        Returns a dict of objectName -> ordered dict of propName -> value.
+        '''
+        cmds = ['get_property {} {}'.format(p, o) for o in objectNames for p in propNames]
+        outputs = iter(self.doBatch(cmds, errmsgs=['ERROR: ']))
+        ret = {}
+        for o in objectNames:
+            ret[o] = collections.OrderedDict()
+            for p in propNames:
+                val = [x for x in next(outputs).splitlines() if x]
+                ret[o][p] = val[0] if val else ''
+        return ret
+        
+        
+    def set_properties(self, settings, objectNames, commit=True):
+        ''' Writes many properties (dict of propName -> value) of many objects in one console round
+        trip. The objects are committed (commit_hw_sio) at the end, if commit is true.
+        '''
+        cmds = ['set_property {} {} {}'.format(p, v, o) for o in objectNames for p, v in settings.items()]
+        if commit:
+            cmds += ['commit_hw_sio ' + o for o in objectNames]
+        self.doBatch(cmds, errmsgs=['ERROR: '])
+        
+        
     def exit(self):
         if self.childProc.terminated:
             logging.warning('This process has been terminated.')
@@ -163,58 +501,504 @@ class Vivado():
             self.do('exit', None)
             return self.childProc.wait()
         
+class AsyncVivado():
+    ''' asyncio driver of a Vivado instance.
+    
+    The blocking console I/O of the wrapped Vivado runs on a dedicated thread of this instance, so
+    the commands of one instance are executed in order, while the commands of different instances
+    (TX/RX) overlap. The console methods of Vivado are available as coroutines.
+    Blocking code which drives the wrapped Vivado directly (eg. independent_finder) must hold the
+    instance exclusively, see runExclusive.
+    '''
+    def __init__(self, vivado=None):
+        self.vivado = vivado
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # Held by every command and by runExclusive.
+        self.lock = asyncio.Lock()
+        
+        
+    async def _run(self, func, *args, **kwargs):
+        async with self.lock:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        
+        
+    @staticmethod
+    async def runExclusive(sessions, func, *args, **kwargs):
+        ''' Runs a blocking function which drives the Vivado instances of the sessions (AsyncVivado
+        list) directly. It runs on the executor of the first session, while all sessions are held:
+        the commands awaited by other coroutines wait until func returns.
+        '''
+        async with contextlib.AsyncExitStack() as stack:
+            # The same order everywhere, so two holders cannot deadlock.
+            for session in sorted(set(sessions), key=id):
+                await stack.enter_async_context(session.lock)
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(sessions[0].executor, functools.partial(func, *args, **kwargs))
+        
+        
+    async def spawn(self, executable=vivadoPath, args=vivadoArgs):
+        self.vivado = await self._run(Vivado, executable, args)
+        return self
+        
+        
+    async def startup(self, sourceFile='sourceme.tcl'):
+        ''' Waits for the prompt of Vivado and sources the TCL procedures.
+        '''
+        await self._run(self.vivado.waitStartup)
+        await self.do('source ' + sourceFile)
+        
+        
+    async def do(self, cmd, *args, **kwargs):
+        await self._run(self.vivado.do, cmd, *args, **kwargs)
+        return self.vivado.childProc.before
+        
+        
+    async def doBatch(self, cmds, *args, **kwargs):
+        return await self._run(self.vivado.doBatch, cmds, *args, **kwargs)
+        
+        
+    async def get_var(self, varname):
+        return await self._run(self.vivado.get_var, varname)
+        
+        
+    async def get_property(self, propName, objectName, *args, **kwargs):
+        return await self._run(self.vivado.get_property, propName, objectName, *args, **kwargs)
+        
+        
+    async def set_property(self, propName, value, objectName, *args, **kwargs):
+        return await self._run(self.vivado.set_property, propName, value, objectName, *args, **kwargs)
+        
+        
+    async def get_properties(self, propNames, objectNames):
+        return await self._run(self.vivado.get_properties, propNames, objectNames)
+        
+        
+    async def set_properties(self, settings, objectNames, commit=True):
+        return await self._run(self.vivado.set_properties, settings, objectNames, commit)
+        
+        
+    async def applySetting(self, sioGt, pName, pValue):
+        return await self._run(applySetting, self.vivado, sioGt, pName, pValue)
+        
+        
+    async def exit(self):
+        ret = await self._run(self.vivado.exit)
+        self.executor.shutdown(wait=False)
+        return ret
+        
+        
 def _parsescanRows(scanRows):
+    ''' Converts the raw (string) rows between 'Scan Start' and 'Scan End' to numpy arrays.
+    
+    The returned scanData contains the x (horizontal offset in UI) and y (vertical offset) axes as
+    1D float arrays and the BER values as a contiguous 2D float matrix (one row per y value).
+    '''
     scanData = {
         'scanType': scanRows[0][0],
-        'x':[],
-        'y':[],
-        'values':[]
+        'x':None,
+        'y':None,
+        'values':None
         }
         
     if scanData['scanType'] not in ['1d bathtub', '2d statistical']:
         logging.error('Uknnown scan type: ' + scanData['scanType'])
         raise Exception('Uknnown scan type: ' + scanData['scanType'])
         
-    xdata = scanRows[0][1:]
+    xdata = np.array(scanRows[0][1:], dtype=float)
     # Need to normalize, dont know why...
-    divider = abs(float(xdata[0])*2)
+    divider = abs(xdata[0]*2)
     
-    scanData['x'] = [float(x)/divider for x in scanRows[0][1:]]
+    scanData['x'] = xdata / divider
     
-    for r in scanRows[1:]:
-        intr = [float(x) for x in r]
-        scanData['y'].append(intr[0])
-        scanData['values'].append(intr[1:])
+    grid = np.array(scanRows[1:], dtype=float).reshape(len(scanRows)-1, len(xdata)+1)
+    scanData['y'] = np.ascontiguousarray(grid[:, 0])
+    scanData['values'] = np.ascontiguousarray(grid[:, 1:])
        
     return scanData
 
     
-def readCsv(filename):
+def _parseHeaderLine(line):
+    ''' Parses a key,value line of the header block. Numbers are converted to float if possible.
+    '''
+    row = next(csv.reader([line.decode('utf-8', 'replace')]))
+    if len(row) < 2:
+        return row[0], ''
+    # Try to convert numbers if ots possible
+    try:
+        val = float(row[1])
+    except ValueError:
+        val = row[1]
+    return row[0], val
+
+
+def _firstField(line):
+    return line.split(b',', 1)[0].strip()
+
+
+def _streamCsv(filename, headers):
+    ''' The single pass parser of the scan csv files.
+    
+    The file is memory mapped and read line by line. The header fields are stored to the headers
+    dict, the scan type, the normalized x axis and the number of grid rows are stored to
+    headers['scanData'] before the first grid row is yielded. The grid rows are yielded as float
+    arrays (y value followed by the BER values). Header fields after 'Scan End' are stored too.
+    '''
+    if os.path.getsize(filename) == 0:
+        raise Exception('Empty scan file: ' + filename)
+        
+    with open(filename, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for row in _streamScan(mm, headers):
+                yield row
+        finally:
+            mm.close()
+
+
+def _streamScan(mm, headers):
+    ''' The single pass parser of a scan csv in a (file or anonymous) mmap. See _streamCsv.
+    '''
+    for line in iter(mm.readline, b''):
+        if not line.strip() or _firstField(line) == b'Scan End':
+            continue
+        if _firstField(line) != b'Scan Start':
+            key, val = _parseHeaderLine(line)
+            headers[key] = val
+            continue
+            
+        # The first row of the grid is the x axis.
+        axis = mm.readline().decode('utf-8', 'replace').strip().split(',')
+        scanData = _parsescanRows([axis])
+        
+        # Count the grid rows (without copying them) to be able to preallocate buffers.
+        gridStart = mm.tell()
+        gridEnd = mm.find(b'Scan End', gridStart)
+        if gridEnd < 0:
+            gridEnd = len(mm)
+        rows = 0
+        pos = gridStart
+        while pos < gridEnd:
+            nl = mm.find(b'\n', pos, gridEnd)
+            if nl < 0:
+                nl = gridEnd
+            if mm[pos:nl].strip():
+                rows += 1
+            pos = nl + 1
+        scanData['rows'] = rows
+        headers['scanData'] = scanData
+        
+        while mm.tell() < gridEnd:
+            line = mm.readline()
+            if line.strip():
+                yield np.fromstring(line, dtype=float, sep=',')
+
+
+def iterScanRows(filename, headers=None):
+    ''' Generator mode of the streaming reader: yields the (y, values) rows of the scan grid.
+    
+    Use it when only running reductions are needed: only one row is held in memory at a time.
+    The header fields (and the scanData without the grid) are stored to the headers dict if given.
+    '''
+    if headers is None:
+        headers = {}
+    for row in _streamCsv(filename, headers):
+        yield row[0], row[1:]
+
+
+def readCsvMmap(filename):
+    ''' Streaming, memory mapped reader of the scan csv files.
+    
+    The header block and the grid are parsed in one pass and the grid is written directly into a
+    preallocated float matrix, so no intermediate list of strings is built.
+    '''
     ret = {}
-    scanRows = []
-    storeScanRows = False
-    
-    with open(filename) as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            if row[0] == 'Scan Start':
-                storeScanRows = True
+    return _collectScan(_streamCsv(filename, ret), ret, filename)
+
+
+def _collectScan(rows, ret, source):
+    ''' Fills the grid rows of _streamScan into preallocated arrays. Returns ret (the headers) with
+    the complete scanData.
+    '''
+    y = None
+    values = None
+    i = 0
+    for row in rows:
+        if values is None:
+            y = np.empty(ret['scanData']['rows'])
+            values = np.empty((ret['scanData']['rows'], len(ret['scanData']['x'])))
+        if len(row) != values.shape[1] + 1:
+            raise Exception('Malformed scan row {} in {}'.format(i, source))
+        y[i] = row[0]
+        values[i] = row[1:]
+        i += 1
+        
+    if 'scanData' in ret:
+        scanData = ret['scanData']
+        del scanData['rows']
+        if values is None:
+            y = np.empty(0)
+            values = np.empty((0, len(scanData['x'])))
+        scanData['y'] = y
+        scanData['values'] = values
+    return ret
+
+
+def parseScanText(text, source='<console>'):
+    ''' Parses a scan csv received as text (eg. over the Vivado console, see run_scan_stream in
+    sourceme.tcl) to the structure of readCsv, without touching the disk.
+    '''
+    data = text.encode('utf-8')
+    if not data.strip():
+        raise Exception('Empty scan: ' + source)
+    mm = mmap.mmap(-1, len(data))
+    try:
+        mm.write(data)
+        mm.seek(0)
+        ret = {}
+        return _collectScan(_streamScan(mm, ret), ret, source)
+    finally:
+        mm.close()
+
+
+def scanBlocks(output):
+    ''' Returns the (scan name, scan csv text) pairs of the scan_data blocks of a console output.
+    (See run_scan_stream in sourceme.tcl)
+    '''
+    return re.findall(r'scan_data_begin\t([^\r\n]*)\r?\n(.*?)scan_data_end', output, re.S)
+
+    
+# Binary cache of the parsed scan files. (See ScanCache)
+scanCacheDir = os.path.join('runs', '.cache')
+scanCacheMaxBytes = 256 * 1024 * 1024
+# The eviction removes entries until the cache shrinks to this fraction of its maximum size.
+scanCacheLowWater = 0.9
+
+
+class ScanCache():
+    ''' Binary cache of the parsed scan files.
+    
+    Each entry consists of a .npy file holding the BER matrix (memory mapped on load) and a .json
+    file holding the header fields, the axes and the size and mtime of the source csv. An entry is
+    valid only while the size and the mtime of the csv are unchanged. The mtime of the .json file
+    is the last access time of the entry: the least recently used entries are evicted when the
+    cache grows bigger than maxBytes (down to scanCacheLowWater of it).
+    The size of the cache is counted by the first eviction, then it is kept as a running total
+    (by this process), so the directory is listed only when the cache is full.
+    '''
+    def __init__(self, directory=scanCacheDir, maxBytes=scanCacheMaxBytes):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.totalBytes = None
+        
+        
+    def _paths(self, filename):
+        key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.npy'
+        
+        
+    @staticmethod
+    def _size(metaPath, gridPath):
+        try:
+            return os.path.getsize(metaPath) + os.path.getsize(gridPath)
+        except OSError:
+            return 0
+        
+        
+    def get(self, filename):
+        ''' Returns the cached scanStructure of the given csv or None if there is no valid entry.
+        '''
+        metaPath, gridPath = self._paths(filename)
+        try:
+            with open(metaPath) as f:
+                meta = json.load(f)
+            stat = os.stat(filename)
+            if meta['size'] != stat.st_size or meta['mtime'] != stat.st_mtime:
+                return None
+            values = np.load(gridPath, mmap_mode='r')
+            # Mark as recently used.
+            os.utime(metaPath, None)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+        
+        ret = meta['headers']
+        ret['scanData'] = {
+            'scanType': meta['scanType'],
+            'x': np.array(meta['x']),
+            'y': np.array(meta['y']),
+            'values': values
+            }
+        return ret
+        
+        
+    def put(self, filename, scanStructure):
+        ''' Stores the scanStructure of the given csv and evicts the old entries if needed.
+        '''
+        if 'scanData' not in scanStructure:
+            return
+        # The workers of the batch analyzer create it concurrently.
+        os.makedirs(self.directory, exist_ok=True)
+        
+        scanData = scanStructure['scanData']
+        stat = os.stat(filename)
+        meta = {
+            'source': os.path.abspath(filename),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'headers': dict((k, v) for k, v in scanStructure.items() if k != 'scanData'),
+            'scanType': scanData['scanType'],
+            'x': [float(x) for x in scanData['x']],
+            'y': [float(y) for y in scanData['y']],
+            }
+        
+        metaPath, gridPath = self._paths(filename)
+        oldBytes = self._size(metaPath, gridPath)
+        # Write to temporary files first, so a concurrent reader never sees a half written entry.
+        tmpSuffix = '.{}.tmp'.format(uuid.uuid4().hex)
+        with open(gridPath + tmpSuffix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(scanData['values'], dtype=float))
+        os.replace(gridPath + tmpSuffix, gridPath)
+        with open(metaPath + tmpSuffix, 'w') as f:
+            json.dump(meta, f)
+        os.replace(metaPath + tmpSuffix, metaPath)
+        
+        if self.totalBytes is None:
+            # Counted by an eviction which removes nothing.
+            self.evict(float('inf'))
+        else:
+            self.totalBytes += self._size(metaPath, gridPath) - oldBytes
+        if self.totalBytes > self.maxBytes:
+            self.evict(int(self.maxBytes * scanCacheLowWater))
+        
+        
+    def evict(self, maxBytes=None):
+        ''' Removes the least recently used entries until the size of the cache is under maxBytes.
+        '''
+        if maxBytes is None:
+            maxBytes = self.maxBytes
+        entries = []
+        totalBytes = 0
+        for f in os.listdir(self.directory):
+            if not f.endswith('.json'):
                 continue
-            elif row[0] == 'Scan End':
-                storeScanRows = False
-                ret['scanData'] = _parsescanRows(scanRows)
+            metaPath = os.path.join(self.directory, f)
+            gridPath = metaPath[:-len('.json')] + '.npy'
+            try:
+                size = os.path.getsize(metaPath) + os.path.getsize(gridPath)
+                entries.append((os.path.getmtime(metaPath), size, metaPath, gridPath))
+            except OSError:
                 continue
-            elif storeScanRows:
-                scanRows.append(row)
+            totalBytes += size
+            
+        for _, size, metaPath, gridPath in sorted(entries):
+            if totalBytes <= maxBytes:
+                break
+            try:
+                os.remove(metaPath)
+                os.remove(gridPath)
+            except OSError:
+                # Still mapped by somebody (Windows), try next time.
+                logging.debug('Cannot evict cache entry: ' + gridPath)
                 continue
-            else:
-                # Try to convert numbers if ots possible
-                try:
-                    val = float(row[1])
-                except ValueError:
-                    val = row[1]
-                ret[row[0]] = val
-    return ret
+            totalBytes -= size
+        self.totalBytes = totalBytes
+        
+        
+    def clear(self):
+        self.evict(0)
+        
+        
+scanCache = ScanCache()
+
+    
+# The last scans received over the console (by their file name), readCsv serves them from memory.
+recentScans = collections.OrderedDict()
+recentScansMax = 64
+recentScansLock = threading.Lock()
+
+
+def rememberScan(filename, scanStructure):
+    with recentScansLock:
+        recentScans[filename] = scanStructure
+        recentScans.move_to_end(filename)
+        while len(recentScans) > recentScansMax:
+            recentScans.popitem(last=False)
+
+
+def forgetScan(filename):
+    with recentScansLock:
+        recentScans.pop(filename, None)
+
+
+def readCsvHeader(filename):
+    ''' Reads only the header block of a scan csv file (up to 'Scan Start'). Returns the header
+    fields (the fields after 'Scan End' are not read).
+    '''
+    headers = {}
+    with open(filename, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if _firstField(line) == b'Scan Start':
+                break
+            key, val = _parseHeaderLine(line)
+            headers[key] = val
+    return headers
+
+
+class LazyScan(dict):
+    ''' The header fields of a scan file (see readCsvHeader). The grid is read (by readCsv) on the
+    first access of scanStructure['scanData'].
+    '''
+    def __init__(self, filename, useCache=True):
+        dict.__init__(self, readCsvHeader(filename))
+        self.filename = filename
+        self.useCache = useCache
+        
+        
+    def __missing__(self, key):
+        if key != 'scanData':
+            raise KeyError(key)
+        self.update(readCsv(self.filename, self.useCache))
+        return dict.__getitem__(self, 'scanData')
+
+
+    def get(self, key, default=None):
+        ''' Same as dict.get, but reads the grid on the first get('scanData') too.
+        '''
+        if key == 'scanData' or key in self:
+            return self[key]
+        return default
+
+
+def readCsv(filename, useCache=True, lazy=False):
+    ''' Reads a scan csv file. Returns the header fields and the parsed grid under 'scanData'.
+    
+    The scans received over the console are served from memory (see recentScans), even if their
+    csv file has not been written (yet). The parsed result is stored in the binary scanCache (if
+    it is enabled), so a repeated read of an unchanged file is served from the cache without
+    parsing.
+    With lazy only the header block is read, the grid is read on its first access (see LazyScan).
+    '''
+    with tracer.span('readCsv', 'analysis'):
+        with recentScansLock:
+            ret = recentScans.get(filename)
+        if ret is not None:
+            return ret
+        if lazy:
+            return LazyScan(filename, useCache)
+        if not useCache or scanCache is None:
+            return readCsvMmap(filename)
+            
+        ret = scanCache.get(filename)
+        if ret is None:
+            ret = readCsvMmap(filename)
+            try:
+                scanCache.put(filename, ret)
+            except (IOError, OSError) as e:
+                logging.warning('Cannot cache {}: {}'.format(filename, e))
+        return ret
     
 
 def _testEye(scanData, xLimit = 0.45, xValLimit = 0.005):
@@ -223,27 +1007,15 @@ def _testEye(scanData, xLimit = 0.45, xValLimit = 0.005):
     definetly not an eye.
     '''
     
-    # print('x: ' + str(scanData['x']))
-    # print('y: ' + str(scanData['y']))
-    # print('values: ' + str(scanData['values']))
-    
-    # Get the indexes of the 'edge'
+    # Mask of the 'edge' columns.
     # Edge means where abs(x) offset is big, bigger than 0.45.
-    edgeIndexes=[i for i,x in enumerate(scanData['x']) if abs(x) > xLimit]
-    if len(edgeIndexes) < 2:
+    edgeMask = np.abs(scanData['x']) > xLimit
+    if np.count_nonzero(edgeMask) < 2:
         logging.warning('Too few edge indexes')
         return False
         
-    # print('edgeIndexes: ' + str(edgeIndexes))
-    
-    # edgeValues contains BER values of the edge positions.
-    edgeValues = []
-    for v in scanData['values']:
-        edgeValues.append([v[i] for i in edgeIndexes])
-    
-    # print('edgeValues: ' + str(edgeValues))
     # A valid eye must contains high BER values at the edges:
-    globalMinimum = min([min(ev) for ev in edgeValues])
+    globalMinimum = scanData['values'][:, edgeMask].min()
     
     if globalMinimum < xValLimit:
         logging.info('globalMinimum ({}) is less than xValLimit ({})  -> NOT a valid eye.'.format(globalMinimum, xValLimit))
@@ -260,221 +1032,1725 @@ def _getArea(scanStructure, xLimit = 0.2):
     '''
     
     scanData = scanStructure['scanData']
-    # Get the indexes of the 'center'
-    # Center means where abs(x) offset is small, less than 0.1.
-    centerIndexes=[i for i,x in enumerate(scanData['x']) if abs(x) < xLimit]
-    if len(centerIndexes) < 2:
+    # Mask of the 'center' columns.
+    # Center means where abs(x) offset is small, less than 0.2.
+    centerMask = np.abs(scanData['x']) < xLimit
+    if np.count_nonzero(centerMask) < 2:
         logging.warning('Too few center indexes')
         return False
     
-    # centerValues contains BER values of the center positions.
-    centerValues = []
-    for v in scanData['values']:
-        centerValues.append([v[i] for i in centerIndexes])
-    
-    # Get the avg center value:
-    centerAvg = [float(sum(cv))/float(len(cv)) for cv in centerValues]
-    centerAvg = float(sum(centerAvg))/float(len(centerAvg))
+    # Get the avg center value (average of the per-row averages):
+    centerAvg = float(scanData['values'][:, centerMask].mean(axis=1).mean())
     
     return centerAvg * scanStructure['Horizontal Increment']
 
 
 def getOpenArea(scanStructure):
-    if _testEye(scanStructure['scanData']):
-        if scanStructure['Open Area'] < 1.0:
-            # if the 'offitial open area' is 0 try to improove:
-            return _getArea(scanStructure)
+    with tracer.span('getOpenArea', 'analysis'):
+        if _testEye(scanStructure['scanData']):
+            if scanStructure['Open Area'] < 1.0:
+                # if the 'offitial open area' is 0 try to improove:
+                return _getArea(scanStructure)
+            else:
+                return scanStructure['Open Area']
         else:
-            return scanStructure['Open Area']
-    else:
-        return 0.0
+            return 0.0
     
     
-def independent_finder(vivadoTX, vivadoRX, txSio):
-    ''' Runs the optimizer algorithm.
+def openAreaBound(scanStructure, xLimit=0.45, xValLimit=0.005):
+    ''' Returns an upper bound of the open area (see getOpenArea) of the complete scan from the
+    partial result of a running scan (the columns scanned so far).
+    
+    If an edge column is clean, the scan cannot be a valid eye (see _testEye), so the bound is 0.
+    Otherwise the opening of an eye is not increasing away from its center, so an unscanned column
+    is bounded by the scanned columns between it and the center (on the same side), or by the full
+    column if there is none. Returns None if the bound is unknown (too few columns).
+    The unscanned columns are placed on the lattice of the first column, which is the edge of the
+    scan (the scans start at their edge, and _parsescanRows normalizes x by the first column).
     '''
-    TXDIFFSWING_values = [
-        "{269 mV (0000)}" ,
-        "{336 mV (0001)}" ,
-        "{407 mV (0010)}" ,
-        "{474 mV (0011)}" ,
-        "{543 mV (0100)}" ,
-        "{609 mV (0101)}" ,
-        "{677 mV (0110)}" ,
-        "{741 mV (0111)}" ,
-        "{807 mV (1000)}" ,
-        "{866 mV (1001)}" ,
-        "{924 mV (1010)}" ,
-        "{973 mV (1011)}" ,
-        "{1018 mV (1100)}",
-        "{1056 mV (1101)}",
-        "{1092 mV (1110)}",
-        "{1119 mV (1111)}"
-    ]
-    
-    TXPRE_values = [
-        "{0.00 dB (00000)}",
-        "{0.22 dB (00001)}",
-        "{0.45 dB (00010)}",
-        "{0.68 dB (00011)}",
-        "{0.92 dB (00100)}",
-        "{1.16 dB (00101)}",
-        "{1.41 dB (00110)}",
-        "{1.67 dB (00111)}",
-        "{1.94 dB (01000)}",
-        "{2.21 dB (01001)}",
-        "{2.50 dB (01010)}",
-        "{2.79 dB (01011)}",
-        "{3.10 dB (01100)}",
-        "{3.41 dB (01101)}",
-        "{3.74 dB (01110)}",
-        "{4.08 dB (01111)}",
-        "{4.44 dB (10000)}",
-        "{4.81 dB (10001)}",
-        "{5.19 dB (10010)}",
-        "{5.60 dB (10011)}",
-        "{6.02 dB (10100)}",
-        "{6.02 dB (10101)}",
-        "{6.02 dB (10110)}",
-        "{6.02 dB (10111)}",
-        "{6.02 dB (11000)}",
-        "{6.02 dB (11001)}",
-        "{6.02 dB (11010)}",
-        "{6.02 dB (11011)}",
-        "{6.02 dB (11100)}",
-        "{6.02 dB (11101)}",
-        "{6.02 dB (11110)}",
-        "{6.02 dB (11111)}",
-    ]
-    
-    TXPOST_values = [
-        "{0.00 dB (00000)}", 
-        "{0.22 dB (00001)}", 
-        "{0.45 dB (00010)}", 
-        "{0.68 dB (00011)}", 
-        "{0.92 dB (00100)}", 
-        "{1.16 dB (00101)}", 
-        "{1.41 dB (00110)}", 
-        "{1.67 dB (00111)}", 
-        "{1.94 dB (01000)}", 
-        "{2.21 dB (01001)}", 
-        "{2.50 dB (01010)}", 
-        "{2.79 dB (01011)}", 
-        "{3.10 dB (01100)}", 
-        "{3.41 dB (01101)}", 
-        "{3.74 dB (01110)}", 
-        "{4.08 dB (01111)}", 
-        "{4.44 dB (10000)}", 
-        "{4.81 dB (10001)}", 
-        "{5.19 dB (10010)}", 
-        "{5.60 dB (10011)}", 
-        "{6.02 dB (10100)}", 
-        "{6.47 dB (10101)}", 
-        "{6.94 dB (10110)}", 
-        "{7.43 dB (10111)}", 
-        "{7.96 dB (11000)}", 
-        "{8.52 dB (11001)}", 
-        "{9.12 dB (11010)}", 
-        "{9.76 dB (11011)}", 
-        "{10.46 dB (11100)}",
-        "{11.21 dB (11101)}",
-        "{12.04 dB (11110)}",
-        "{12.96 dB (11111)}",
-    ]
-    
-    
-    RXTERM_values = [
-        "{100 mV}",
-        "{200 mV}",
-        "{250 mV}",
-        "{300 mV}",
-        "{350 mV}",
-        "{400 mV}",
-        "{500 mV}",
-        "{550 mV}",
-        "{600 mV}",
-        "{700 mV}",
-        "{800 mV}",
-        "{850 mV}",
-        "{900 mV}",
-        "{950 mV}",
-        "{1000 mV}",
-        "{1100 mV}",
-    ]
+    scanData = scanStructure['scanData']
+    x = scanData['x']
+    values = scanData['values']
+    edgeMask = np.abs(x) > xLimit
+    if np.count_nonzero(edgeMask) and values[:, edgeMask].min() < xValLimit:
+        return 0.0
+    if len(x) < 2:
+        return None
     
-    globalIteration = 1
-    globalParameterSpace = {}
-    globalParameterSpace["TXDIFFSWING"] = TXDIFFSWING_values
-    # globalParameterSpace["TXPRE"] = TXPRE_values
-    # globalParameterSpace["TXPOST"] = TXPOST_values
+    step = np.diff(np.sort(x)).min()
+    if step <= 0:
+        return None
+    openCells = (values < scanStructure['Dwell BER']).sum(axis=0)
+    lattice = x[0] + step * np.arange(np.ceil((-0.5 - x[0]) / step - 1e-6), np.floor((0.5 - x[0]) / step + 1e-6) + 1)
+    bound = int(openCells.sum())
+    for xu in lattice:
+        if np.abs(x - xu).min() < step / 2:
+            continue
+        inner = (np.sign(x) == np.sign(xu)) & (np.abs(x) <= np.abs(xu))
+        bound += int(openCells[inner].min()) if np.count_nonzero(inner) else values.shape[0]
     
-    if not os.path.exists("runs"):
-        os.makedirs("runs")
+    cellArea = scanStructure['Horizontal Increment']
+    if values.shape[0] > 1:
+        cellArea *= scanStructure.get('Vertical Increment', 1)
+    # A closed eye is scored by _getArea: the average BER (at most 0.5) of its center.
+    return max(bound * cellArea, 0.5 * scanStructure['Horizontal Increment'])
+    
+    
+# Eye metrics (see eyeMetrics):
+#  - the BER levels of the contours (from the shallowest to the deepest),
+#  - the eye mask: a diamond of width (UI) and height (vertical codes) centered in the eye,
+#  - the BER of the extrapolated bathtub opening.
+defaultContourBers = [1e-3, 1e-4, 1e-5]
+defaultEyeMask = {'width': 0.25, 'height': 40.0}
+extrapolationBer = 1e-12
 
-    for i in range(globalIteration):
-        for pName, pValues in globalParameterSpace.items():
-            openAreas = []
-            maxArea   = 0
-            txSioGt = '[get_hw_sio_gts {}]'.format(txSio)
-            bestValue = vivadoTX.get_property(pName, txSioGt)
-            
-            for pValue in pValues:
-                print("Create scan ({} {})".format(pName, pValue))
-                vivadoTX.set_property(pName, pValue, txSioGt)
-                vivadoTX.do('commit_hw_sio ' + txSioGt)
-                
-                checkValue = vivadoTX.get_property(pName, txSioGt)
-                if checkValue not in pValue: # Readback does not contains brackets {}
-                    print("ERROR: Something went wrong. Cannot set value {}  {} ".format(checkValue, pValue))
-                    
-                # set_property PORT.GTRXRESET 0 [get_hw_sio_gts  {localhost:3121/xilinx_tcf/Digilent/210203A2513BA/0_1_0/IBERT/Quad_113/MGT_X1Y0}]
-                # commit_hw_sio  [get_hw_sio_gts  {localhost:3121/xilinx_tcf/Digilent/210203A2513BA/0_1_0/IBERT/Quad_113/MGT_X1Y0}]
 
+def qFactor(ber):
+    ''' Returns the Q factor of BER values (the inverse of the Gaussian tail probability), by the
+    rational approximation of Abramowitz and Stegun (26.2.23, error < 4.5e-4).
+    '''
+    p = np.clip(ber, 1e-300, 0.5)
+    t = np.sqrt(-2.0 * np.log(p))
+    return t - (2.515517 + 0.802853 * t + 0.010328 * t * t) / (1.0 + 1.432788 * t + 0.189269 * t * t + 0.001308 * t ** 3)
 
-                fname = "{}{}{}".format(i, pName, pValue)
-                fname = re.sub('\\W', '_', fname)
-                fname = "runs/" + fname + '.csv'
-                
-                hincr = 8
-                vincr = 8
-                # scanType = "1d_bathtub"
-                scanType = "2d_full_eye"
-                linkName = "*"
-                cmd = 'run_scan "{}" {} {} {} {}'.format(fname, hincr, vincr, scanType, linkName)
-                vivadoRX.do(cmd, errmsgs = ['ERROR: '])
-                
-                scanStructure = readCsv(fname)
-                openArea = getOpenArea(scanStructure)
-                if openArea is None:
-                    logging.error('openArea is None after reading file: ' + fname)
-                            
-                print('OpenArea: {}'.format(openArea))
-                openAreas.append(openArea)
-                
-                if openArea > maxArea:
-                    maxArea = openArea
-                    bestValue = pValue
-                
-            print("pName:  {}    bestParam:  {}".format(pName, bestValue))
-            
-            vivadoTX.set_property(pName, bestValue, txSioGt)
-            vivadoTX.do('commit_hw_sio ' + txSioGt)
 
+def _runFromCenter(isOpen, center, axis):
+    ''' Returns the mask of the cells of the open run through the center index along an axis.
+    '''
+    isOpen = np.moveaxis(isOpen, axis, -1)
+    right = np.logical_and.accumulate(isOpen[..., center:], axis=-1)
+    left = np.logical_and.accumulate(isOpen[..., center::-1], axis=-1)[..., :0:-1]
+    return np.moveaxis(np.concatenate([left, right], axis=-1), -1, axis)
 
-def interactiveVivadoConsole(vivadoTX, vivadoRX):
-    ''' gives full control for user over the two (TX and RX) Vivado consoles.
+
+def _fitTail(x, q, weights):
+    ''' Least squares line q = a + b * x of every row of q (over the weighted cells). Returns a, b.
     '''
+    sw = weights.sum(-1)
+    sx = (weights * x).sum(-1)
+    sq = (weights * q).sum(-1)
+    sxx = (weights * x * x).sum(-1)
+    sxq = (weights * x * q).sum(-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b = (sw * sxq - sx * sq) / (sw * sxx - sx * sx)
+        a = (sq - b * sx) / sw
+    return a, b
+
+
+def bathtubOpening(x, bers, targetBer=None, maxFitBer=0.1):
+    ''' Extrapolates the horizontal opening (UI) of bathtub curves to targetBer.
     
-    print('Switching to VivadoRX')
-    vivado = vivadoRX
-    vivado.do('', vivadoPrompt, True)
-    
-    while True:
-        cmd = raw_input()
-        if cmd.startswith('!'):
-            # Cleye command
-            cmd = cmd[1:].lower()
-            if cmd == 'rx':
+    bers is a matrix of bathtub curves (one per row) over the offsets x. The Q factor of the tails
+    (BER below maxFitBer, above the floor of the curve) is fitted by a line on both sides of the
+    center, and the lines are extrapolated to the Q factor of targetBer. Returns the openings (NaN
+    where a side has less than two points to fit).
+    '''
+    if targetBer is None:
+        targetBer = extrapolationBer
+    bers = np.atleast_2d(bers)
+    floor = bers.min(axis=-1, keepdims=True)
+    weights = ((bers < maxFitBer) & (bers > floor * 1.01)).astype(float)
+    q = qFactor(bers)
+    target = qFactor(targetBer)
+    center = np.argmin(np.abs(x))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aLeft, bLeft = _fitTail(x[:center], q[:, :center], weights[:, :center])
+        aRight, bRight = _fitTail(x[center + 1:], q[:, center + 1:], weights[:, center + 1:])
+        opening = (target - aRight) / bRight - (target - aLeft) / bLeft
+    return np.maximum(opening, 0.0)
+
+
+def stackScans(scanStructures):
+    ''' Groups the scans by their grid. Returns a list of (indexes, x, y, stacked values) where the
+    values of the scans (of the same grid) are stacked to one 3D array.
+    '''
+    groups = collections.OrderedDict()
+    for index, scanStructure in enumerate(scanStructures):
+        scanData = scanStructure['scanData']
+        key = (scanData['x'].tobytes(), scanData['y'].tobytes())
+        groups.setdefault(key, []).append(index)
+    ret = []
+    for indexes in groups.values():
+        scanData = scanStructures[indexes[0]]['scanData']
+        values = np.stack([scanStructures[i]['scanData']['values'] for i in indexes])
+        ret.append((indexes, scanData['x'], scanData['y'], values))
+    return ret
+
+
+def eyeMetrics(scanStructures, bers=None, mask=None, targetBer=None):
+    ''' Computes the eye metrics of a batch of scans (read by readCsv).
+    
+    The scans of the same grid are stacked and measured at once for every contour BER:
+     - width: horizontal opening (UI) along the center row (NaN if the eye is not valid: its edges
+       are not scanned, so the opening is not bounded),
+     - height: vertical opening (codes) along the center column (NaN for 1D scans),
+     - innerArea: the area (in the units of the Open Area header) of the inner contour: the open
+       cells connected to the center through the open center column and the open rows,
+    and once per scan:
+     - maskMargin: the margin of the eye mask (see defaultEyeMask) at the deepest contour BER, as the
+       relative growth of the mask until it touches a closed cell (negative: the mask is violated,
+       NaN for 1D scans, which have no vertical data for the mask),
+     - bathtubWidth: the opening of the center row extrapolated to targetBer (see bathtubOpening),
+     - centerBer: the average BER of the center (|x| < 0.2 UI),
+     - validEye: the result of _testEye.
+    Returns a dict of the arrays (one row per scan) and 'bers'.
+    '''
+    if bers is None:
+        bers = defaultContourBers
+    if mask is None:
+        mask = defaultEyeMask
+    bers = np.asarray(bers, dtype=float)
+    n = len(scanStructures)
+    ret = {
+        'bers': bers,
+        'width': np.zeros((n, len(bers))),
+        'height': np.zeros((n, len(bers))),
+        'innerArea': np.zeros((n, len(bers))),
+        'maskMargin': np.zeros(n),
+        'bathtubWidth': np.zeros(n),
+        'centerBer': np.zeros(n),
+        'validEye': np.zeros(n, dtype=bool),
+        }
+    
+    for indexes, x, y, values in stackScans(scanStructures):
+        first = scanStructures[indexes[0]]
+        full = values.shape[1] > 1
+        centerCol = np.argmin(np.abs(x))
+        centerRow = np.argmin(np.abs(y))
+        xStep = np.abs(np.diff(x)).min() if len(x) > 1 else 0.0
+        yStep = np.abs(np.diff(y)).min() if full else 0.0
+        cellArea = first['Horizontal Increment'] * (first.get('Vertical Increment', 1) if full else 1)
+        
+        # isOpen: scan, contour, row, column
+        isOpen = values[:, None, :, :] < bers[None, :, None, None]
+        rowRuns = _runFromCenter(isOpen, centerCol, -1)
+        colRuns = _runFromCenter(isOpen[..., centerCol], centerRow, -1)
+        inner = rowRuns & colRuns[..., None]
+        edgeMask = np.abs(x) > 0.45
+        validEye = np.zeros(len(indexes), dtype=bool)
+        if np.count_nonzero(edgeMask) >= 2:
+            validEye = values[:, :, edgeMask].min((-1, -2)) >= 0.005
+        ret['validEye'][indexes] = validEye
+        
+        width = rowRuns[:, :, centerRow, :].sum(-1) * xStep
+        ret['width'][indexes] = np.where(validEye[:, None], width, np.nan)
+        ret['height'][indexes] = colRuns.sum(-1) * yStep if full else np.nan
+        ret['innerArea'][indexes] = inner.sum((-1, -2)) * cellArea
+        
+        if full:
+            maskNorm = np.abs(x)[None, :] / (mask['width'] / 2.0) + np.abs(y)[:, None] / (mask['height'] / 2.0)
+            closed = values >= bers[-1]
+            ret['maskMargin'][indexes] = np.where(closed, maskNorm, np.inf).min((-1, -2)) - 1.0
+        else:
+            ret['maskMargin'][indexes] = np.nan
+        
+        ret['bathtubWidth'][indexes] = bathtubOpening(x, values[:, centerRow, :], targetBer)
+        centerMask = np.abs(x) < 0.2
+        ret['centerBer'][indexes] = values[:, :, centerMask].mean((-1, -2))
+    return ret
+
+
+def rankEyes(metrics):
+    ''' Returns the indexes of the scans of eyeMetrics from the best to the worst.
+    
+    The valid eyes come first, ranked by the deepest contour BER they are open at, then by the inner
+    area of that contour. The closed eyes are ranked by their center BER (lower is better) instead of the
+    average BER of _getArea, so a closing eye does not outrank an improving one.
+    '''
+    innerArea = metrics['innerArea']
+    depth = np.count_nonzero(innerArea > 0, axis=-1)
+    area = innerArea[np.arange(len(depth)), np.maximum(depth - 1, 0)] * (depth > 0)
+    return np.lexsort((metrics['centerBer'], -area, -depth, ~metrics['validEye']))
+
+
+def findScanFiles(directory):
+    ''' Collects the scan csv files of a directory tree (sorted, hidden directories are skipped).
+    '''
+    scanFiles = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for f in sorted(files):
+            if f.lower().endswith('.csv'):
+                scanFiles.append(os.path.join(root, f))
+    return scanFiles
+
+
+def analyzeFile(filename):
+    ''' Parses and scores a single scan file.
+    
+    Returns one row of the summary table as a dict: file, scanType, validEye, openArea, error and
+    all of the header fields of the scan.
+    '''
+    row = {'file': filename}
+    try:
+        scanStructure = readCsv(filename)
+        scanData = scanStructure['scanData']
+        row['scanType'] = scanData['scanType']
+        row['validEye'] = _testEye(scanData)
+        row['openArea'] = getOpenArea(scanStructure)
+        for key, val in scanStructure.items():
+            if key != 'scanData':
+                row[key] = val
+    except Exception as e:
+        logging.warning('Cannot analyze {}: {}'.format(filename, e))
+        row['error'] = str(e)
+    return row
+
+
+summaryColumns = ['file', 'scanType', 'validEye', 'openArea', 'error']
+
+
+# Catalog of the header fields of the scan files. (See ScanCatalog)
+scanCatalogName = 'catalog.sqlite'
+
+
+class ScanCatalog():
+    ''' Searchable SQLite catalog of the header fields of the scan files of a directory tree.
+    
+    update indexes the files of the tree incrementally: only the new and the changed (size or
+    mtime) files are read (header only, see readCsvHeader), the deleted files are dropped. The
+    common fields (SW Version, GT Type, Open Area, dates, increments, dwell) are columns of the
+    scans table, all of the header fields are stored as json too.
+    '''
+    # column -> header field
+    fields = collections.OrderedDict([
+        ('swVersion', 'SW Version'),
+        ('gtType', 'GT Type'),
+        ('scanName', 'Scan Name'),
+        ('started', 'Date and Time Started'),
+        ('ended', 'Date and Time Ended'),
+        ('openArea', 'Open Area'),
+        ('hOpening', 'Horizontal Opening'),
+        ('vOpening', 'Vertical Opening'),
+        ('hincr', 'Horizontal Increment'),
+        ('vincr', 'Vertical Increment'),
+        ('dwellBer', 'Dwell BER'),
+        ('linkSettings', 'Link Settings'),
+        ])
+    
+    def __init__(self, root='runs', path=None):
+        self.root = root
+        self.path = path if path is not None else os.path.join(root, scanCatalogName)
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS scans (
+            path TEXT PRIMARY KEY, size INTEGER, mtime REAL, swVersion TEXT, gtType TEXT, scanName TEXT,
+            started TEXT, ended TEXT, startedTime REAL, openArea REAL, hOpening REAL, vOpening REAL,
+            hincr REAL, vincr REAL, dwellBer REAL, linkSettings TEXT, headers TEXT, error TEXT)''')
+        for column in ['gtType', 'openArea', 'startedTime', 'swVersion']:
+            self.db.execute('CREATE INDEX IF NOT EXISTS scans_{0} ON scans ({0})'.format(column))
+        self.db.commit()
+        
+        
+    @staticmethod
+    def parseTime(text):
+        ''' Converts the date of the scan headers (eg. 2019-Apr-25 13:47:19) to epoch seconds (or None).
+        '''
+        try:
+            return time.mktime(time.strptime(str(text).strip(), '%Y-%b-%d %H:%M:%S'))
+        except ValueError:
+            return None
+        
+        
+    def _record(self, path, stat):
+        try:
+            headers = readCsvHeader(path)
+            error = None
+        except (IOError, OSError, ValueError) as e:
+            logging.warning('Cannot index {}: {}'.format(path, e))
+            headers, error = {}, str(e)
+        values = [headers.get(field) for field in self.fields.values()]
+        return ([path, stat.st_size, stat.st_mtime] + values[:5] + [self.parseTime(headers.get('Date and Time Started'))] +
+            values[5:] + [json.dumps(headers), error])
+        
+        
+    def update(self):
+        ''' Indexes the new and the changed files of the tree and drops the deleted ones.
+        Returns the number of the (re)indexed and the dropped files.
+        '''
+        with tracer.span('catalog update', 'analysis'):
+            indexed = dict((path, (size, mtime)) for path, size, mtime in self.db.execute('SELECT path, size, mtime FROM scans'))
+            records = []
+            present = set()
+            for path in findScanFiles(self.root):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                present.add(path)
+                if indexed.get(path) != (stat.st_size, stat.st_mtime):
+                    records.append(self._record(path, stat))
+            deleted = [(path,) for path in indexed if path not in present]
+            
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO scans VALUES ({})'.format(', '.join(['?'] * 18)), records)
+                self.db.executemany('DELETE FROM scans WHERE path = ?', deleted)
+        logging.info('Scan catalog: {} files indexed, {} dropped'.format(len(records), len(deleted)))
+        return len(records), len(deleted)
+        
+        
+    def query(self, where='1', params=(), orderBy='path', limit=None):
+        ''' Returns the catalog rows (dicts of the columns, without the headers json) matching the
+        SQL condition where (with ? params).
+        '''
+        columns = ['path'] + list(self.fields) + ['startedTime']
+        sql = 'SELECT {} FROM scans WHERE {} ORDER BY {}'.format(', '.join(columns), where, orderBy)
+        if limit is not None:
+            sql += ' LIMIT {:d}'.format(limit)
+        return [dict(zip(columns, row)) for row in self.db.execute(sql, params)]
+        
+        
+    def find(self, gtType=None, swVersion=None, minOpenArea=None, since=None, until=None, limit=None):
+        ''' Returns the scans of the given GT type and SW version with an open area of minOpenArea at
+        least, started between since and until (epoch seconds).
+        '''
+        conditions, params = ['error IS NULL'], []
+        for column, op, value in [('gtType', '=', gtType), ('swVersion', '=', swVersion),
+                ('openArea', '>=', minOpenArea), ('startedTime', '>=', since), ('startedTime', '<', until)]:
+            if value is not None:
+                conditions.append('{} {} ?'.format(column, op))
+                params.append(value)
+        return self.query(' AND '.join(conditions), params, 'startedTime DESC', limit)
+        
+        
+    def close(self):
+        self.db.close()
+
+
+def searchCatalog(args):
+    ''' Updates the catalog of a directory tree and prints the scans matching the filters of the
+    catalog subcommand.
+    '''
+    catalog = ScanCatalog(args.directory)
+    try:
+        catalog.update()
+        if args.where:
+            rows = catalog.query(args.where, orderBy='startedTime DESC', limit=args.limit)
+        else:
+            since = time.time() - args.days * 86400 if args.days is not None else None
+            rows = catalog.find(args.gt_type, args.sw_version, args.min_open_area, since, limit=args.limit)
+    finally:
+        catalog.close()
+    for row in rows:
+        row = dict((key, '' if value is None else value) for key, value in row.items())
+        print('{started:<22} {gtType:<14} {openArea:>9} {path}'.format(**row))
+    print('{} scans'.format(len(rows)))
+    return rows
+
+
+def writeSummary(rows, outFile, extraColumns=[]):
+    ''' Writes the rows of analyzeFile to a csv summary table.
+    The fixed columns come first (followed by the extraColumns), then the union of the header fields
+    of all scans.
+    '''
+    headerFields = set()
+    for row in rows:
+        headerFields.update(row.keys())
+    columns = summaryColumns + extraColumns
+    columns += sorted(headerFields - set(columns))
+    
+    with open(outFile, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, lineterminator='\n')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+
+def addMetrics(rows):
+    ''' Adds the eye metrics (see eyeMetrics) and the rank (see rankEyes) of the scans to the rows of
+    analyzeFile. The metrics of all scans are computed in one batch. Returns the added columns.
+    '''
+    valid = [row for row in rows if 'error' not in row]
+    metrics = eyeMetrics([readCsv(row['file']) for row in valid])
+    columns = []
+    for name in ['width', 'height', 'innerArea']:
+        for i, ber in enumerate(metrics['bers']):
+            column = '{}@{:g}'.format(name, ber)
+            columns.append(column)
+            for row, value in zip(valid, metrics[name][:, i]):
+                row[column] = value
+    for name in ['maskMargin', 'bathtubWidth', 'centerBer']:
+        columns.append(name)
+        for row, value in zip(valid, metrics[name]):
+            row[name] = value
+    columns.append('rank')
+    for rank, index in enumerate(rankEyes(metrics)):
+        valid[index]['rank'] = rank + 1
+    return columns
+
+
+def analyzeDirectory(directory, outFile=None, processes=None, metrics=False):
+    ''' Analyzes all scan files of a directory tree using a process pool.
+    
+    Parsing and scoring of the files are spread across processes (default: one per CPU core).
+    With metrics the eye metrics and the rank of the scans are added (see addMetrics).
+    Returns the rows of the summary table (sorted by file name) and writes them to outFile if it is
+    given.
+    '''
+    files = findScanFiles(directory)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(files)))
+    logging.info('Analyzing {} scan files using {} processes'.format(len(files), processes))
+    
+    startTime = time.time()
+    if processes == 1:
+        rows = [analyzeFile(f) for f in files]
+    else:
+        # Few big chunks per worker keep the IPC overhead low while still balancing the load.
+        chunksize = max(1, len(files) // (processes * 4))
+        pool = multiprocessing.Pool(processes)
+        try:
+            rows = list(pool.imap_unordered(analyzeFile, files, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - startTime
+    
+    rows.sort(key=lambda row: row['file'])
+    extraColumns = addMetrics(rows) if metrics else []
+    if outFile:
+        writeSummary(rows, outFile, extraColumns)
+    
+    throughput = len(files) / elapsed if elapsed > 0 else float('inf')
+    print('Analyzed {} files in {:.2f} s ({:.1f} files/s)'.format(len(files), elapsed, throughput))
+    return rows
+
+
+# Legal values of the tuned transceiver properties (7 Series GTX).
+TXDIFFSWING_values = [
+    "{269 mV (0000)}" ,
+    "{336 mV (0001)}" ,
+    "{407 mV (0010)}" ,
+    "{474 mV (0011)}" ,
+    "{543 mV (0100)}" ,
+    "{609 mV (0101)}" ,
+    "{677 mV (0110)}" ,
+    "{741 mV (0111)}" ,
+    "{807 mV (1000)}" ,
+    "{866 mV (1001)}" ,
+    "{924 mV (1010)}" ,
+    "{973 mV (1011)}" ,
+    "{1018 mV (1100)}",
+    "{1056 mV (1101)}",
+    "{1092 mV (1110)}",
+    "{1119 mV (1111)}"
+]
+
+TXPRE_values = [
+    "{0.00 dB (00000)}",
+    "{0.22 dB (00001)}",
+    "{0.45 dB (00010)}",
+    "{0.68 dB (00011)}",
+    "{0.92 dB (00100)}",
+    "{1.16 dB (00101)}",
+    "{1.41 dB (00110)}",
+    "{1.67 dB (00111)}",
+    "{1.94 dB (01000)}",
+    "{2.21 dB (01001)}",
+    "{2.50 dB (01010)}",
+    "{2.79 dB (01011)}",
+    "{3.10 dB (01100)}",
+    "{3.41 dB (01101)}",
+    "{3.74 dB (01110)}",
+    "{4.08 dB (01111)}",
+    "{4.44 dB (10000)}",
+    "{4.81 dB (10001)}",
+    "{5.19 dB (10010)}",
+    "{5.60 dB (10011)}",
+    "{6.02 dB (10100)}",
+    "{6.02 dB (10101)}",
+    "{6.02 dB (10110)}",
+    "{6.02 dB (10111)}",
+    "{6.02 dB (11000)}",
+    "{6.02 dB (11001)}",
+    "{6.02 dB (11010)}",
+    "{6.02 dB (11011)}",
+    "{6.02 dB (11100)}",
+    "{6.02 dB (11101)}",
+    "{6.02 dB (11110)}",
+    "{6.02 dB (11111)}",
+]
+
+TXPOST_values = [
+    "{0.00 dB (00000)}", 
+    "{0.22 dB (00001)}", 
+    "{0.45 dB (00010)}", 
+    "{0.68 dB (00011)}", 
+    "{0.92 dB (00100)}", 
+    "{1.16 dB (00101)}", 
+    "{1.41 dB (00110)}", 
+    "{1.67 dB (00111)}", 
+    "{1.94 dB (01000)}", 
+    "{2.21 dB (01001)}", 
+    "{2.50 dB (01010)}", 
+    "{2.79 dB (01011)}", 
+    "{3.10 dB (01100)}", 
+    "{3.41 dB (01101)}", 
+    "{3.74 dB (01110)}", 
+    "{4.08 dB (01111)}", 
+    "{4.44 dB (10000)}", 
+    "{4.81 dB (10001)}", 
+    "{5.19 dB (10010)}", 
+    "{5.60 dB (10011)}", 
+    "{6.02 dB (10100)}", 
+    "{6.47 dB (10101)}", 
+    "{6.94 dB (10110)}", 
+    "{7.43 dB (10111)}", 
+    "{7.96 dB (11000)}", 
+    "{8.52 dB (11001)}", 
+    "{9.12 dB (11010)}", 
+    "{9.76 dB (11011)}", 
+    "{10.46 dB (11100)}",
+    "{11.21 dB (11101)}",
+    "{12.04 dB (11110)}",
+    "{12.96 dB (11111)}",
+]
+
+
+RXTERM_values = [
+    "{100 mV}",
+    "{200 mV}",
+    "{250 mV}",
+    "{300 mV}",
+    "{350 mV}",
+    "{400 mV}",
+    "{500 mV}",
+    "{550 mV}",
+    "{600 mV}",
+    "{700 mV}",
+    "{800 mV}",
+    "{850 mV}",
+    "{900 mV}",
+    "{950 mV}",
+    "{1000 mV}",
+    "{1100 mV}",
+]
+
+# These properties belong to the receiver, they are set on the RX side hw_sio_gt.
+rxProperties = ['RXTERM']
+
+# The legal values of the properties are discovered from the device (list_property_value) and
+# cached per GT type and Vivado version. (See discoverParameterSpace)
+discoverSpaces = True
+parameterSpaceCacheDir = os.path.join('runs', '.cache', 'spaces')
+
+# The built-in tables: used when a property cannot be discovered.
+defaultParameterTables = {
+    'TXDIFFSWING': TXDIFFSWING_values,
+    'TXPRE': TXPRE_values,
+    'TXPOST': TXPOST_values,
+    'RXTERM': RXTERM_values,
+}
+
+
+def physicalValue(value):
+    ''' Returns the physical setting of a property value: without the brackets {} and the binary
+    code, eg. '{6.02 dB (10101)}' -> '6.02 dB'.
+    '''
+    return re.sub(r'\s*\([01]+\)$', '', value.strip().strip('{}').strip())
+
+
+def collapseValues(values):
+    ''' Drops the values which are physically identical to an earlier value of the table (eg. the
+    twelve 6.02 dB codes of TXPRE), keeping the order.
+    '''
+    seen = set()
+    ret = []
+    for value in values:
+        phys = physicalValue(value)
+        if phys not in seen:
+            seen.add(phys)
+            ret.append(value)
+    return ret
+
+
+def _parseTclList(text):
+    ''' Splits a (flat) Tcl list. The items are returned in brackets {}, as in the property tables.
+    '''
+    return ['{' + (a if b == '' else b) + '}' for a, b in re.findall(r'\{([^{}]*)\}|(\S+)', text)]
+
+
+def _parameterSpaceCacheFile(gtType, version):
+    return os.path.join(parameterSpaceCacheDir, re.sub(r'\W', '_', '{}_{}'.format(gtType, version)) + '.json')
+
+
+def discoverParameterSpace(vivado, sio, propNames, useCache=True):
+    ''' Returns an ordered dict of property name -> legal values (collapsed by collapseValues) of a
+    hw_sio_gt.
+    
+    The values are listed by list_property_value, and cached on disk per GT type and Vivado
+    version, so only the first run on a transceiver family pays the discovery. The properties
+    which cannot be listed get the built-in tables (defaultParameterTables).
+    '''
+    sioGt = '[get_hw_sio_gts {}]'.format(sio)
+    gtType, version = vivado.doBatch(['get_property GT_TYPE ' + sioGt, 'version -short'])
+    gtType = gtType.strip() if not gtType.startswith('ERROR: ') else 'unknown'
+    version = version.strip() if not version.startswith('ERROR: ') else 'unknown'
+    cacheFile = _parameterSpaceCacheFile(gtType, version)
+    
+    tables = {}
+    if useCache and os.path.exists(cacheFile):
+        with open(cacheFile) as f:
+            tables = json.load(f)
+    missing = [p for p in propNames if p not in tables]
+    if missing:
+        outputs = vivado.doBatch(['list_property_value {} {}'.format(p, sioGt) for p in missing])
+        discovered = {}
+        for pName, out in zip(missing, outputs):
+            values = [] if out.startswith('ERROR: ') else _parseTclList(out)
+            if values:
+                discovered[pName] = values
+            else:
+                logging.warning('Cannot list the values of {} ({} {}), using the built-in table.'.format(pName, gtType, version))
+        if discovered:
+            tables.update(discovered)
+            if useCache:
+                if not os.path.exists(parameterSpaceCacheDir):
+                    os.makedirs(parameterSpaceCacheDir)
+                tmp = '{}.{}.tmp'.format(cacheFile, uuid.uuid4().hex)
+                with open(tmp, 'w') as f:
+                    json.dump(tables, f, indent=1)
+                os.replace(tmp, cacheFile)
+    
+    space = collections.OrderedDict()
+    for pName in propNames:
+        values = tables.get(pName) or defaultParameterTables[pName]
+        space[pName] = collapseValues(values)
+        if len(space[pName]) < len(values):
+            logging.info('{}: {} of the {} values are physically different'.format(pName, len(space[pName]), len(values)))
+    return space
+
+
+def linkParameterSpace(vivadoTX, vivadoRX, txSio, rxSio, propNames):
+    ''' Returns the parameter space (ordered dict of property name -> legal values) of the given TX
+    and RX (see rxProperties) properties of a link. The values are discovered from the devices if
+    discoverSpaces is set, the built-in tables are used otherwise (both collapsed).
+    '''
+    if not discoverSpaces:
+        return collections.OrderedDict((p, collapseValues(defaultParameterTables[p])) for p in propNames)
+    space = collections.OrderedDict()
+    txNames = [p for p in propNames if p not in rxProperties]
+    rxNames = [p for p in propNames if p in rxProperties]
+    if txNames:
+        space.update(discoverParameterSpace(vivadoTX, txSio, txNames))
+    if rxNames:
+        space.update(discoverParameterSpace(vivadoRX, rxSio or txSio, rxNames))
+    return collections.OrderedDict((p, space[p]) for p in propNames)
+
+
+# Persistent store of the scan results. (See ScanResultStore)
+scanResultStorePath = os.path.join('runs', 'results.sqlite')
+
+
+class ScanResultStore():
+    ''' SQLite store of the measured scan results.
+    
+    A result is keyed by the TX and RX SIO, the full vector of the tuned TX/RX properties, the
+    scan type, the increments and the dwell. It records the open area, the validity of the eye and
+    the path of the scan csv. lookup returns only results younger than ttl seconds, so the finders
+    can skip the hardware scans of recently measured settings.
+    The store can be used from any thread (eg. by async_independent_finder).
+    '''
+    def __init__(self, path=scanResultStorePath, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute('''CREATE TABLE IF NOT EXISTS results (
+            txSio TEXT, rxSio TEXT, properties TEXT, scanType TEXT, hincr INTEGER, vincr INTEGER,
+            dwell TEXT, openArea REAL, validEye INTEGER, csvPath TEXT, timestamp REAL)''')
+        self.db.execute('''CREATE INDEX IF NOT EXISTS resultKeys ON results
+            (txSio, rxSio, properties, scanType, hincr, vincr, dwell, timestamp)''')
+        self.db.commit()
+        
+        
+    @staticmethod
+    def _key(txSio, rxSio, properties, scanType, hincr, vincr, dwell):
+        return (str(txSio), str(rxSio), json.dumps(sorted(properties.items())), scanType,
+            int(hincr), int(vincr), '' if dwell is None else str(dwell))
+        
+        
+    def lookup(self, txSio, rxSio, properties, scanType, hincr, vincr, dwell=None, ttl=None):
+        ''' Returns the latest fresh result (dict of openArea, validEye, csvPath, timestamp) or None.
+        '''
+        if ttl is None:
+            ttl = self.ttl
+        with self.lock:
+            row = self.db.execute('''SELECT openArea, validEye, csvPath, timestamp FROM results
+                WHERE txSio=? AND rxSio=? AND properties=? AND scanType=? AND hincr=? AND vincr=? AND dwell=?
+                AND timestamp>=? ORDER BY timestamp DESC LIMIT 1''',
+                self._key(txSio, rxSio, properties, scanType, hincr, vincr, dwell) + (time.time() - ttl,)).fetchone()
+        if row is None:
+            return None
+        return {'openArea': row[0], 'validEye': bool(row[1]), 'csvPath': row[2], 'timestamp': row[3]}
+        
+        
+    def record(self, txSio, rxSio, properties, scanType, hincr, vincr, dwell, openArea, validEye, csvPath):
+        with self.lock:
+            self.db.execute('INSERT INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                self._key(txSio, rxSio, properties, scanType, hincr, vincr, dwell) +
+                (float(openArea), int(bool(validEye)), csvPath, time.time()))
+            self.db.commit()
+        
+        
+    def close(self):
+        self.db.close()
+
+
+# Scan stages of independent_finder. Every candidate value is scanned in the first stage, only the
+# best 'keep' candidates survive to the next stage. The last stage should be the full resolution
+# scan: the final pick is reported from it.
+#  - scanType: '1d_bathtub' or '2d_full_eye'
+#  - hincr, vincr: horizontal and vertical increments of the scan
+#  - keep: number of the best candidates scanned in the next stage
+#  - dwell: dwell BER of the scans (eg. '1e-7', default: the default of Vivado, 1e-5)
+defaultScanStages = [
+    {'scanType': '2d_full_eye', 'hincr': 8, 'vincr': 8},
+]
+
+coarseToFineScanStages = [
+    {'scanType': '1d_bathtub', 'hincr': 8, 'vincr': 8, 'keep': 4},
+    {'scanType': '2d_full_eye', 'hincr': 8, 'vincr': 8},
+]
+
+# Dwell BER levels of the progressive dwell scanning. (See progressiveDwell)
+defaultDwellSchedule = ['1e-7', '1e-8', '1e-9']
+
+
+# Transfer of the scan results from Vivado:
+#  - 'file': the scan is written to its csv file by Vivado and read back by readCsv.
+#  - 'console': the scan csv is printed to the console (see run_scan_stream in sourceme.tcl) and
+#    parsed in memory. The csv files are written by the scanArchiver in background if archiveScans.
+scanTransfer = 'file'
+archiveScans = True
+
+# Poll period (seconds) of the monitored scans. (See monitoredScan)
+scanPollInterval = 1.0
+
+
+class ScanArchiver():
+    ''' Background writer of the scan csv files received over the console.
+    
+    The files are written by a daemon thread (started on the first write) in the order of the
+    writes, so archiving is not on the critical path of the tuning. flush waits for the pending
+    writes (it is called at exit as well).
+    '''
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        
+        
+    def write(self, filename, text):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='ScanArchiver', daemon=True)
+                self.thread.start()
+        self.queue.put((filename, text))
+        
+        
+    def _run(self):
+        while True:
+            filename, text = self.queue.get()
+            try:
+                dirname = os.path.dirname(filename)
+                if dirname and not os.path.exists(dirname):
+                    os.makedirs(dirname)
+                # The text keeps the line endings of Vivado.
+                with open(filename, 'w', newline='') as f:
+                    f.write(text)
+            except (IOError, OSError) as e:
+                logging.error('Cannot archive scan {}: {}'.format(filename, e))
+            finally:
+                self.queue.task_done()
+                
+                
+    def flush(self):
+        self.queue.join()
+
+
+scanArchiver = ScanArchiver()
+atexit.register(scanArchiver.flush)
+
+
+def receiveScan(fname, text):
+    ''' Parses a scan received over the console, makes it available to readCsv under its file name
+    and archives it (if archiveScans). Returns the scan structure.
+    '''
+    scanStructure = parseScanText(text, fname)
+    rememberScan(fname, scanStructure)
+    if archiveScans:
+        scanArchiver.write(fname, text)
+    return scanStructure
+
+
+def scanFileName(*parts):
+    ''' Returns the path of a scan file in the runs directory built from the given parts.
+    '''
+    fname = ''.join(str(p) for p in parts)
+    fname = re.sub('\\W', '_', fname)
+    return "runs/" + fname + '.csv'
+
+
+def runScan(vivadoRX, fname, scanType='2d_full_eye', hincr=8, vincr=8, linkName='*', dwell=None, score=True):
+    ''' Runs an eye scan on the RX side and returns the open area of the result (None if not score:
+    the caller scores the scan file later).
+    dwell is the dwell BER of the scan (eg. '1e-7', None: the default of Vivado). The result is
+    transferred as set by scanTransfer.
+    '''
+    dwellArg = ' ' + str(dwell) if dwell else ''
+    if scanTransfer == 'console':
+        cmd = 'run_scan_stream "{}" {} {} {} {}{}'.format(fname, hincr, vincr, scanType, linkName, dwellArg)
+        vivadoRX.do(cmd, errmsgs = ['ERROR: '], timeout=None)
+        blocks = scanBlocks(vivadoRX.childProc.before)
+        if len(blocks) != 1:
+            raise Exception('run_scan_stream returned {} scans instead of 1'.format(len(blocks)))
+        receiveScan(fname, blocks[0][1])
+    else:
+        forgetScan(fname)
+        cmd = 'run_scan "{}" {} {} {} {}{}'.format(fname, hincr, vincr, scanType, linkName, dwellArg)
+        vivadoRX.do(cmd, errmsgs = ['ERROR: '], timeout=None)
+        transcript.recordFile(vivadoRX, fname)
+    return scoreScanFile(fname) if score else None
+
+
+def monitoredScan(vivadoRX, fname, beat, scanType='2d_full_eye', hincr=8, vincr=8, linkName='*', dwell=None):
+    ''' Runs an eye scan like runScan, but follows its partial results and stops it as soon as it
+    cannot beat the open area beat (see openAreaBound).
+    
+    The scan is started by start_scan of sourceme.tcl, and polled (every scanPollInterval seconds)
+    by poll_scan which prints the columns scanned so far to the console, and finishes the scan.
+    Returns the open area and whether the scan is complete. The open area of a stopped scan is
+    its bound (less than beat), and its csv file is not written.
+    '''
+    dwellArg = ' ' + str(dwell) if dwell else ''
+    stream = scanTransfer == 'console'
+    poll = 'poll_scan $cleye_scan "{}" {} {}'.format(fname, int(scanPollInterval * 1000), int(stream))
+    # The scan is started and polled first in the same round trip.
+    cmd = 'set cleye_scan [start_scan {} {} {} {}{}]; {}'.format(hincr, vincr, scanType, linkName, dwellArg, poll)
+    forgetScan(fname)
+    while True:
+        vivadoRX.do(cmd, errmsgs = ['ERROR: '], timeout=None)
+        cmd = poll
+        output = vivadoRX.childProc.before
+        progress = re.search(r'scan_progress\t([^\t\r\n]*)\t([^\r\n]*)', output)
+        if progress is None:
+            raise Exception('poll_scan returned no progress: ' + output)
+        blocks = scanBlocks(output)
+        if progress.group(1).startswith('100'):
+            # Finished by poll_scan (see finish_scan)
+            if stream:
+                if len(blocks) != 1:
+                    raise Exception('poll_scan returned {} scans instead of 1'.format(len(blocks)))
+                receiveScan(fname, blocks[0][1])
+            else:
+                transcript.recordFile(vivadoRX, fname)
+            return scoreScanFile(fname), True
+        if not blocks:
+            continue
+        bound = openAreaBound(parseScanText(blocks[0][1], fname))
+        if bound is not None and bound < beat:
+            vivadoRX.do('stop_scan $cleye_scan', errmsgs = ['ERROR: '])
+            logging.info('Scan {} stopped at {}: open area <= {} < {}'.format(fname, progress.group(1), bound, beat))
+            return bound, False
+
+
+def scoreScanFile(fname):
+    ''' Reads a scan file and returns its open area.
+    '''
+    scanStructure = readCsv(fname)
+    openArea = getOpenArea(scanStructure)
+    if openArea is None:
+        logging.error('openArea is None after reading file: ' + fname)
+    return openArea
+
+
+def applySetting(vivado, sioGt, pName, pValue):
+    ''' Sets and commits a transceiver property, then checks it by reading it back.
+    (All in one console round trip.)
+    '''
+    cmds = [
+        'set_property {} {} {}'.format(pName, pValue, sioGt),
+        'commit_hw_sio ' + sioGt,
+        'get_property {} {}'.format(pName, sioGt),
+        ]
+    outputs = vivado.doBatch(cmds, errmsgs=['ERROR: '])
+    
+    checkValue = [x for x in outputs[2].splitlines() if x]
+    checkValue = checkValue[0] if checkValue else ''
+    if checkValue not in pValue: # Readback does not contains brackets {}
+        print("ERROR: Something went wrong. Cannot set value {}  {} ".format(checkValue, pValue))
+
+
+def sweepProperty(vivado, sio, pName, points, stage):
+    ''' Runs a whole property sweep inside Vivado by the sweep_property proc of sourceme.tcl.
+    
+    For every (value, scan file) of points the property is set, committed and read back, then the
+    link is scanned, all in one console round trip. This needs the TX and the RX side in the same
+    Vivado session. The scans are transferred as set by scanTransfer.
+    Returns a list of (value, scan file, open area).
+    '''
+    stream = scanTransfer == 'console'
+    pointList = ' '.join('{} {{{}}}'.format(pValue, fname) for pValue, fname in points)
+    cmd = 'sweep_property {} {} {{{}}} {} {} {} * {} {{{}}}'.format(sio, pName, pointList,
+        stage.get('hincr', 8), stage.get('vincr', 8), stage['scanType'], int(stream), stage.get('dwell') or '')
+    for pValue, fname in points:
+        forgetScan(fname)
+    vivado.do(cmd, errmsgs = ['ERROR: '], timeout=None)
+    if stream:
+        for fname, text in scanBlocks(vivado.childProc.before):
+            receiveScan(fname, text)
+    else:
+        for pValue, fname in points:
+            transcript.recordFile(vivado, fname)
+    
+    # One 'sweep_point<TAB>value<TAB>readback<TAB>scan file' line per point (in the order of points).
+    readbacks = [line.split('\t')[2] for line in vivado.childProc.before.splitlines()
+        if line.startswith('sweep_point\t')]
+    if len(readbacks) != len(points):
+        raise Exception('sweep_property returned {} results for {} points'.format(len(readbacks), len(points)))
+    
+    ret = []
+    for (pValue, fname), checkValue in zip(points, readbacks):
+        if checkValue not in pValue: # Readback does not contains brackets {}
+            print("ERROR: Something went wrong. Cannot set value {}  {} ".format(checkValue, pValue))
+        ret.append((pValue, fname, getOpenArea(readCsv(fname))))
+    return ret
+
+
+def readSettings(vivadoTX, vivadoRX, txSio, rxSio, space):
+    ''' Reads the current values of the properties of the space from the TX/RX hw_sio_gts.
+    Returns an ordered dict of property name -> value of the space's table (the readback does not
+    contains the brackets {}, the raw readback is used if it is not in the table). The RX side
+    properties are skipped if rxSio is not given.
+    '''
+    txNames = [n for n in space if n not in rxProperties]
+    rxNames = [n for n in space if n in rxProperties and rxSio]
+    readback = {}
+    for vivado, sio, names in [(vivadoTX, txSio, txNames), (vivadoRX, rxSio, rxNames)]:
+        if names:
+            sioGt = '[get_hw_sio_gts {}]'.format(sio)
+            readback.update(vivado.get_properties(names, [sioGt])[sioGt])
+    
+    settings = collections.OrderedDict()
+    for pName, pValues in space.items():
+        if pName not in readback:
+            continue
+        matches = [v for v in pValues if readback[pName] in v]
+        settings[pName] = matches[0] if matches else readback[pName]
+    return settings
+
+
+def storedScan(store, txSio, rxSio, settings, stage):
+    ''' Returns the fresh stored result of the settings (or None if it must be scanned).
+    '''
+    if store is None:
+        return None
+    return store.lookup(txSio, rxSio, settings, stage['scanType'], stage.get('hincr', 8), stage.get('vincr', 8), stage.get('dwell'))
+
+
+def storeScan(store, txSio, rxSio, settings, stage, fname, openArea):
+    if store is None:
+        return
+    validEye = _testEye(readCsv(fname)['scanData'])
+    store.record(txSio, rxSio, settings, stage['scanType'], stage.get('hincr', 8), stage.get('vincr', 8), stage.get('dwell'),
+        openArea, validEye, fname)
+
+
+def berMargin(fname):
+    ''' Returns the mean -log10(BER) of the points of a scan file (None if it cannot be read). It
+    grows with the width and the depth of the eye continuously, so it separates the scans of the
+    same (coarse) open area.
+    '''
+    try:
+        values = readCsv(fname)['scanData']['values']
+    except (IOError, OSError, KeyError):
+        return None
+    return float(np.mean(-np.log10(np.maximum(values, extrapolationBer))))
+
+
+def _survivors(candidates, openAreas, keep, margins=None):
+    ''' Returns the best keep candidates (in their original order). The ties of the open areas are
+    broken by the margins (see berMargin, None: unknown), the candidates still tied with the
+    keep-th one survive too.
+    '''
+    if margins is None:
+        margins = [None] * len(candidates)
+    scores = [(openAreas[i], -np.inf if margins[i] is None else margins[i]) for i in range(len(candidates))]
+    ranking = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+    if keep >= len(candidates):
+        return list(candidates)
+    last = scores[ranking[keep - 1]]
+    return [c for c, score in zip(candidates, scores) if score >= last]
+
+
+def _leaders(openAreas, tieTolerance):
+    ''' Returns the candidates (in their order) tied with the best: within tieTolerance of the best
+    open area (relative).
+    '''
+    bestArea = max(openAreas.values())
+    if bestArea <= 0:
+        return []
+    return [c for c, area in openAreas.items() if area >= bestArea * (1.0 - tieTolerance)]
+
+
+def progressiveDwell(measure, openAreas, schedule, tieTolerance=0.05, timeBudget=None, scanTime=None, screenDwell='1e-5'):
+    ''' Separates the tied leaders of a shallow screening by rescanning them at deeper dwell BER.
+    
+    openAreas is an ordered dict of candidate -> open area of the screening (scanned at screenDwell),
+    measure(candidates, dwell) scans the candidates at the given dwell BER and returns a dict of
+    candidate -> open area. While more than one candidate is within tieTolerance of the best, the
+    leaders are rescanned at the next dwell BER of the schedule.
+    The scan time is proportional to 1/dwell BER: the next level is skipped if its estimated time
+    (from scanTime, the time of a screening scan, and the measured levels) would exceed timeBudget
+    (seconds from the start of the refinement).
+    Returns the best candidate, its open area at the deepest dwell BER with an open eye (if every
+    leader is closed at a deeper level, the best of the last level with an open eye decides; None,
+    0 if no candidate is open at all) and the list of the (dwell BER, dict of candidate -> open
+    area) levels.
+    '''
+    levels = [(screenDwell, dict(openAreas))]
+    areas = dict(openAreas)
+    begin = time.time()
+    for dwell in schedule:
+        leaders = _leaders(areas, tieTolerance)
+        if len(leaders) < 2:
+            break
+        lastDwell = levels[-1][0]
+        if timeBudget is not None and scanTime is not None:
+            estimate = len(leaders) * scanTime * float(lastDwell) / float(dwell)
+            if time.time() - begin + estimate > timeBudget:
+                logging.info('Dwell BER {}: {} leaders would take ~{:.0f}s, out of the time budget.'.format(
+                    dwell, len(leaders), estimate))
+                break
+        print('Dwell BER {}: rescanning {} tied leaders'.format(dwell, len(leaders)))
+        scanBegin = time.time()
+        areas = measure(leaders, dwell)
+        scanTime = (time.time() - scanBegin) / len(leaders)
+        areas = collections.OrderedDict((c, areas[c]) for c in leaders)
+        levels.append((dwell, dict(areas)))
+    
+    for dwell, areas in reversed(levels):
+        if areas and max(areas.values()) > 0:
+            best = max(areas, key=lambda c: areas[c])
+            return best, areas[best], levels
+    logging.warning('No candidate has an open eye at any dwell BER.')
+    return None, 0, levels
+
+
+def _measureCandidates(vivadoTX, vivadoRX, txSio, rxSio, pName, candidates, stage, stageId, fileName, settings=None, store=None,
+        monitorKeep=None, analysis=None, files=None):
+    ''' Measures the open area of the link at the candidate values of a TX property.
+    
+    The fresh stored results are reused, the others are scanned (by one sweep inside Vivado if the
+    TX and the RX side live in the same session) and recorded to the store. fileName returns the
+    scan file of a value. Returns a dict of value -> open area.
+    With monitorKeep the scans (of separate sessions) are monitored and stopped as soon as they
+    cannot get into the best monitorKeep candidates (see monitoredScan). The open area of a stopped
+    scan is its bound and it is not recorded to the store.
+    With an analysis executor (concurrent.futures) the finished scans of separate sessions are
+    scored by it, while the TX side is set for the next value and the next scan is running.
+    files (dict) gets the scan file (stored or scanned) of the values.
+    '''
+    if files is None:
+        files = {}
+    txSioGt = '[get_hw_sio_gts {}]'.format(txSio)
+    openAreas = {}
+    toScan = []
+    for pValue in candidates:
+        if settings is not None:
+            settings[pName] = pValue
+        stored = storedScan(store, txSio, rxSio, settings, stage)
+        if stored is not None:
+            print('OpenArea ({} {} stored): {}'.format(pName, pValue, stored['openArea']))
+            openAreas[pValue] = stored['openArea']
+            files[pValue] = stored['csvPath']
+            continue
+        toScan.append((pValue, fileName(pValue)))
+    
+    if vivadoTX is vivadoRX and toScan:
+        # TX and RX live in the same session: the whole sweep runs inside Vivado.
+        print("Sweep {} ({} values)".format(pName, len(toScan)))
+        with tracer.span('sweep', 'finder', property=pName, points=len(toScan), stage=stageId):
+            scanned = sweepProperty(vivadoTX, txSio, pName, toScan, stage)
+    else:
+        scanned = []
+        stopped = []
+        for pValue, fname in toScan:
+            with tracer.span('sweep point', 'finder', property=pName, value=pValue, stage=stageId):
+                print("Create scan ({} {})".format(pName, pValue))
+                applySetting(vivadoTX, txSioGt, pName, pValue)
+                
+                # set_property PORT.GTRXRESET 0 [get_hw_sio_gts  {localhost:3121/xilinx_tcf/Digilent/210203A2513BA/0_1_0/IBERT/Quad_113/MGT_X1Y0}]
+                # commit_hw_sio  [get_hw_sio_gts  {localhost:3121/xilinx_tcf/Digilent/210203A2513BA/0_1_0/IBERT/Quad_113/MGT_X1Y0}]
+
+                beat = None
+                if monitorKeep:
+                    areas = sorted(list(openAreas.values()) + [_areaOf(area) for _, _, area in scanned], reverse=True)
+                    if len(areas) >= monitorKeep and areas[monitorKeep - 1] > 0:
+                        beat = areas[monitorKeep - 1]
+                if beat is not None:
+                    openArea, complete = monitoredScan(vivadoRX, fname, beat, stage['scanType'],
+                        stage.get('hincr', 8), stage.get('vincr', 8), dwell=stage.get('dwell'))
+                    if not complete:
+                        print('OpenArea ({} {} stopped): <= {}'.format(pName, pValue, openArea))
+                        stopped.append((pValue, openArea))
+                        continue
+                elif analysis is not None:
+                    runScan(vivadoRX, fname, stage['scanType'], stage.get('hincr', 8), stage.get('vincr', 8),
+                        dwell=stage.get('dwell'), score=False)
+                    openArea = analysis.submit(scoreScanFile, fname)
+                else:
+                    openArea = runScan(vivadoRX, fname, stage['scanType'], stage.get('hincr', 8), stage.get('vincr', 8),
+                        dwell=stage.get('dwell'))
+                scanned.append((pValue, fname, openArea))
+        openAreas.update(stopped)
+    
+    for pValue, fname, openArea in scanned:
+        openArea = _areaOf(openArea)
+        files[pValue] = fname
+        if settings is not None:
+            settings[pName] = pValue
+        storeScan(store, txSio, rxSio, settings, stage, fname, openArea)
+        print('OpenArea ({} {}): {}'.format(pName, pValue, openArea))
+        openAreas[pValue] = openArea
+    return openAreas
+
+
+def _areaOf(openArea):
+    ''' Returns the open area (waits for it if it is scored in the background). '''
+    if isinstance(openArea, concurrent.futures.Future):
+        return openArea.result()
+    return openArea
+
+
+def orderedSearch(evaluate, size, patience=2, tolerance=0.05):
+    ''' Searches the maximum of a (usually) unimodal function over the indexes of an ordered table.
+    
+    evaluate gets an index and returns the open area. The search has three parts:
+     - golden-section search narrows the bracket of the maximum down to 4 indexes,
+     - the bracket is measured and the best point is refined by walking outwards from it in both
+       directions until patience consecutive points are not better (plateau/decline detector),
+     - the measured points are checked for unimodality (rising up to the best, falling after it,
+       within tolerance relative to the best area).
+    If the golden-section probes are on a zero plateau, if every measured area is zero or if the
+    unimodality looks violated, the search falls back to a full sweep.
+    Returns a dict of the best index, its area, the number of evaluations and the flags.
+    '''
+    areas = {}
+    def f(i):
+        if i not in areas:
+            areas[i] = evaluate(i)
+        return areas[i]
+    
+    invPhi = (5 ** 0.5 - 1) / 2
+    a, b = 0, size - 1
+    plateau = False
+    while b - a > 3:
+        c = b - int(round(invPhi * (b - a)))
+        d = a + int(round(invPhi * (b - a)))
+        if c >= d:
+            c, d = (a + b) // 2, (a + b) // 2 + 1
+        fc, fd = f(c), f(d)
+        if fc < fd:
+            a = c
+        elif fc > fd:
+            b = d
+        elif fc > 0:
+            # Both sides of the peak: the maximum is between them.
+            a, b = c, d
+        else:
+            plateau = True
+            break
+    
+    for i in range(a, b + 1):
+        f(i)
+    best = max(sorted(areas), key=lambda i: areas[i])
+    for step in [-1, 1]:
+        worse = 0
+        i = best + step
+        while 0 <= i < size and worse < patience:
+            if f(i) > areas[best]:
+                best = i
+                worse = 0
+            else:
+                worse += 1
+            i += step
+    
+    indexes = sorted(areas)
+    slack = tolerance * areas[best]
+    rising = [i for i in indexes if i <= best]
+    falling = [i for i in indexes if i >= best]
+    unimodal = all(areas[j] >= areas[i] - slack for i, j in zip(rising, rising[1:])) and \
+        all(areas[j] <= areas[i] + slack for i, j in zip(falling, falling[1:]))
+    
+    if plateau or areas[best] <= 0 or not unimodal:
+        if not unimodal:
+            logging.warning('The open area does not look unimodal ({}), falling back to a full sweep.'.format(
+                ' '.join('{}:{}'.format(i, areas[i]) for i in indexes)))
+        else:
+            logging.warning('The open area is flat at the probed points, falling back to a full sweep.')
+        for i in range(size):
+            f(i)
+        best = max(range(size), key=lambda i: areas[i])
+    
+    return {'best': best, 'area': areas[best], 'scans': len(areas), 'unimodal': unimodal, 'plateau': plateau,
+        'areas': dict(areas)}
+
+
+def independent_finder(vivadoTX, vivadoRX, txSio, stages=None, rxSio=None, store=None, prefix='', ordered=False, patience=2,
+        dwellSchedule=None, timeBudget=None, monitored=False, space=None, analysis=None):
+    ''' Runs the optimizer algorithm.
+    
+    stages is the list of scan stages (see defaultScanStages and coarseToFineScanStages). With
+    multiple stages the candidates are screened by the fast stages and only the survivors are
+    scanned at full resolution.
+    With ordered the values of the (ordered) property tables are searched by orderedSearch using
+    the last stage, instead of sweeping all of them.
+    With a dwellSchedule the tied leaders of the last stage are rescanned at deeper dwell BER until
+    a winner separates (see progressiveDwell), within timeBudget seconds.
+    With monitored the scans of the stages are stopped as soon as they cannot get into the
+    survivors (or beat the best of the last stage), see monitoredScan.
+    space is the ordered dict of the swept TX properties -> values. (default: TXDIFFSWING with its
+    legal values discovered from the device, see linkParameterSpace)
+    If a ScanResultStore is given, the fresh stored results are reused instead of scanning again.
+    With an analysis executor the scans are scored in the background (see _measureCandidates).
+    The names of the scan files start with prefix.
+    Returns a dict of the best settings (property -> value) and the open area of the last sweep.
+    '''
+    globalIteration = 1
+    globalParameterSpace = space
+    if globalParameterSpace is None:
+        globalParameterSpace = linkParameterSpace(vivadoTX, vivadoRX, txSio, rxSio, ["TXDIFFSWING"])
+    # globalParameterSpace = linkParameterSpace(vivadoTX, vivadoRX, txSio, rxSio, ["TXDIFFSWING", "TXPRE", "TXPOST"])
+    
+    if stages is None:
+        stages = defaultScanStages
+    
+    if not os.path.exists("runs"):
+        os.makedirs("runs")
+    
+    # The full property vector of the link is the key of the stored results (the RX properties
+    # only with rxSio). The swept properties are overwritten per point.
+    settings = None
+    if store is not None:
+        keySpace = collections.OrderedDict(jointParameterSpace)
+        keySpace.update(globalParameterSpace)
+        settings = readSettings(vivadoTX, vivadoRX, txSio, rxSio, keySpace)
+    best = collections.OrderedDict()
+
+    for i in range(globalIteration):
+        for pName, pValues in globalParameterSpace.items():
+            txSioGt = '[get_hw_sio_gts {}]'.format(txSio)
+            bestValue = vivadoTX.get_property(pName, txSioGt)
+            maxArea   = 0
+            candidates = list(pValues)
+            screened = collections.OrderedDict()
+            screenBegin = time.time()
+            
+            if ordered:
+                stage = stages[-1]
+                fileName = functools.partial(scanFileName, prefix, i, pName)
+                def evaluate(index):
+                    pValue = candidates[index]
+                    return _measureCandidates(vivadoTX, vivadoRX, txSio, rxSio, pName, [pValue], stage,
+                        len(stages) - 1, fileName, settings, store)[pValue]
+                result = orderedSearch(evaluate, len(candidates), patience)
+                bestValue = candidates[result['best']]
+                maxArea = result['area']
+                for index in sorted(result['areas']):
+                    screened[candidates[index]] = result['areas'][index]
+                print("Ordered search of {}: {} scans of {} values{}".format(pName, result['scans'], len(candidates),
+                    '' if result['unimodal'] else ' (not unimodal: full sweep)'))
+            
+            for stageId, stage in enumerate(stages if not ordered else []):
+                lastStage = stageId == len(stages) - 1
+                if len(stages) == 1:
+                    fileName = functools.partial(scanFileName, prefix, i, pName)
+                else:
+                    fileName = lambda pValue: scanFileName(prefix, i, pName, pValue, 'stage', stageId)
+                monitorKeep = None
+                if monitored:
+                    monitorKeep = 1 if lastStage else stage.get('keep')
+                files = {}
+                openAreas = _measureCandidates(vivadoTX, vivadoRX, txSio, rxSio, pName, candidates, stage, stageId,
+                    fileName, settings, store, monitorKeep, analysis, files)
+                openAreas = [openAreas[pValue] for pValue in candidates]
+                
+                if lastStage:
+                    for pValue, openArea in zip(candidates, openAreas):
+                        screened[pValue] = openArea
+                        if openArea > maxArea:
+                            maxArea = openArea
+                            bestValue = pValue
+                else:
+                    margins = [berMargin(files[pValue]) if pValue in files else None for pValue in candidates]
+                    candidates = _survivors(candidates, openAreas, stage.get('keep', len(candidates)), margins)
+                    print("Stage {}: {} candidates survived: {}".format(stageId, len(candidates), ' '.join(candidates)))
+                    screenBegin = time.time()
+            
+            if dwellSchedule and screened:
+                stage = stages[-1]
+                def measure(leaders, dwell):
+                    fileName = lambda pValue: scanFileName(prefix, i, pName, pValue, 'dwell', dwell)
+                    return _measureCandidates(vivadoTX, vivadoRX, txSio, rxSio, pName, leaders, dict(stage, dwell=dwell),
+                        len(stages) - 1, fileName, settings, store, analysis=analysis)
+                scanTime = (time.time() - screenBegin) / len(screened)
+                dwellBest, dwellArea, levels = progressiveDwell(measure, screened, dwellSchedule, timeBudget=timeBudget,
+                    scanTime=scanTime, screenDwell=stage.get('dwell') or '1e-5')
+                if dwellBest is not None:
+                    bestValue, maxArea = dwellBest, dwellArea
+                print("Dwell BER {}: {} leaders".format(levels[-1][0], len(levels[-1][1])))
+                
+            print("pName:  {}    bestParam:  {}    OpenArea: {}".format(pName, bestValue, maxArea))
+            
+            vivadoTX.set_property(pName, bestValue, txSioGt)
+            vivadoTX.do('commit_hw_sio ' + txSioGt)
+            if settings is not None:
+                settings[pName] = bestValue
+            best[pName] = bestValue
+    
+    return {'best': best, 'openArea': maxArea}
+
+
+class SearchBudgetExhausted(Exception):
+    pass
+
+
+class SearchRecorder():
+    ''' Bookkeeping of a search over a discrete parameter space.
+    
+    The space is an (ordered) dict of property name -> list of legal values, the points are tuples
+    of value indexes. The recorder measures the points by the objective (a callable which gets
+    a dict of property name -> value and returns the open area), never measures a point twice,
+    stops the search when the scan budget is used up and records the scans-used versus best-area
+    curve.
+    '''
+    def __init__(self, space, objective, maxScans=None):
+        self.space = space
+        self.names = list(space.keys())
+        self.sizes = [len(space[n]) for n in self.names]
+        self.objective = objective
+        self.maxScans = maxScans
+        self.measured = {}
+        self.history = []
+        self.bestIndex = None
+        self.bestArea = None
+        
+        
+    def point(self, index):
+        return collections.OrderedDict((n, self.space[n][i]) for n, i in zip(self.names, index))
+        
+        
+    def valid(self, index):
+        return all(0 <= i < size for i, size in zip(index, self.sizes))
+        
+        
+    def evaluate(self, index):
+        ''' Returns the open area at the given point. Measures it, if it has not been measured yet.
+        '''
+        index = tuple(index)
+        if index in self.measured:
+            return self.measured[index]
+        if self.maxScans is not None and len(self.measured) >= self.maxScans:
+            raise SearchBudgetExhausted()
+            
+        area = self.objective(self.point(index))
+        self.measured[index] = area
+        if self.bestArea is None or area > self.bestArea:
+            self.bestArea = area
+            self.bestIndex = index
+        self.history.append((len(self.measured), self.bestArea))
+        return area
+        
+        
+    def result(self):
+        return {
+            'best': self.point(self.bestIndex) if self.bestIndex is not None else None,
+            'bestArea': self.bestArea,
+            'scans': len(self.measured),
+            'history': list(self.history),
+            }
+
+
+def coordinateDescentSearch(recorder, start, tolerance=0.0, maxPasses=10):
+    ''' Sweeps the properties one by one (the others are fixed at their best value so far).
+    Converges, when a full pass does not improve the best area by more than tolerance.
+    '''
+    current = list(start)
+    bestArea = recorder.evaluate(current)
+    for _ in range(maxPasses):
+        passStartArea = bestArea
+        for dim, size in enumerate(recorder.sizes):
+            for i in range(size):
+                candidate = list(current)
+                candidate[dim] = i
+                area = recorder.evaluate(candidate)
+                if area > bestArea:
+                    bestArea = area
+                    current = candidate
+        if bestArea - passStartArea <= tolerance:
+            break
+
+
+def patternSearch(recorder, start, initialStep=None):
+    ''' Compass (pattern) search on the value indexes.
+    Polls the +-step neighbours along every property and moves to the best improving one. When
+    no neighbour improves, the steps are halved. Converges, when the steps are 1 and no neighbour
+    improves.
+    '''
+    current = tuple(start)
+    bestArea = recorder.evaluate(current)
+    if initialStep is None:
+        steps = [max(1, size // 4) for size in recorder.sizes]
+    else:
+        steps = [initialStep] * len(recorder.sizes)
+        
+    while True:
+        bestNeighbour = None
+        for dim in range(len(current)):
+            for direction in (1, -1):
+                candidate = list(current)
+                candidate[dim] += direction * steps[dim]
+                if not recorder.valid(candidate):
+                    continue
+                area = recorder.evaluate(candidate)
+                if area > bestArea:
+                    bestArea = area
+                    bestNeighbour = tuple(candidate)
+        if bestNeighbour is not None:
+            current = bestNeighbour
+        elif max(steps) > 1:
+            steps = [max(1, s // 2) for s in steps]
+        else:
+            break
+
+
+def _quadraticFeatures(x):
+    ''' Features of a full quadratic model: 1, x_i, x_i*x_j (i <= j). x is a (points, dims) array.
+    '''
+    features = [np.ones(len(x))]
+    dims = x.shape[1]
+    for i in range(dims):
+        features.append(x[:, i])
+    for i in range(dims):
+        for j in range(i, dims):
+            features.append(x[:, i] * x[:, j])
+    return np.stack(features, axis=1)
+
+
+def surrogateSearch(recorder, start, initialPoints=None, patience=5, maxCandidates=300000, seed=0):
+    ''' Surrogate-model based search.
+    
+    After an initial random design, a quadratic model of the open area (as a function of the
+    normalized value indexes) is fitted to all measurements and the unmeasured point with the
+    best predicted area is measured next. Stops, when patience consecutive scans do not improve
+    the best area.
+    '''
+    rng = np.random.RandomState(seed)
+    sizes = np.array(recorder.sizes)
+    scale = np.maximum(sizes - 1, 1).astype(float)
+    featureCount = _quadraticFeatures(np.zeros((1, len(sizes)))).shape[1]
+    if initialPoints is None:
+        initialPoints = featureCount + 1
+        
+    recorder.evaluate(start)
+    while len(recorder.measured) < initialPoints:
+        recorder.evaluate(tuple(int(rng.randint(size)) for size in sizes))
+    
+    # The candidate points: the full grid if it is small enough, else a random sample of it.
+    gridSize = int(np.prod(sizes))
+    if gridSize <= maxCandidates:
+        candidates = np.indices(sizes).reshape(len(sizes), -1).T
+    else:
+        candidates = np.stack([rng.randint(size, size=maxCandidates) for size in sizes], axis=1)
+    candidateFeatures = _quadraticFeatures(candidates / scale)
+    candidateKeys = np.ravel_multi_index(candidates.T, sizes)
+    
+    sinceImprovement = 0
+    while sinceImprovement < patience:
+        measured = list(recorder.measured.keys())
+        areas = np.array([recorder.measured[m] for m in measured], dtype=float)
+        features = _quadraticFeatures(np.array(measured) / scale)
+        # A small ridge term keeps the fit stable while there are few measurements.
+        ridge = 1e-3 * np.eye(features.shape[1])
+        coef = np.linalg.solve(features.T.dot(features) + ridge, features.T.dot(areas))
+        
+        predicted = candidateFeatures.dot(coef)
+        predicted[np.isin(candidateKeys, np.ravel_multi_index(np.array(measured).T, sizes))] = -np.inf
+        if not np.isfinite(predicted).any():
+            break
+        nextPoint = tuple(int(i) for i in candidates[int(np.argmax(predicted))])
+        
+        bestArea = recorder.bestArea
+        recorder.evaluate(nextPoint)
+        if recorder.bestArea > bestArea:
+            sinceImprovement = 0
+        else:
+            sinceImprovement += 1
+
+
+# The search strategies of runSearch. A strategy is a function with (recorder, start, **options)
+# arguments, which evaluates points through the recorder.
+searchStrategies = {
+    'coordinate': coordinateDescentSearch,
+    'pattern': patternSearch,
+    'surrogate': surrogateSearch,
+}
+
+
+def runSearch(space, objective, strategy='pattern', start=None, maxScans=None, **options):
+    ''' Searches the best point of a discrete parameter space using the given strategy.
+    
+    space is an ordered dict of property name -> legal values, objective gets a dict of property
+    name -> value and returns the open area to maximize, start is the index tuple of the starting
+    point (default: the first values). Returns a dict with the best point, its area, the number of
+    scans used and the history: a list of (scans used, best area) pairs.
+    '''
+    recorder = SearchRecorder(space, objective, maxScans)
+    if start is None:
+        start = (0,) * len(space)
+    try:
+        searchStrategies[strategy](recorder, tuple(start), **options)
+    except SearchBudgetExhausted:
+        logging.info('Scan budget ({}) has been used up'.format(maxScans))
+    return recorder.result()
+
+
+class LinkObjective():
+    ''' Measures the open area of the TX->RX link at a point of the parameter space.
+    Only the properties which differ from the current settings are set and committed. If a
+    ScanResultStore is given, fresh stored results are returned without touching the hardware.
+    '''
+    def __init__(self, vivadoTX, vivadoRX, txSio, rxSio=None, stage=None, prefix='search', store=None):
+        self.vivadoTX = vivadoTX
+        self.vivadoRX = vivadoRX
+        self.txSio = txSio
+        self.rxSio = rxSio
+        self.store = store
+        self.txSioGt = '[get_hw_sio_gts {}]'.format(txSio)
+        self.rxSioGt = '[get_hw_sio_gts {}]'.format(rxSio) if rxSio else None
+        self.stage = stage if stage is not None else defaultScanStages[-1]
+        self.prefix = prefix
+        self.current = {}
+        self.scanCount = 0
+        
+        
+    def apply(self, point):
+        for pName, pValue in point.items():
+            if self.current.get(pName) == pValue:
+                continue
+            if pName in rxProperties:
+                if self.rxSioGt is None:
+                    raise Exception('RX SIO is needed to set ' + pName)
+                applySetting(self.vivadoRX, self.rxSioGt, pName, pValue)
+            else:
+                applySetting(self.vivadoTX, self.txSioGt, pName, pValue)
+            self.current[pName] = pValue
+            
+            
+    def __call__(self, point):
+        settings = dict(self.current)
+        settings.update(point)
+        stored = storedScan(self.store, self.txSio, self.rxSio, settings, self.stage)
+        if stored is not None:
+            print('Stored {}  OpenArea: {}'.format(' '.join('{}={}'.format(k, v) for k, v in point.items()), stored['openArea']))
+            return stored['openArea']
+        
+        with tracer.span('search point', 'finder', **point):
+            self.apply(point)
+            self.scanCount += 1
+            fname = scanFileName(self.prefix, self.scanCount)
+            openArea = runScan(self.vivadoRX, fname, self.stage['scanType'], self.stage.get('hincr', 8), self.stage.get('vincr', 8),
+                dwell=self.stage.get('dwell'))
+        storeScan(self.store, self.txSio, self.rxSio, settings, self.stage, fname, openArea)
+        print('Scan {} {}  OpenArea: {}'.format(self.scanCount, ' '.join('{}={}'.format(k, v) for k, v in point.items()), openArea))
+        return openArea
+
+
+# The parameter space of joint_finder.
+jointParameterSpace = collections.OrderedDict([
+    ('TXDIFFSWING', TXDIFFSWING_values),
+    ('TXPRE', TXPRE_values),
+    ('TXPOST', TXPOST_values),
+    ('RXTERM', RXTERM_values),
+])
+
+
+def joint_finder(vivadoTX, vivadoRX, txSio, rxSio, space=None, strategy='pattern', maxScans=100, store=None, prefix='',
+        **options):
+    ''' Optimizes all properties of the space together by a search strategy (see searchStrategies).
+    The search starts from the current settings of the link and the best point is applied at the end.
+    Fresh results of the ScanResultStore (if given) are reused without scanning.
+    The default space is jointParameterSpace with the legal values discovered from the devices.
+    The RX side properties (see rxProperties) are not tuned without rxSio.
+    The names of the scan files start with prefix.
+    '''
+    names = list(space if space is not None else jointParameterSpace)
+    rxNames = [n for n in names if n in rxProperties]
+    if rxNames and not rxSio:
+        logging.warning('No RX SIO is given: {} is not tuned'.format(' '.join(rxNames)))
+        names = [n for n in names if n not in rxProperties]
+    if space is None:
+        space = linkParameterSpace(vivadoTX, vivadoRX, txSio, rxSio, names)
+    else:
+        space = collections.OrderedDict((n, space[n]) for n in names)
+    if not os.path.exists("runs"):
+        os.makedirs("runs")
+    
+    # Start from the current settings.
+    current = readSettings(vivadoTX, vivadoRX, txSio, rxSio, space)
+    start = [space[n].index(current[n]) if current[n] in space[n] else 0 for n in space]
+    
+    objective = LinkObjective(vivadoTX, vivadoRX, txSio, rxSio, prefix=prefix + 'search_' + strategy, store=store)
+    objective.current = dict((n, space[n][i]) for n, i in zip(space.keys(), start))
+    result = runSearch(space, objective, strategy, start, maxScans, **options)
+    
+    print('Strategy: {}   scans used: {}   best OpenArea: {}'.format(strategy, result['scans'], result['bestArea']))
+    print('Scans used -> best OpenArea:')
+    for scans, bestArea in result['history']:
+        print('  {:4d}  {}'.format(scans, bestArea))
+    if result['best'] is not None:
+        for pName, pValue in result['best'].items():
+            print("pName:  {}    bestParam:  {}".format(pName, pValue))
+        objective.apply(result['best'])
+    return result
+
+
+async def async_independent_finder(asyncTX, asyncRX, txSio, stages=None, rxSio=None, store=None, prefix='', **options):
+    ''' asyncio version of independent_finder (with the same options).
+    
+    The finder holds asyncTX and asyncRX exclusively (see AsyncVivado.runExclusive): the commands
+    of these instances awaited by other coroutines wait until it returns. The console commands of
+    the finder do not overlap, a scan starts after the TX setting is committed. Only the parsing
+    and scoring of the finished scans runs in the background, while the next point is set and
+    scanned. Returns the result of independent_finder.
+    '''
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as analysis:
+        return await AsyncVivado.runExclusive([asyncRX, asyncTX], independent_finder, asyncTX.vivado,
+            asyncRX.vivado, txSio, stages, rxSio, store, prefix, analysis=analysis, **options)
+
+
+def interactiveVivadoConsole(vivadoTX, vivadoRX):
+    ''' gives full control for user over the two (TX and RX) Vivado consoles.
+    '''
+    
+    print('Switching to VivadoRX')
+    vivado = vivadoRX
+    vivado.do('', vivadoPrompt, True)
+    
+    while True:
+        cmd = input()
+        if cmd.startswith('!'):
+            # Cleye command
+            cmd = cmd[1:].lower()
+            if cmd == 'rx':
                 print('Switching to VivadoRX')
                 vivado = vivadoRX
                 vivado.do('', vivadoPrompt, True)
@@ -493,47 +2769,202 @@ def interactiveVivadoConsole(vivadoTX, vivadoRX):
             vivado.do(cmd, vivadoPrompt, True)
     
     
-if __name__ == '__main__':
+# Cache of the hardware topology. (See HardwareTopology)
+topologyCacheFile = os.path.join('runs', '.cache', 'topology.json')
+
+
+class HardwareTopology():
+    ''' The cached topology of the hardware: the devices (with their IDCODE) of the targets and the
+    SIOs of the devices.
+    
+    Listing the targets is cheap, opening them (to list their devices) is slow. So only the new
+    targets are opened (see refresh), the devices of the known targets come from the cache. The
+    IDCODE of a device is checked when it is opened anyway (see verify): a changed device refreshes
+    its target. The targets to be opened are spread across the given Vivado sessions.
+    '''
+    def __init__(self, path=topologyCacheFile):
+        self.path = path
+        self.targets = collections.OrderedDict()
+        try:
+            with open(path) as f:
+                self.targets.update(json.load(f))
+        except (IOError, OSError, ValueError):
+            pass
+        
+        
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp = '{}.{}.tmp'.format(self.path, uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            json.dump(self.targets, f, indent=1)
+        os.replace(tmp, self.path)
+        
+        
+    @staticmethod
+    def _fetchTargets(vivado, targets):
+        ''' Opens the targets one by one in a Vivado session. Returns a dict of target -> list of
+        [device, idcode].
+        '''
+        ret = {}
+        for target in targets:
+            ret[target] = []
+            with tracer.span('fetch target', 'startup', target=target):
+                vivado.do('fetch_target_devices {{{}}}'.format(target), errmsgs=['ERROR: '])
+            for line in vivado.childProc.before.splitlines():
+                fields = line.split('\t')
+                if len(fields) == 4 and fields[0] == 'target_device':
+                    ret[target].append([fields[2], fields[3].strip()])
+        return ret
+        
+        
+    def refresh(self, sessions, rediscover=False):
+        ''' Lists the targets and opens the new ones (all of them if rediscover). The targets are
+        opened in parallel, one session opens every len(sessions)-th of them. Returns the devices.
+        '''
+        sessions = list(sessions)
+        sessions[0].do('get_hw_targets', errmsgs=['ERROR: '])
+        output = [x for x in sessions[0].childProc.before.splitlines() if x.strip()]
+        present = _parseTclList(output[0].strip()) if output else []
+        present = [t.strip('{}') for t in present]
+        
+        stale = [t for t in present if rediscover or t not in self.targets]
+        logging.info('Hardware topology: {} targets, {} to open'.format(len(present), len(stale)))
+        fetched = {}
+        if stale:
+            parts = [stale[i::len(sessions)] for i in range(len(sessions))]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+                for ret in executor.map(self._fetchTargets, sessions, parts):
+                    fetched.update(ret)
+        
+        targets = collections.OrderedDict()
+        for target in present:
+            if target in fetched:
+                targets[target] = {'devices': fetched[target], 'sios': {}}
+            else:
+                targets[target] = self.targets[target]
+        self.targets = targets
+        self.save()
+        return self.devices()
+        
+        
+    def devices(self):
+        ''' Returns the '<hw_target> <hw_device>' entries of all devices (like fetch_devices). '''
+        return ['{} {}'.format(target, device) for target, entry in self.targets.items() for device, _ in entry['devices']]
+        
+        
+    def verify(self, vivado, device):
+        ''' Checks the IDCODE of the (opened) current device against the cache. If it changed, the
+        target is refreshed (in this session). Returns True if the device is unchanged.
+        '''
+        target, name = device.rsplit(' ', 1)
+        cached = dict(self.targets.get(target, {}).get('devices', []))
+        idcode = vivado.get_property('IDCODE', '[current_hw_device]', puts=False).strip()
+        if cached.get(name) == idcode:
+            return True
+        logging.warning('Device {} changed (IDCODE {}), refreshing its target'.format(device, idcode))
+        self.targets[target] = {'devices': self._fetchTargets(vivado, [target])[target], 'sios': {}}
+        vivado.do('set_device ' + device, errmsgs=['ERROR: '])
+        self.save()
+        return False
+        
+        
+    def sios(self, device):
+        ''' Returns the cached SIOs of a device (None if they are unknown). '''
+        target, name = device.rsplit(' ', 1)
+        return self.targets.get(target, {}).get('sios', {}).get(name)
+        
+        
+    def rememberSios(self, device, sios):
+        target, name = device.rsplit(' ', 1)
+        if target in self.targets:
+            self.targets[target]['sios'][name] = list(sios)
+            self.save()
+
+
+def _deviceSios(vivado, topology, device):
+    ''' Returns the SIOs of the (current) device from the topology, or lists and remembers them.
+    '''
+    sios = topology.sios(device)
+    if sios is None:
+        sios = vivado.listSios()
+        topology.rememberSios(device, sios)
+    return sios
+
+
+def interactiveTuning(stages=None, strategy='independent', maxScans=100, reuseTtl=0, singleSession=False, useDaemon=False,
+        ordered=False, dwellSchedule=None, timeBudget=None, monitored=False, rediscover=False):
+    ''' Spawns the TX/RX Vivado instances, lets the user to choose the link and runs the optimizer.
+    
+    With useDaemon the instances are leased from the cleye daemon instead of spawning them.
+    
+    With singleSession both sides live in one Vivado instance (TX and RX on the same device), so
+    the property sweeps run inside Vivado (see sweepProperty).
+    
+    strategy is 'independent' (independent_finder) or one of the searchStrategies (joint_finder).
+    With ordered independent_finder searches the ordered property tables (see orderedSearch)
+    instead of sweeping them.
+    With a dwellSchedule the tied leaders are rescanned at deeper dwell BER (see progressiveDwell).
+    With monitored the hopeless scans are stopped early (see monitoredScan).
+    The devices and their SIOs come from the cached HardwareTopology, only the new targets are opened
+    (all of them with rediscover).
+    All scan results are recorded to the ScanResultStore, the results younger than reuseTtl
+    seconds are reused instead of scanning again.
+    '''
     print(cleyeLogo)
     
     try:
         logging.info('Spawning Vivado instances (TX/RX)')
-        vivadoTX = Vivado(vivadoPath, vivadoArgs)
-        vivadoRX = Vivado(vivadoPath, vivadoArgs)
+        if useDaemon:
+            newSession = RemoteVivado
+        else:
+            newSession = functools.partial(Vivado, vivadoPath, vivadoArgs)
+        vivadoTX = newSession()
+        if singleSession:
+            vivadoRX = vivadoTX
+        else:
+            vivadoRX = newSession()
 
         logging.info('Warning for prompt of Vivado (waiting for Vivado startup)')
         vivadoTX.waitStartup()
-        vivadoRX.waitStartup()
+        if not singleSession:
+            vivadoRX.waitStartup()
 
         logging.info('Sourcing TCL procedures.')
         vivadoRX.do('source sourceme.tcl')
-        vivadoTX.do('source sourceme.tcl')
-        logging.info('Exploring target devices (fetch_devices: this can take a while)')
-        vivadoRX.do('set devices [fetch_devices]')
-        try:
-            devices = vivadoRX.get_var('devices')
-        except:
+        if not singleSession:
+            vivadoTX.do('source sourceme.tcl')
+        logging.info('Exploring target devices (new targets are opened: this can take a while)')
+        topology = HardwareTopology()
+        with tracer.span('topology', 'startup'):
+            devices = topology.refresh([vivadoRX] if singleSession else [vivadoRX, vivadoTX], rediscover)
+        if not devices:
             logging.error('No target device found. Please connect and power up your device(s)')
-            raise
-
-        # Get a list of all devices on all target.
-        # Remove the brackets. (fetch_devices returns lists.)
-        devices = re.findall(r'\{(.+?)\}', devices[0]) 
-        # devices = [x[1:-1] for x in devices[0].split(' ') ]
+            raise Exception('No target device found.')
 
         #
         # Choose TX/RX device
         # 
-        vivadoTX.chooseDevice(devices, 'TX')
-        vivadoRX.chooseDevice(devices, 'RX')
+        txDevice = vivadoTX.chooseDevice(devices, 'TX')
+        topology.verify(vivadoTX, txDevice)
+        rxDevice = txDevice
+        if not singleSession:
+            rxDevice = vivadoRX.chooseDevice(devices, 'RX')
+            topology.verify(vivadoRX, rxDevice)
 
         #
         # Choose SIOs
         # 
-        txSio = vivadoTX.chooseSio('TX', createLink=False)
-        vivadoRX.chooseSio('RX')
+        txSio = vivadoTX.chooseSio('TX', createLink=False, sios=_deviceSios(vivadoTX, topology, txDevice))
+        rxSio = vivadoRX.chooseSio('RX', sios=_deviceSios(vivadoRX, topology, rxDevice))
 
-        independent_finder(vivadoTX, vivadoRX, txSio)
+        store = ScanResultStore(ttl=reuseTtl)
+        if strategy == 'independent':
+            independent_finder(vivadoTX, vivadoRX, txSio, stages, rxSio, store, ordered=ordered,
+                dwellSchedule=dwellSchedule, timeBudget=timeBudget, monitored=monitored)
+        else:
+            joint_finder(vivadoTX, vivadoRX, txSio, rxSio, strategy=strategy, maxScans=maxScans, store=store)
 
     except KeyboardInterrupt:
         print('Exiting to VivadoTX')
@@ -543,6 +2974,13 @@ if __name__ == '__main__':
     except Exception:
         traceback.print_exc()
         
+    finishTuning(vivadoTX, vivadoRX)
+
+
+def finishTuning(vivadoTX, vivadoRX):
+    ''' Gives the consoles of the tuned Vivado instances to the user. The instances are exited if
+    the console fails.
+    '''
     try:
         print('')
         print('All Script has been run.')
@@ -555,5 +2993,978 @@ if __name__ == '__main__':
         vivadoTX.exit()
         print('Exiting to VivadoRX')
         vivadoRX.exit()
+
+
+def startVivado(executable=vivadoPath, args=vivadoArgs):
+    ''' Spawns a Vivado instance, waits for its startup and sources the TCL procedures.
+    '''
+    vivado = Vivado(executable, args)
+    vivado.waitStartup()
+    vivado.do('source sourceme.tcl')
+    return vivado
+
+
+def deviceTarget(device):
+    ''' Returns the hw_target (JTAG chain) of a '<hw_target> <hw_device>' entry of fetch_devices.
+    '''
+    return device.split(' ')[0]
+
+
+# Settings of the jobs of the headless runs. (See readJobFile)
+jobDefaults = {
+    'strategy': 'independent',
+    'stages': None,
+    'ordered': False,
+    'dwell': None,
+    'timeBudget': None,
+    'monitor': False,
+    'maxScans': 100,
+    'space': None,
+    'retries': 0,
+}
+
+# The named scan stages of the job files.
+namedScanStages = {
+    'default': defaultScanStages,
+    'coarseToFine': coarseToFineScanStages,
+}
+
+
+def readJobFile(filename):
+    ''' Reads the job file (json) of a headless run. It is a list of jobs, or a dict of the list of
+    the 'jobs' and their common 'defaults'. A job is a lane (see LaneScheduler) with the settings of
+    its tuning (see jobDefaults):
+     - name: name of the job in the results (default: lane<index>)
+     - target, device: the hw_target and the hw_device of both sides (instead of txDevice, rxDevice)
+     - strategy: 'independent' (independent_finder) or one of the searchStrategies (joint_finder)
+     - stages: list of scan stages, or 'default' / 'coarseToFine' (see defaultScanStages)
+     - ordered, timeBudget, monitor: see independent_finder
+     - dwell: the dwell BER schedule (see progressiveDwell), true: defaultDwellSchedule
+     - maxScans: scan budget of the joint search
+     - space: list of the tuned properties (legal values discovered), or dict of property -> values
+     - retries: number of the reruns of the job after its Vivado session crashed
+    Returns the list of the jobs.
+    '''
+    with open(filename) as f:
+        content = json.load(f)
+    defaults = {}
+    jobs = content
+    if isinstance(content, dict):
+        defaults = content.get('defaults', {})
+        jobs = content.get('jobs', [])
+    
+    ret = []
+    for jobId, job in enumerate(jobs):
+        job = dict(defaults, **job)
+        if 'target' in job:
+            device = '{} {}'.format(job.pop('target'), job.pop('device'))
+            job.setdefault('txDevice', device)
+            job.setdefault('rxDevice', device)
+        missing = [k for k in ['txDevice', 'txSio', 'rxSio'] if k not in job]
+        unknown = [k for k in job if k not in jobDefaults and k not in ['name', 'txDevice', 'txSio', 'rxDevice', 'rxSio']]
+        strategy = job.get('strategy', jobDefaults['strategy'])
+        if missing or unknown:
+            logging.error('Job {} of {}: missing {}, unknown {}'.format(jobId, filename, missing, unknown))
+            raise Exception('Job {} of {}: missing {}, unknown {}'.format(jobId, filename, missing, unknown))
+        if strategy != 'independent' and strategy not in searchStrategies:
+            logging.error('Job {} of {}: unknown strategy: {}'.format(jobId, filename, strategy))
+            raise Exception('Job {} of {}: unknown strategy: {}'.format(jobId, filename, strategy))
+        if strategy == 'independent' and [p for p in job.get('space') or [] if p in rxProperties]:
+            logging.error('Job {} of {}: independent_finder tunes TX properties only'.format(jobId, filename))
+            raise Exception('Job {} of {}: independent_finder tunes TX properties only'.format(jobId, filename))
+        if isinstance(job.get('stages'), str):
+            job['stages'] = namedScanStages[job['stages']]
+        if job.get('dwell') is True:
+            job['dwell'] = defaultDwellSchedule
+        ret.append(job)
+    return ret
+
+
+def runJob(vivadoTX, vivadoRX, job, prefix=''):
+    ''' Tunes the link of a job (see readJobFile) on the devices set in the sessions.
+    Returns the best settings and their open area.
+    '''
+    job = dict(jobDefaults, **job)
+    vivadoRX.do('create_link ' + job['rxSio'], errmsgs=['ERROR: '])
+    space = job['space']
+    if isinstance(space, list):
+        space = linkParameterSpace(vivadoTX, vivadoRX, job['txSio'], job['rxSio'], space)
+    elif space is not None:
+        space = collections.OrderedDict((p, list(values)) for p, values in space.items())
+    if job['strategy'] == 'independent':
+        result = independent_finder(vivadoTX, vivadoRX, job['txSio'], job['stages'], job['rxSio'], prefix=prefix,
+            ordered=job['ordered'], dwellSchedule=job['dwell'], timeBudget=job['timeBudget'], monitored=job['monitor'],
+            space=space)
+        return result['best'], result['openArea']
+    result = joint_finder(vivadoTX, vivadoRX, job['txSio'], job['rxSio'], space, job['strategy'], job['maxScans'],
+        prefix=prefix)
+    return result['best'], result['bestArea']
+
+
+def vivadoCrashed(error, sessions=[]):
+    ''' Tells whether an error is the crash of a Vivado session: its process (or the connection of
+    the daemon) is lost or it does not answer.
+    '''
+    if isinstance(error, (wexpect.EOF, wexpect.TIMEOUT, OSError)):
+        return True
+    return any(session is not None and session.childProc.terminated for session in sessions)
+
+
+class LaneScheduler():
+    ''' Tunes many TX/RX lanes using a bounded pool of Vivado sessions.
+    
+    A lane is a dict of txDevice, txSio, rxDevice and rxSio, where the devices are
+    '<hw_target> <hw_device>' entries of fetch_devices (rxDevice defaults to txDevice). A session
+    owns one hw_target (JTAG chain) at a time and a hw_target is owned by one session at most, so
+    the lanes sharing a JTAG chain are tuned one after the other, while lanes on distinct chains
+    run in parallel. Idle sessions are reused: first on their own hw_target, then retargeted.
+    
+    A lane can carry the settings of its tuning (see readJobFile), the scheduler's stages and
+    retries are the defaults. If the Vivado session of a lane crashes (see vivadoCrashed), the
+    session is restarted and the lane is tuned again, retries times at most. The report is
+    rewritten to reportFile (json) whenever a lane is done.
+    '''
+    def __init__(self, maxSessions=2, sessionFactory=startVivado, stages=None, retries=0, reportFile=None):
+        self.maxSessions = maxSessions
+        self.sessionFactory = sessionFactory
+        self.stages = stages
+        self.retries = retries
+        self.reportFile = reportFile
+        self.lock = threading.Condition()
+        # hw_target -> session (None while the session is being spawned)
+        self.sessions = {}
+        # hw_target -> the device selected in its session
+        self.devices = {}
+        self.busyTargets = set()
+        
+        
+    @staticmethod
+    def _targets(lane):
+        return set([deviceTarget(lane['txDevice']), deviceTarget(lane.get('rxDevice', lane['txDevice']))])
+        
+        
+    def _reserve(self, targets):
+        ''' Reserves the targets and a session for each of them, if possible now. (Holding the lock.)
+        '''
+        if targets & self.busyTargets:
+            return False
+        missing = [t for t in targets if t not in self.sessions]
+        idle = [t for t in self.sessions if t not in self.busyTargets and t not in targets]
+        spare = self.maxSessions - len(self.sessions)
+        if len(missing) > spare + len(idle):
+            return False
+        
+        for t in missing:
+            if spare > 0:
+                # Spawned by the lane's thread.
+                self.sessions[t] = None
+                spare -= 1
+            else:
+                # Retarget an idle session. (The device selected for its old target is gone with it.)
+                old = idle.pop()
+                self.sessions[t] = self.sessions.pop(old)
+                self.devices.pop(old, None)
+        self.busyTargets |= targets
+        return True
+        
+        
+    def _release(self, targets, failed):
+        with self.lock:
+            for t in failed:
+                session = self.sessions.pop(t, None)
+                self.devices.pop(t, None)
+                try:
+                    if session is not None:
+                        session.exit()
+                except Exception:
+                    logging.warning('Cannot exit the session of ' + t)
+            self.busyTargets -= targets
+            self.lock.notify_all()
+        
+        
+    @staticmethod
+    def _kill(session):
+        ''' Drops a crashed session without waiting for it. '''
+        try:
+            if hasattr(session.childProc, 'terminate'):
+                session.childProc.terminate(force=True)
+            else:
+                session.exit()
+        except Exception:
+            logging.warning('Cannot kill a crashed session')
+        
+        
+    def _restart(self, targets):
+        ''' Kills the sessions of the reserved targets, they are spawned again on their next use. '''
+        with self.lock:
+            sessions = [self.sessions.get(t) for t in targets]
+            for t in targets:
+                self.sessions[t] = None
+                self.devices.pop(t, None)
+        for session in sessions:
+            if session is not None:
+                self._kill(session)
+        
+        
+    def _done(self, laneId, entry, report):
+        with self.lock:
+            report[laneId] = entry
+            if self.reportFile:
+                # Replaced at once: the file is always a complete report of the finished lanes.
+                with open(self.reportFile + '.tmp', 'w') as f:
+                    json.dump([e for e in report if e is not None], f, indent=2)
+                os.replace(self.reportFile + '.tmp', self.reportFile)
+        
+        
+    def _session(self, device):
+        target = deviceTarget(device)
+        if self.sessions[target] is None:
+            self.sessions[target] = self.sessionFactory()
+        session = self.sessions[target]
+        if self.devices.get(target) != device:
+            session.do('set_device ' + device, errmsgs=['DONE status = 0', 'The debug hub core was not detected.'])
+            self.devices[target] = device
+        return session
+        
+        
+    def _tuneLane(self, laneId, lane, report):
+        job = dict(jobDefaults, stages=self.stages, retries=self.retries)
+        job.update(lane)
+        targets = self._targets(job)
+        failed = set()
+        startTime = time.time()
+        entry = {'lane': laneId, 'name': job.get('name', 'lane{}'.format(laneId)), 'txDevice': job['txDevice'],
+            'txSio': job['txSio'], 'rxDevice': job.get('rxDevice', job['txDevice']), 'rxSio': job['rxSio'], 'attempts': 0}
+        while True:
+            entry['attempts'] += 1
+            vivadoTX = vivadoRX = None
+            try:
+                vivadoTX = self._session(entry['txDevice'])
+                vivadoRX = self._session(entry['rxDevice'])
+                entry['best'], entry['openArea'] = runJob(vivadoTX, vivadoRX, job, prefix=entry['name'] + '_')
+                entry.pop('error', None)
+                failed = set()
+                break
+            except Exception as e:
+                logging.error('Lane {} failed: {}'.format(laneId, e))
+                entry['error'] = str(e)
+                # The state of the sessions is unknown: drop them.
+                failed = targets
+                if entry['attempts'] > job['retries'] or not vivadoCrashed(e, [vivadoTX, vivadoRX]):
+                    break
+                logging.warning('Lane {}: Vivado crashed, restarting it (attempt {} of {})'.format(laneId,
+                    entry['attempts'] + 1, job['retries'] + 1))
+                self._restart(targets)
+        entry['seconds'] = time.time() - startTime
+        self._done(laneId, entry, report)
+        self._release(targets, failed)
+        
+        
+    def run(self, lanes):
+        ''' Tunes all lanes and returns the report: one dict per lane (lane, name, txDevice, txSio,
+        rxDevice, rxSio, attempts, best settings, openArea, seconds or error).
+        '''
+        for lane in lanes:
+            if len(self._targets(lane)) > self.maxSessions:
+                raise Exception('Lane {} needs more sessions than the pool size ({})'.format(lane, self.maxSessions))
+        
+        report = [None] * len(lanes)
+        pending = list(enumerate(lanes))
+        threads = []
+        with self.lock:
+            while pending:
+                # Start the first lane in order which can run now.
+                for k, (laneId, lane) in enumerate(pending):
+                    if self._reserve(self._targets(lane)):
+                        break
+                else:
+                    self.lock.wait()
+                    continue
+                pending.pop(k)
+                thread = threading.Thread(target=self._tuneLane, args=(laneId, lane, report))
+                thread.start()
+                threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return report
+        
+        
+    def close(self):
+        for session in self.sessions.values():
+            if session is not None:
+                session.exit()
+        self.sessions = {}
+        self.devices = {}
+
+
+def printLaneReport(report):
+    for entry in report:
+        if 'error' in entry:
+            print('Lane {}  {} -> {}  ERROR: {}'.format(entry['name'], entry['txSio'], entry['rxSio'], entry['error']))
+        else:
+            settings = ' '.join('{}={}'.format(k, v) for k, v in entry['best'].items())
+            print('Lane {}  {} -> {}  OpenArea: {}  {}  ({:.1f} s, {} attempts)'.format(entry['name'], entry['txSio'],
+                entry['rxSio'], entry['openArea'], settings, entry['seconds'], entry['attempts']))
+
+
+def tuneLanes(lanesFile, maxSessions=2, stages=None, reportFile=None, useDaemon=False, retries=0, sessionFactory=None):
+    ''' Tunes the lanes of a job file (see readJobFile) without any interaction and writes the
+    report to reportFile (json). With useDaemon the sessions are leased from the cleye daemon.
+    '''
+    lanes = readJobFile(lanesFile)
+    if sessionFactory is None:
+        sessionFactory = RemoteVivado if useDaemon else startVivado
+    scheduler = LaneScheduler(maxSessions, sessionFactory, stages, retries, reportFile)
+    try:
+        report = scheduler.run(lanes)
+    finally:
+        scheduler.close()
+    printLaneReport(report)
+    return report
+
+
+# Local address of the cleye daemon. (See VivadoDaemon)
+daemonAddress = ('127.0.0.1', 51973)
+# The access token of the daemon, readable by its user only. (See VivadoDaemon)
+daemonTokenFile = os.path.join(os.path.expanduser('~'), '.cleye', 'daemon.token')
+
+
+def writeDaemonToken(tokenFile=daemonTokenFile):
+    ''' Writes a new random access token of the daemon to tokenFile (0600, in a 0700 directory).
+    Returns the token.
+    '''
+    token = secrets.token_hex(32)
+    directory = os.path.dirname(tokenFile)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    if os.path.exists(tokenFile):
+        os.remove(tokenFile)
+    fd = os.open(tokenFile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+
+def readDaemonToken(tokenFile=daemonTokenFile):
+    with open(tokenFile) as f:
+        return f.read().strip()
+
+
+class SessionPool():
+    ''' Pool of warmed-up Vivado sessions (started and sourceme.tcl sourced, so the hardware
+    manager is open and connected).
+    
+    At least minSessions sessions are kept warm, at most maxSessions exist. A maintenance thread
+    checks the health of the idle sessions every checkInterval seconds, restarts the dead ones
+    and evicts the sessions idle for longer than idleTimeout (down to minSessions).
+    '''
+    def __init__(self, maxSessions=4, minSessions=1, idleTimeout=1800, checkInterval=30, sessionFactory=startVivado):
+        self.maxSessions = maxSessions
+        self.minSessions = minSessions
+        self.idleTimeout = idleTimeout
+        self.checkInterval = checkInterval
+        self.sessionFactory = sessionFactory
+        self.lock = threading.Condition()
+        # The idle sessions as [session, idle since] pairs (the most recently used is the last).
+        self.idle = []
+        self.count = 0
+        self.stopped = threading.Event()
+        self.maintainer = threading.Thread(target=self._maintain)
+        self.maintainer.daemon = True
+        
+        
+    def start(self):
+        self._fill()
+        self.maintainer.start()
+        
+        
+    def _spawn(self):
+        ''' Spawns a new session. The slot must have been counted before. (Called without the lock.)
+        '''
+        try:
+            session = self.sessionFactory()
+        except Exception:
+            with self.lock:
+                self.count -= 1
+                self.lock.notify_all()
+            raise
+        return session
+        
+        
+    def _fill(self):
+        while True:
+            with self.lock:
+                if self.count >= self.minSessions:
+                    return
+                self.count += 1
+            session = self._spawn()
+            self.release(session)
+        
+        
+    def lease(self, timeout=None):
+        ''' Returns an idle session, spawns a new one or waits for a released one.
+        '''
+        with self.lock:
+            while not self.idle and self.count >= self.maxSessions:
+                if not self.lock.wait(timeout):
+                    raise Exception('No free Vivado session in {} s'.format(timeout))
+            if self.idle:
+                return self.idle.pop()[0]
+            self.count += 1
+        return self._spawn()
+        
+        
+    def release(self, session):
+        with self.lock:
+            self.idle.append([session, time.time()])
+            self.lock.notify_all()
+            
+            
+    def discard(self, session):
+        ''' Drops a leased (broken) session. '''
+        self._exit(session)
+        with self.lock:
+            self.count -= 1
+            self.lock.notify_all()
+        
+        
+    @staticmethod
+    def _exit(session):
+        try:
+            session.exit()
+        except Exception:
+            pass
+            
+            
+    @staticmethod
+    def healthy(session):
+        if session.childProc.terminated:
+            return False
+        try:
+            session.do('', timeout=10)
+        except Exception:
+            return False
+        return True
+        
+        
+    def _maintain(self):
+        while not self.stopped.wait(self.checkInterval):
+            self.check()
+            
+            
+    def check(self):
+        ''' Checks the health of the idle sessions, restarts the dead ones and evicts the sessions
+        idle for longer than idleTimeout.
+        '''
+        with self.lock:
+            checked = self.idle
+            self.idle = []
+        alive = []
+        for session, since in checked:
+            if self.healthy(session):
+                alive.append([session, since])
+                continue
+            logging.warning('Restarting a dead Vivado session')
+            self._exit(session)
+            try:
+                alive.append([self.sessionFactory(), time.time()])
+            except Exception:
+                logging.error('Cannot restart the Vivado session: ' + traceback.format_exc())
+                with self.lock:
+                    self.count -= 1
+        
+        # Evict the sessions idle for too long (the oldest first), but keep minSessions.
+        now = time.time()
+        evicted = []
+        alive.sort(key=lambda entry: entry[1])
+        with self.lock:
+            while alive and now - alive[0][1] > self.idleTimeout and self.count > self.minSessions:
+                evicted.append(alive.pop(0)[0])
+                self.count -= 1
+            self.idle = alive + self.idle
+            self.lock.notify_all()
+        for session in evicted:
+            self._exit(session)
+        self._fill()
+            
+            
+    def stop(self):
+        self.stopped.set()
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+        for session, _ in idle:
+            self._exit(session)
+            
+            
+    def status(self):
+        with self.lock:
+            return {'sessions': self.count, 'idle': len(self.idle), 'maxSessions': self.maxSessions}
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    ''' Serves one client connection of the daemon: json requests and replies, one per line.
+     - {"op": "auth", "token": ...}: must be the first request, the connection is closed if the
+       token is not the one of the daemon
+     - {"op": "lease"}: leases a session for this connection
+     - {"op": "do", "cmd": ..., "errmsgs": [...], "timeout": ...}: runs a command on the leased session
+     - {"op": "release"}: releases the leased session (also done when the connection is closed)
+     - {"op": "status"}: returns the state of the pool
+    '''
+    def handle(self):
+        pool = self.server.pool
+        session = None
+        if not self._authenticate():
+            return
+        try:
+            for line in self.rfile:
+                request = json.loads(line.decode('utf-8'))
+                reply = {}
+                try:
+                    if request['op'] == 'lease':
+                        if session is None:
+                            session = pool.lease(request.get('timeout'))
+                    elif request['op'] == 'release':
+                        if session is not None:
+                            pool.release(session)
+                            session = None
+                    elif request['op'] == 'status':
+                        reply = pool.status()
+                    elif request['op'] == 'do':
+                        if session is None:
+                            raise Exception('No leased session')
+                        try:
+                            session.do(request['cmd'], vivadoPrompt if request.get('prompt', True) else None,
+                                errmsgs=request.get('errmsgs', []), timeout=request.get('timeout', -1))
+                        finally:
+                            reply['before'] = session.childProc.before
+                    else:
+                        raise Exception('Unknown request: ' + request['op'])
+                except Exception as e:
+                    reply['error'] = str(e)
+                    if session is not None and session.childProc.terminated:
+                        pool.discard(session)
+                        session = None
+                self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+                self.wfile.flush()
+        finally:
+            if session is not None:
+                # A session with a command in flight cannot be reused.
+                if pool.healthy(session):
+                    pool.release(session)
+                else:
+                    pool.discard(session)
+                    
+                    
+    def _authenticate(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            token = str(request.get('token', '')) if request.get('op') == 'auth' else ''
+        except ValueError:
+            token = ''
+        if not hmac.compare_digest(token.encode('utf-8'), self.server.token.encode('utf-8')):
+            logging.warning('Rejected a client of the daemon: wrong access token')
+            self.wfile.write((json.dumps({'error': 'Wrong access token'}) + '\n').encode('utf-8'))
+            return False
+        self.wfile.write(b'{}\n')
+        self.wfile.flush()
+        return True
+
+
+class VivadoDaemon(socketserver.ThreadingTCPServer):
+    ''' Long-lived local daemon serving leases of warmed-up Vivado sessions. (See RemoteVivado)
+    
+    The daemon runs arbitrary Tcl commands for its clients, so only the clients which can read the
+    access token of the daemon are served: it is written to tokenFile (readable by the user of the
+    daemon only) at every start.
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, address=daemonAddress, pool=None, tokenFile=daemonTokenFile):
+        socketserver.ThreadingTCPServer.__init__(self, address, _DaemonHandler)
+        self.pool = pool if pool is not None else SessionPool()
+        self.token = writeDaemonToken(tokenFile)
+        
+        
+    def serve(self):
+        self.pool.start()
+        logging.info('cleye daemon is listening on {}:{}'.format(*self.server_address))
+        try:
+            self.serve_forever()
+        finally:
+            self.pool.stop()
+
+
+class _RemoteChild():
+    def __init__(self):
+        self.before = ''
+        self.terminated = False
+
+
+class RemoteVivado(Vivado):
+    ''' A Vivado session leased from the cleye daemon.
+    It has the interface of Vivado: the commands are forwarded to the leased session through the
+    local socket of the daemon. exit releases the lease (the session stays warm in the daemon).
+    The access token of the daemon is read from tokenFile.
+    '''
+    def __init__(self, address=daemonAddress, timeout=None, tokenFile=daemonTokenFile):
+        self.childProc = _RemoteChild()
+        self.transcriptSession = transcript.newSession('daemon', [str(address)]) if transcript.enabled else None
+        self.transcriptSeq = -1
+        self.sock = socket.create_connection(address)
+        self.file = self.sock.makefile('rwb')
+        self._request({'op': 'auth', 'token': readDaemonToken(tokenFile)})
+        self._request({'op': 'lease', 'timeout': timeout})
+        
+        
+    def _request(self, request):
+        self.file.write((json.dumps(request) + '\n').encode('utf-8'))
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            self.childProc.terminated = True
+            raise Exception('The cleye daemon closed the connection.')
+        reply = json.loads(line.decode('utf-8'))
+        if 'before' in reply:
+            self.childProc.before = reply['before']
+        if 'error' in reply:
+            logging.error(reply['error'])
+            raise Exception(reply['error'])
+        return reply
+        
+        
+    def waitStartup(self):
+        pass
+        
+        
+    def do(self, cmd, prompt=vivadoPrompt, puts=False, errmsgs=[], timeout=-1):
+        if self.childProc.terminated:
+            logging.error('The lease has been released. Sending command is not possible.')
+            raise Exception('The lease has been released. Sending command is not possible.')
+        begin = time.time()
+        with tracer.span(_commandVerb(cmd), 'vivado') if tracer.enabled else _noSpan:
+            self._request({'op': 'do', 'cmd': cmd, 'prompt': bool(prompt), 'errmsgs': errmsgs, 'timeout': timeout})
+        if transcript.enabled:
+            self._record('do', begin, cmd=cmd, prompt=bool(prompt), before=self.childProc.before, match=vivadoPrompt)
+        if puts:
+            print(cmd, end='')
+            print(self.childProc.before, end='')
+            print(vivadoPrompt, end='')
+        
+        
+    def exit(self):
+        if self.childProc.terminated:
+            logging.warning('This lease has been released.')
+            return None
+        try:
+            self._request({'op': 'release'})
+        finally:
+            self.childProc.terminated = True
+            self.file.close()
+            self.sock.close()
+        return 0
+
+
+class ReplayMismatch(Exception):
+    pass
+
+
+class ReplayVivado(Vivado):
+    ''' A Vivado session replayed from a transcript (see TranscriptRecorder).
+    
+    It has the interface of Vivado: every command gets its recorded output (immediately, or after
+    its recorded duration if realtime), and the scan files produced by the command are written
+    again. strict replays the commands in the recorded order and raises ReplayMismatch if another
+    command is sent. Otherwise the outputs are looked up by the command (the repeated commands get
+    their outputs in the recorded order, the last one is repeated), so a changed finder can be run
+    as long as it sends recorded commands only.
+    '''
+    _batchToken = re.compile(r'set __cleye_batch (\w+)')
+    
+    def __init__(self, events, strict=True, realtime=False):
+        self.childProc = _RemoteChild()
+        self.transcriptSession = None
+        self.transcriptSeq = -1
+        self.strict = strict
+        self.realtime = realtime
+        self.startup = None
+        self.commands = []
+        self.files = collections.defaultdict(list)
+        for event in events:
+            if event['kind'] == 'startup':
+                self.startup = event
+            elif event['kind'] == 'do':
+                self.commands.append(event)
+            elif event['kind'] == 'file':
+                self.files[event['seq']].append(event)
+        self.position = 0
+        self.byCommand = collections.defaultdict(collections.deque)
+        for event in self.commands:
+            self.byCommand[self._key(event['cmd'])].append(event)
+        
+        
+    def _key(self, cmd):
+        return self._batchToken.sub('set __cleye_batch <token>', cmd)
+        
+        
+    def _next(self, cmd):
+        if self.strict:
+            if self.position >= len(self.commands):
+                raise ReplayMismatch('Replay ended, unexpected command: ' + cmd)
+            event = self.commands[self.position]
+            if self._key(event['cmd']) != self._key(cmd):
+                raise ReplayMismatch('Replay diverged at command {}: {!r} was recorded, {!r} was sent'.format(
+                    self.position, event['cmd'], cmd))
+            self.position += 1
+            return event
+        events = self.byCommand.get(self._key(cmd))
+        if not events:
+            raise ReplayMismatch('Command not in the transcript: ' + cmd)
+        return events.popleft() if len(events) > 1 else events[0]
+        
+        
+    def waitStartup(self):
+        if self.startup is not None:
+            self.childProc.before = self.startup['before']
+        
+        
+    def do(self, cmd, prompt=vivadoPrompt, puts=False, errmsgs=[], timeout=-1):
+        if self.childProc.terminated:
+            logging.error('The replay has been terminated. Sending command is not possible.')
+            raise Exception('The replay has been terminated. Sending command is not possible.')
+        with tracer.span(_commandVerb(cmd), 'vivado') if tracer.enabled else _noSpan:
+            event = self._next(cmd)
+            if self.realtime:
+                time.sleep(event['dt'])
+        before = event['before']
+        # The batches are sent with a new sentinel token (see doBatch).
+        recorded, sent = self._batchToken.search(event['cmd']), self._batchToken.search(cmd)
+        if recorded and sent:
+            before = before.replace(recorded.group(1), sent.group(1))
+        self.childProc.before = before
+        for f in self.files.get(event['seq'], []):
+            dirname = os.path.dirname(f['path'])
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            with open(f['path'], 'w', newline='') as out:
+                out.write(f['data'])
+        if prompt:
+            for em in errmsgs:
+                if em in before:
+                    logging.error('during running command: ' + cmd + before)
+                    raise Exception('during running command: ' + cmd + before)
+        if puts:
+            print(cmd, end='')
+            print(before, end='')
+            print(event['match'], end='')
+        
+        
+    def exit(self):
+        self.childProc.terminated = True
+        return 0
+
+
+def replaySessions(filename, strict=True, realtime=False):
+    ''' Loads a transcript. Returns the ReplayVivado of every recorded session (in the order of
+    their spawn).
+    '''
+    sessions = collections.OrderedDict()
+    with open(filename) as f:
+        for line in f:
+            event = json.loads(line)
+            sessions.setdefault(event['session'], []).append(event)
+    return [ReplayVivado(events, strict, realtime) for _, events in sorted(sessions.items())]
+
+
+async def asyncTuning(stages=None, reuseTtl=0, ordered=False, dwellSchedule=None, timeBudget=None, monitored=False,
+        rediscover=False):
+    ''' asyncio version of interactiveTuning (independent_finder in two Vivado instances).
+    The two Vivado instances start up and source the TCL procedures at the same time. The devices
+    come from the cached HardwareTopology, the new targets (all of them with rediscover) are opened
+    by both instances. The options of the finder are the same as of interactiveTuning. Errors are
+    handled like in interactiveTuning. Returns the (blocking) Vivado instances for the interactive
+    console (see finishTuning).
+    '''
+    print(cleyeLogo)
+    
+    asyncTX, asyncRX = AsyncVivado(), AsyncVivado()
+    try:
+        logging.info('Spawning Vivado instances (TX/RX) and waiting for their startup')
+        await asyncio.gather(asyncTX.spawn(), asyncRX.spawn())
+        await asyncio.gather(asyncTX.startup(), asyncRX.startup())
+        
+        logging.info('Exploring target devices (new targets are opened: this can take a while)')
+        topology = HardwareTopology()
+        with tracer.span('topology', 'startup'):
+            devices = await AsyncVivado.runExclusive([asyncRX, asyncTX], topology.refresh,
+                [asyncRX.vivado, asyncTX.vivado], rediscover)
+        if not devices:
+            logging.error('No target device found. Please connect and power up your device(s)')
+            raise Exception('No target device found.')
+        
+        def chooseLink():
+            # The user interaction is sequential anyway.
+            txDevice = asyncTX.vivado.chooseDevice(devices, 'TX')
+            topology.verify(asyncTX.vivado, txDevice)
+            rxDevice = asyncRX.vivado.chooseDevice(devices, 'RX')
+            topology.verify(asyncRX.vivado, rxDevice)
+            txSio = asyncTX.vivado.chooseSio('TX', createLink=False, sios=_deviceSios(asyncTX.vivado, topology, txDevice))
+            rxSio = asyncRX.vivado.chooseSio('RX', sios=_deviceSios(asyncRX.vivado, topology, rxDevice))
+            return txSio, rxSio
+        txSio, rxSio = await AsyncVivado.runExclusive([asyncRX, asyncTX], chooseLink)
+        
+        store = ScanResultStore(ttl=reuseTtl)
+        await async_independent_finder(asyncTX, asyncRX, txSio, stages, rxSio, store, ordered=ordered,
+            dwellSchedule=dwellSchedule, timeBudget=timeBudget, monitored=monitored)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print('Exiting to VivadoTX')
+        asyncTX.vivado.exit()
+        print('Exiting to VivadoRX')
+        asyncRX.vivado.exit()
+    except Exception:
+        traceback.print_exc()
+    return asyncTX.vivado, asyncRX.vivado
+
+
+def main(argv=None):
+    global scanTransfer, archiveScans, discoverSpaces
+    parser = argparse.ArgumentParser(description='Eye cleaner for Xilinx IBERT core.')
+    subparsers = parser.add_subparsers(dest='command')
+    
+    tuneParser = subparsers.add_parser('tune', help='Tune a link interactively (default).')
+    tuneParser.add_argument('--keep', type=int, default=0,
+        help='Screen all candidates with a fast bathtub scan and rescan only the best KEEP at full resolution.')
+    tuneParser.add_argument('--strategy', default='independent', choices=['independent'] + sorted(searchStrategies),
+        help='Sweep TXDIFFSWING alone (independent) or search TXDIFFSWING/TXPRE/TXPOST/RXTERM jointly.')
+    tuneParser.add_argument('--max-scans', type=int, default=100, help='Scan budget of the joint search.')
+    tuneParser.add_argument('--reuse-ttl', type=float, default=0,
+        help='Reuse the stored results of the same settings measured in the last REUSE_TTL seconds.')
+    tuneParser.add_argument('--single-session', action='store_true',
+        help='Use one Vivado instance for the TX and the RX side and run the sweeps inside Vivado.')
+    tuneParser.add_argument('--daemon', action='store_true', help='Lease the Vivado sessions from the cleye daemon.')
+    tuneParser.add_argument('--async', dest='useAsync', action='store_true',
+        help='Start the TX/RX instances concurrently and score the scans in the background. '
+        '(Not with --strategy, --single-session and --daemon.)')
+    tuneParser.add_argument('--ordered', action='store_true',
+        help='Search the ordered property tables (golden-section, then local refinement) instead of sweeping them.')
+    tuneParser.add_argument('--dwell', nargs='*', default=None, metavar='BER',
+        help='Rescan the tied leaders at deeper dwell BER levels. (default levels: {})'.format(' '.join(defaultDwellSchedule)))
+    tuneParser.add_argument('--time-budget', type=float, default=None,
+        help='Skip the dwell BER levels which would not fit into TIME_BUDGET seconds.')
+    tuneParser.add_argument('--monitor', action='store_true',
+        help='Follow the running scans and stop them as soon as they cannot beat the best result.')
+    tuneParser.add_argument('--rediscover', action='store_true',
+        help='Open all targets to list their devices instead of using the cached hardware topology.')
+    tuneParser.add_argument('--console-scans', action='store_true',
+        help='Transfer the scans over the Vivado console instead of reading back their csv files.')
+    tuneParser.add_argument('--no-archive', action='store_true',
+        help='Do not write the csv files of the scans transferred over the console.')
+    tuneParser.add_argument('--no-discovery', action='store_true',
+        help='Use the built-in property tables instead of listing the legal values from the device.')
+    tuneParser.add_argument('--trace', default=None,
+        help='Write the timing spans of the phases to TRACE (Chrome trace json) and print their summary.')
+    tuneParser.add_argument('--record', default=None,
+        help='Record the Vivado sessions (commands, outputs, timings and scan files) to RECORD (jsonl).')
+    
+    analyzeParser = subparsers.add_parser('analyze', help='Analyze a directory tree of scan csv files.')
+    analyzeParser.add_argument('directory', help='Root directory of the scan files.')
+    analyzeParser.add_argument('-o', '--output', default='summary.csv', help='Summary table (csv) to write.')
+    analyzeParser.add_argument('-j', '--processes', type=int, default=None,
+        help='Number of worker processes. (default: number of CPU cores)')
+    analyzeParser.add_argument('--metrics', action='store_true',
+        help='Add the eye metrics (contours, inner area, mask margin, bathtub extrapolation) and the rank of the scans.')
+    
+    catalogParser = subparsers.add_parser('catalog', help='Index the scan files of a directory tree and search them.')
+    catalogParser.add_argument('directory', nargs='?', default='runs', help='Root directory of the scan files.')
+    catalogParser.add_argument('--gt-type', default=None, help='GT Type of the scans (eg. "7 Series GTX").')
+    catalogParser.add_argument('--sw-version', default=None, help='SW Version of the scans (eg. 2017.4).')
+    catalogParser.add_argument('--min-open-area', type=float, default=None, help='Minimum Open Area of the scans.')
+    catalogParser.add_argument('--days', type=float, default=None, help='Scans started in the last DAYS days.')
+    catalogParser.add_argument('--where', default=None, help='SQL condition on the catalog columns instead of the filters.')
+    catalogParser.add_argument('--limit', type=int, default=None, help='Print LIMIT scans at most.')
+    
+    lanesParser = subparsers.add_parser('lanes', help='Tune many TX/RX lanes in parallel.')
+    lanesParser.add_argument('lanes', help='Json file of the lanes (list of txDevice, txSio, rxDevice, rxSio dicts, see readJobFile).')
+    lanesParser.add_argument('-j', '--sessions', type=int, default=2, help='Maximum number of Vivado sessions.')
+    lanesParser.add_argument('-o', '--output', default='lanes_report.json', help='Report file (json).')
+    lanesParser.add_argument('--daemon', action='store_true', help='Lease the Vivado sessions from the cleye daemon.')
+    lanesParser.add_argument('--trace', default=None,
+        help='Write the timing spans of the phases to TRACE (Chrome trace json) and print their summary.')
     
+    runParser = subparsers.add_parser('run', help='Run the tuning jobs of a job file without interaction.')
+    runParser.add_argument('jobs', help='Json file of the jobs (lanes and their tuning settings, see readJobFile).')
+    runParser.add_argument('-j', '--sessions', type=int, default=2, help='Maximum number of Vivado sessions.')
+    runParser.add_argument('-o', '--output', default='results.json', help='Results file (json), updated after every job.')
+    runParser.add_argument('--retries', type=int, default=1, help='Rerun a job RETRIES times if its Vivado crashed.')
+    runParser.add_argument('--daemon', action='store_true', help='Lease the Vivado sessions from the cleye daemon.')
+    runParser.add_argument('--trace', default=None,
+        help='Write the timing spans of the phases to TRACE (Chrome trace json) and print their summary.')
+    runParser.add_argument('--record', default=None,
+        help='Record the Vivado sessions (commands, outputs, timings and scan files) to RECORD (jsonl).')
     
+    daemonParser = subparsers.add_parser('daemon', help='Serve warmed-up Vivado sessions on a local socket.')
+    daemonParser.add_argument('--sessions', type=int, default=4, help='Maximum number of Vivado sessions.')
+    daemonParser.add_argument('--min-sessions', type=int, default=1, help='Number of sessions kept warm.')
+    daemonParser.add_argument('--idle-timeout', type=float, default=1800, help='Evict sessions idle for IDLE_TIMEOUT seconds.')
+    daemonParser.add_argument('--port', type=int, default=daemonAddress[1], help='Local TCP port of the daemon.')
+    
+    args = parser.parse_args(argv)
+    
+    if getattr(args, 'console_scans', False):
+        scanTransfer = 'console'
+    if getattr(args, 'no_archive', False):
+        archiveScans = False
+    if getattr(args, 'no_discovery', False):
+        discoverSpaces = False
+    trace = getattr(args, 'trace', None)
+    if trace:
+        tracer.enable()
+    if getattr(args, 'record', None):
+        transcript.start(args.record)
+    try:
+        if args.command == 'analyze':
+            analyzeDirectory(args.directory, args.output, args.processes, args.metrics)
+        elif args.command == 'catalog':
+            searchCatalog(args)
+        elif args.command == 'lanes':
+            tuneLanes(args.lanes, args.sessions, reportFile=args.output, useDaemon=args.daemon)
+        elif args.command == 'run':
+            report = tuneLanes(args.jobs, args.sessions, reportFile=args.output, useDaemon=args.daemon,
+                retries=args.retries)
+            if [entry for entry in report if 'error' in entry]:
+                sys.exit(1)
+        elif args.command == 'daemon':
+            pool = SessionPool(args.sessions, args.min_sessions, args.idle_timeout)
+            VivadoDaemon((daemonAddress[0], args.port), pool).serve()
+        else:
+            stages = None
+            if getattr(args, 'keep', 0):
+                stages = [dict(stage) for stage in coarseToFineScanStages]
+                stages[0]['keep'] = args.keep
+            dwellSchedule = getattr(args, 'dwell', None)
+            if dwellSchedule is not None and not dwellSchedule:
+                dwellSchedule = defaultDwellSchedule
+            if getattr(args, 'useAsync', False):
+                # The async driver runs independent_finder in two spawned instances.
+                unsupported = [option for option, used in [('--strategy', args.strategy != 'independent'),
+                    ('--single-session', args.single_session), ('--daemon', args.daemon)] if used]
+                if unsupported:
+                    tuneParser.error('--async cannot be used with ' + ', '.join(unsupported))
+                vivadoTX, vivadoRX = asyncio.run(asyncTuning(stages, args.reuse_ttl, args.ordered, dwellSchedule,
+                    args.time_budget, args.monitor, args.rediscover))
+                if vivadoTX is not None and vivadoRX is not None:
+                    finishTuning(vivadoTX, vivadoRX)
+            else:
+                interactiveTuning(stages, getattr(args, 'strategy', 'independent'), getattr(args, 'max_scans', 100),
+                    getattr(args, 'reuse_ttl', 0), getattr(args, 'single_session', False), getattr(args, 'daemon', False),
+                    getattr(args, 'ordered', False), dwellSchedule, getattr(args, 'time_budget', None),
+                    getattr(args, 'monitor', False), getattr(args, 'rediscover', False))
+    finally:
+        if trace:
+            tracer.writeChromeTrace(trace)
+            tracer.printSummary()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,12 +10,14 @@ DESCRIPTION = 'Eye cleaner for Xilinx IBERT core.'
 URL = 'https://github.com/raczben/cleye'
 EMAIL = 'betontalpfa@gmail.com'
 AUTHOR = 'Benedek Racz'
-REQUIRES_PYTHON = '>=2.7.0'
+REQUIRES_PYTHON = '>=3.7.0'
 VERSION = '0.0.1'
 
 # What packages are required for this module to be executed?
 REQUIRED = [
-    'wexpect>=0.0.2',
+    'wexpect>=0.0.2; platform_system=="Windows"',
+    'pexpect; platform_system!="Windows"',
+    'numpy',
 ]
 
 # What packages are optional?
@@ -123,6 +125,9 @@ setuptools.setup(
     url=URL,
     packages=['.'],
 
+    entry_points={
+        'console_scripts': ['cleye=cleye:main'],
+    },
     install_requires=REQUIRED,
     extras_require=EXTRAS,
     include_package_data=True,
@@ -132,8 +137,7 @@ setuptools.setup(
         # Full list: https://pypi.python.org/pypi?%3Aaction=list_classifiers
         'License :: OSI Approved :: GPL License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
         'Programming Language :: Python :: Implementation :: CPython',
         'Programming Language :: Python :: Implementation :: PyPy'
     ],
@@ -42,17 +42,7 @@ proc fetch_devices { } {
     } else {
         for {set i 0} {$i < [llength $targets]} {incr i} {
             set trg [lindex $targets $i]
-            close_hw_target -quiet
-            puts "Opening target for side: $trg"
-            # Run quietly to prevent errors when it already opened.
-            open_hw_target $trg -quiet
-            
-            set devices [get_hw_devices]
-            for {set j 0} {$j < [llength $devices]} {incr j} {
-                set dev [lindex $devices $j]
-                # current_hw_device $dev
-                lappend allDevices [list $trg $dev]
-            }
+            set allDevices [concat $allDevices [fetch_target_devices $trg]]
         }
     }
     puts $allDevices    
@@ -60,6 +50,26 @@ proc fetch_devices { } {
 }
 
 
+# Opens a target and lists its devices. Prints one line per device:
+# target_device<TAB>target<TAB>device<TAB>idcode
+# and returns the list of {target device} lists.
+proc fetch_target_devices { trg } {
+    set allDevices [list]
+    close_hw_target -quiet
+    puts "Opening target for side: $trg"
+    # Run quietly to prevent errors when it already opened.
+    open_hw_target $trg -quiet
+    
+    set devices [get_hw_devices]
+    for {set j 0} {$j < [llength $devices]} {incr j} {
+        set dev [lindex $devices $j]
+        puts "target_device\t$trg\t$dev\t[get_property IDCODE $dev]"
+        lappend allDevices [list $trg $dev]
+    }
+    return $allDevices
+}
+
+
 proc set_device { target device } {
     close_hw_target -quiet
     puts "Opening target: $target   $device"
@@ -114,18 +124,135 @@ proc fetch_sio { side } {
 }
 
 
-proc run_scan { scanFile {hincr 16} {vincr 16} {scanType "2d_full_eye"} {linkName "*"} } {
+# dwell is the DWELL_BER of the scan (eg. 1e-7), the default of Vivado is used if it is empty.
+proc run_scan { scanFile {hincr 16} {vincr 16} {scanType "2d_full_eye"} {linkName "*"} {dwell ""} } {
+    set xil_newScan [start_scan $hincr $vincr $scanType $linkName $dwell]
+
+    puts "Wait to finish..."
+    wait_on_hw_sio_scan $xil_newScan
+
+    write_hw_sio_scan $scanFile [get_hw_sio_scans $xil_newScan] -force
+}
+
+
+# Starts a scan like run_scan, but returns the scan without waiting for it. The running scan is
+# followed by poll_scan until it is finished, or stopped by stop_scan.
+proc start_scan { {hincr 16} {vincr 16} {scanType "2d_full_eye"} {linkName "*"} {dwell ""} } {
     set xil_newScan [create_hw_sio_scan -description {Scan 4} $scanType  [lindex [get_hw_sio_links $linkName] 0 ]]
-    set_property HORIZONTAL_INCREMENT {$hincr} [get_hw_sio_scans $xil_newScan]
+    set_property HORIZONTAL_INCREMENT $hincr [get_hw_sio_scans $xil_newScan]
     if { $scanType == "2d_full_eye" } {
-        set_property VERTICAL_INCREMENT   {$vincr} [get_hw_sio_scans $xil_newScan]
+        set_property VERTICAL_INCREMENT   $vincr [get_hw_sio_scans $xil_newScan]
+    }
+    if { $dwell != "" } {
+        set_property DWELL_BER $dwell [get_hw_sio_scans $xil_newScan]
     }
     run_hw_sio_scan [get_hw_sio_scans $xil_newScan]
+    return $xil_newScan
+}
 
-    puts "Wait to finish..."
-    wait_on_hw_sio_scan $xil_newScan
 
-    write_hw_sio_scan $scanFile [get_hw_sio_scans $xil_newScan] -force
+# Prints the (partial) result of a scan to the console. (See run_scan_stream)
+proc print_scan { scanName scan } {
+    set tmpFile [file join [pwd] ".cleye_scan_[pid].csv"]
+    write_hw_sio_scan $tmpFile [get_hw_sio_scans $scan] -force
+    
+    set f [open $tmpFile r]
+    set data [read $f]
+    close $f
+    file delete $tmpFile
+    
+    puts "scan_data_begin\t$scanName"
+    puts -nonewline $data
+    puts "scan_data_end"
+}
+
+
+# Waits pollMs milliseconds (or until the scan is finished), then prints the progress of a running
+# scan:
+# scan_progress<TAB>progress<TAB>status
+# followed by its partial result (the columns scanned so far, see print_scan). A finished scan is
+# finished by finish_scan instead (written to scanFile or printed if stream is true).
+proc poll_scan { scan scanFile {pollMs 1000} {stream 0} } {
+    set scanObj [get_hw_sio_scans $scan]
+    set step [expr {max(1, $pollMs / 10)}]
+    for {set t 0} {$t < $pollMs} {incr t $step} {
+        if { [string match "100*" [get_property PROGRESS $scanObj]] } {
+            break
+        }
+        after $step
+    }
+    set progress [get_property PROGRESS $scanObj]
+    puts "scan_progress\t$progress\t[get_property STATUS $scanObj]"
+    if { [string match "100*" $progress] } {
+        finish_scan $scan $scanFile $stream
+    } else {
+        print_scan $scan $scan
+    }
+}
+
+
+# Waits for a scan started by start_scan and writes it to scanFile (or prints it, if stream is true).
+proc finish_scan { scan scanFile {stream 0} } {
+    wait_on_hw_sio_scan $scan
+    if { $stream } {
+        print_scan $scanFile $scan
+    } else {
+        write_hw_sio_scan $scanFile [get_hw_sio_scans $scan] -force
+    }
+}
+
+
+# Stops a scan started by start_scan and removes it.
+proc stop_scan { scan } {
+    stop_hw_sio_scan [get_hw_sio_scans $scan]
+    remove_hw_sio_scan [get_hw_sio_scans $scan]
+}
+
+
+# Runs a scan like run_scan, but prints the scan csv to the console instead of keeping the file:
+# scan_data_begin<TAB>scanName
+# <the scan csv>
+# scan_data_end
+# (Vivado writes the scan only to files, so it is written to a temporary file and read back.)
+proc run_scan_stream { scanName {hincr 16} {vincr 16} {scanType "2d_full_eye"} {linkName "*"} {dwell ""} } {
+    set tmpFile [file join [pwd] ".cleye_scan_[pid].csv"]
+    run_scan $tmpFile $hincr $vincr $scanType $linkName $dwell
+    
+    set f [open $tmpFile r]
+    set data [read $f]
+    close $f
+    file delete $tmpFile
+    
+    puts "scan_data_begin\t$scanName"
+    puts -nonewline $data
+    puts "scan_data_end"
+}
+
+
+# Sweeps a property of a hw_sio_gt: for every {value scanFile} pair of points it sets, commits and
+# reads back the property, then scans the link to scanFile. Prints one line per point:
+# sweep_point<TAB>value<TAB>readback<TAB>scanFile
+# and returns the list of {value readback scanFile} lists.
+# If stream is true, the scans are printed to the console by run_scan_stream instead of writing them
+# to the files. dwell is the DWELL_BER of the scans (see run_scan).
+proc sweep_property { sio propName points {hincr 16} {vincr 16} {scanType "2d_full_eye"} {linkName "*"} {stream 0} {dwell ""} } {
+    set sioGt [get_hw_sio_gts $sio]
+    set results [list]
+    foreach {value scanFile} $points {
+        set_property $propName $value $sioGt
+        commit_hw_sio $sioGt
+        set readback [get_property $propName $sioGt]
+        
+        if { $stream } {
+            run_scan_stream $scanFile $hincr $vincr $scanType $linkName $dwell
+        } else {
+            run_scan $scanFile $hincr $vincr $scanType $linkName $dwell
+        }
+        
+        puts "sweep_point\t$value\t$readback\t$scanFile"
+        lappend results [list $value $readback $scanFile]
+    }
+    return $results
 }
 
 
@@ -0,0 +1,220 @@
+# This file is part of cleye.
+#
+#     Cleye is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Foobar is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+''' Micro-benchmarks of the scan analysis path on synthetic scan files.
+
+The 1D bathtub and 2D statistical scans are generated by the eye model of the Vivado simulator
+(vivado_sim.py) at every increment from 1 to 16, plus a large batch of 2D scans. For every group
+the parsing (readCsv without cache, _parsescanRows) and the analysis (_testEye, _getArea,
+getOpenArea and the batch eyeMetrics) are timed separately and reported as grid cells per second, with the peak traced
+memory of the parsing.
+
+The results (throughputs and the open areas) can be saved as a baseline, and later runs can be
+compared against it: a throughput drop by more than the tolerance or a changed open area is a
+regression (exit code 1).
+
+Usage:
+    python analysis_bench.py [--files N] [--batch N] [--save-baseline FILE] [--baseline FILE]
+'''
+
+from __future__ import print_function
+
+# Import build in modules
+#  - sys manipulate python path
+#  - os needed for file and directory manipulation
+#  - csv read the raw rows for _parsescanRows
+#  - argparse, json command line and the baseline file
+#  - time, tracemalloc measure the speed and the memory
+#  - logging silence the analysis
+#  - shutil, tempfile generate the scans in a temporary directory
+import sys
+import os
+import csv
+import argparse
+import json
+import time
+import tracemalloc
+import logging
+import shutil
+import tempfile
+
+import numpy as np
+
+# To import cleye we must add to path
+test_path = os.path.dirname(os.path.abspath(__file__))
+cleye_module_path = os.path.join(test_path, '..')
+sys.path.insert(0, cleye_module_path)
+
+# Import the DUT
+import cleye
+import vivado_sim
+
+
+benchmarks = ['readCsv', '_parsescanRows', '_testEye', '_getArea', 'getOpenArea', 'eyeMetrics']
+
+
+def generateScans(directory, files=4, batch=200, batchIncrement=8, seed=0):
+    ''' Generates the synthetic scan files. Returns an ordered list of (group name, file names).
+    The eye quality of the files is random (but reproducible by the seed).
+    '''
+    random = np.random.RandomState(seed)
+    groups = []
+
+    def generate(group, scanType, incr, count):
+        fnames = []
+        for i in range(count):
+            xCodes, yCodes = vivado_sim.scanAxes(scanType, incr, incr)
+            ber = vivado_sim.eyeBer(random.uniform(0.0, 1.0), xCodes, yCodes, random)
+            fname = os.path.join(directory, '{}_{}.csv'.format(group, i))
+            vivado_sim.writeScanFile(fname, ber, scanType, incr, incr)
+            fnames.append(fname)
+        groups.append((group, fnames))
+
+    for scanType, prefix in [('1d_bathtub', '1d'), ('2d_full_eye', '2d')]:
+        for incr in range(1, 17):
+            generate('{}_incr{:02d}'.format(prefix, incr), scanType, incr, files)
+    if batch:
+        generate('2d_batch{}_incr{:02d}'.format(batch, batchIncrement), '2d_full_eye', batchIncrement, batch)
+    return groups
+
+
+def rawRows(fname):
+    ''' Returns the raw (string) rows between 'Scan Start' and 'Scan End'.
+    '''
+    rows = []
+    with open(fname) as f:
+        inGrid = False
+        for row in csv.reader(f):
+            if row and row[0] == 'Scan Start':
+                inGrid = True
+            elif row and row[0] == 'Scan End':
+                break
+            elif inGrid and row:
+                rows.append(row)
+    return rows
+
+
+def timeit(func, items, repeat, minTime=0.02):
+    ''' Returns the best time of calling func on all items (out of repeat runs).
+    A run loops over the items until it takes minTime at least (the time of one loop is returned).
+    '''
+    def run(loops):
+        begin = time.perf_counter()
+        for _ in range(loops):
+            for item in items:
+                func(item)
+        return time.perf_counter() - begin
+
+    loops = 1
+    while run(loops) < minTime:
+        loops *= 2
+    return min(run(loops) for _ in range(repeat)) / loops
+
+
+def benchGroup(fnames, repeat):
+    ''' Benchmarks a group of scan files. Returns a dict of the metrics.
+    '''
+    readCsv = lambda f: cleye.readCsv(f, useCache=False)
+
+    tracemalloc.start()
+    structures = [readCsv(f) for f in fnames]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    rows = [rawRows(f) for f in fnames]
+    cells = sum(s['scanData']['values'].size for s in structures)
+    seconds = {
+        'readCsv': timeit(readCsv, fnames, repeat),
+        '_parsescanRows': timeit(cleye._parsescanRows, rows, repeat),
+        '_testEye': timeit(lambda s: cleye._testEye(s['scanData']), structures, repeat),
+        '_getArea': timeit(cleye._getArea, structures, repeat),
+        'getOpenArea': timeit(cleye.getOpenArea, structures, repeat),
+        # The batch engine measures the whole group at once.
+        'eyeMetrics': timeit(cleye.eyeMetrics, [structures], repeat),
+        }
+    return {
+        'files': len(fnames),
+        'cells': cells,
+        'cellsPerSecond': dict((name, cells / seconds[name] if seconds[name] else None) for name in benchmarks),
+        'peakBytes': peak,
+        'openAreas': [float(cleye.getOpenArea(s)) for s in structures],
+        }
+
+
+def compare(results, baseline, tolerance):
+    ''' Compares the results to the baseline. Returns the list of the regressions.
+    '''
+    regressions = []
+    for group, result in results.items():
+        if group not in baseline:
+            continue
+        base = baseline[group]
+        for name in benchmarks:
+            now, then = result['cellsPerSecond'][name], base['cellsPerSecond'].get(name)
+            if now and then and now < then * (1.0 - tolerance):
+                regressions.append('{} {}: {:.2f} Mcells/s (baseline {:.2f} Mcells/s)'.format(
+                    group, name, now / 1e6, then / 1e6))
+        if not np.allclose(result['openAreas'], base['openAreas'], rtol=1e-12, atol=0):
+            regressions.append('{}: the open areas differ from the baseline'.format(group))
+    return regressions
+
+
+def printReport(results):
+    print('{:<20} {:>6} {:>9} '.format('group', 'files', 'cells') +
+        ' '.join('{:>14}'.format(name) for name in benchmarks) + ' {:>9}'.format('peak MB'))
+    for group, r in results.items():
+        print('{:<20} {:>6} {:>9} '.format(group, r['files'], r['cells']) +
+            ' '.join('{:>14.2f}'.format(r['cellsPerSecond'][name] / 1e6) for name in benchmarks) +
+            ' {:>9.2f}'.format(r['peakBytes'] / 1e6))
+    print('(throughputs in Mcells/s)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the cleye scan analysis path.')
+    parser.add_argument('--files', type=int, default=4, help='number of scans per increment')
+    parser.add_argument('--batch', type=int, default=200, help='number of scans in the large batch')
+    parser.add_argument('--repeat', type=int, default=5, help='repeat the timings (the best is reported)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the scan generator')
+    parser.add_argument('--baseline', default=None, help='compare the results to this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed relative throughput drop')
+    parser.add_argument('--save-baseline', default=None, help='save the results as a baseline file')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workDir = tempfile.mkdtemp(prefix='cleye_bench_')
+    results = {}
+    try:
+        for group, fnames in generateScans(workDir, args.files, args.batch, seed=args.seed):
+            results[group] = benchGroup(fnames, args.repeat)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    printReport(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print('REGRESSION: ' + r)
+        if regressions:
+            sys.exit(1)
+        print('No regression compared to ' + args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,8 +18,21 @@ from __future__ import print_function
 # Import build in modules
 #  - sys manipulate python path
 #  - os needed for file and directory manipulation
+#  - shutil, tempfile work in a temporary scan cache
+#  - json read the exported trace
+#  - collections ordered screening results
+#  - math synthetic bathtub curves
+#  - time filter the catalog by date
 import sys
 import os
+import shutil
+import tempfile
+import json
+import collections
+import math
+import time
+
+import numpy as np
 
 # To import cleye we must add to path
 test_path = os.path.dirname(os.path.abspath(__file__))
@@ -79,3 +92,868 @@ for name, scanStruct in scanStructures.items():
 print(' [  OK  ]')
 
 
+# Open areas computed by the original (pure python) implementation of the analysis functions.
+expectedOpenAreas = {
+    'non_valid_eye_bath_tub_sweep_01': 0.0,
+    'non_valid_eye_sweep_01': 0.0,
+    'non_valid_eye_sweep_02': 0.0,
+    'non_valid_eye_sweep_03': 0.0,
+    'valid_eye_bathtub_sweep_01': 104.0,
+    'valid_eye_bathtub_sweep_02': 112.0,
+    'valid_eye_but_closed_sweep_01': 0.3388952726267281,
+    'valid_eye_but_closed_sweep_02': 1.0253984746666667,
+    'valid_eye_but_closed_sweep_03': 0.44176661209216583,
+    }
+
+print('Testnig open areas against reference values...', end='')
+for name, scanStruct in scanStructures.items():
+    openArea = cleye.getOpenArea(scanStruct)
+    assert(abs(openArea - expectedOpenAreas[name]) <= 1e-12 * max(1.0, abs(expectedOpenAreas[name])))
+print(' [  OK  ]')
+
+
+
+
+print('Testnig batch analyzer...', end='')
+rows = cleye.analyzeDirectory(os.path.join(test_path, 'resources'), processes=1)
+assert(len(rows) == len(names) + 1)
+for row in rows:
+    name = os.path.splitext(os.path.basename(row['file']))[0]
+    assert('error' not in row)
+    assert(row['validEye'] == ('non_valid' not in name))
+    if name in expectedOpenAreas:
+        assert(abs(row['openArea'] - expectedOpenAreas[name]) <= 1e-12 * max(1.0, abs(expectedOpenAreas[name])))
+print(' [  OK  ]')
+
+
+print('Testnig streaming row reader...', end='')
+for name, scanStruct in scanStructures.items():
+    filename = os.path.join(test_path, 'resources', name + '.csv')
+    headers = {}
+    rows = list(cleye.iterScanRows(filename, headers))
+    assert(headers['Open Area'] == scanStruct['Open Area'])
+    assert(len(rows) == len(scanStruct['scanData']['y']))
+    for i, (y, values) in enumerate(rows):
+        assert(y == scanStruct['scanData']['y'][i])
+        assert((values == scanStruct['scanData']['values'][i]).all())
+print(' [  OK  ]')
+
+
+print('Testnig binary scan cache...', end='')
+cacheDir = tempfile.mkdtemp()
+try:
+    cache = cleye.ScanCache(cacheDir)
+    for name, scanStruct in scanStructures.items():
+        filename = os.path.join(test_path, 'resources', name + '.csv')
+        assert(cache.get(filename) is None)
+        cache.put(filename, cleye.readCsv(filename, useCache=False))
+        cached = cache.get(filename)
+        assert(cached['Open Area'] == scanStruct['Open Area'])
+        assert((cached['scanData']['x'] == scanStruct['scanData']['x']).all())
+        assert((cached['scanData']['y'] == scanStruct['scanData']['y']).all())
+        assert((cached['scanData']['values'] == scanStruct['scanData']['values']).all())
+        assert(cleye.getOpenArea(cached) == cleye.getOpenArea(scanStruct))
+        del cached
+    # Only the most recently used entry must survive the eviction.
+    assert(cache.get(filename) is not None)
+    metaPath, gridPath = cache._paths(filename)
+    cache.evict(os.path.getsize(metaPath) + os.path.getsize(gridPath))
+    assert(sorted(os.listdir(cacheDir)) == sorted([os.path.basename(metaPath), os.path.basename(gridPath)]))
+    cache.clear()
+    assert(len(os.listdir(cacheDir)) == 0)
+    # The running total follows the puts, the full cache shrinks to its low water mark.
+    filenames = [os.path.join(test_path, 'resources', name + '.csv') for name in names]
+    for filename in filenames:
+        cache.put(filename, scanStructures[os.path.basename(filename)[:-4]])
+    entryBytes = [cache._size(*cache._paths(f)) for f in filenames]
+    assert(cache.totalBytes == sum(entryBytes))
+    cache.put(filenames[0], scanStructures[names[0]])
+    assert(cache.totalBytes == sum(entryBytes))
+    for filename in filenames:
+        past = time.time() - 10
+        os.utime(cache._paths(filename)[0], (past, past))
+    cache = cleye.ScanCache(cacheDir, sum(entryBytes) - 1)
+    cache.put(filenames[0], scanStructures[names[0]])
+    assert(cache.totalBytes <= (sum(entryBytes) - 1) * cleye.scanCacheLowWater)
+    assert(cache.totalBytes == sum(cache._size(*cache._paths(f)) for f in filenames))
+    assert(cache.get(filenames[0]) is not None)
+    cache.clear()
+finally:
+    shutil.rmtree(cacheDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig joint search strategies...', end='')
+space = cleye.jointParameterSpace
+optimum = (9, 5, 12, 6)
+def syntheticOpenArea(point):
+    # Unimodal open area with its maximum at the optimum indexes.
+    indexes = [space[n].index(v) for n, v in point.items()]
+    return max(0.0, 3000.0 - sum(((i - o) * 60.0 / len(space[n]))**2 for i, o, n in zip(indexes, optimum, space)))
+
+for strategy in sorted(cleye.searchStrategies):
+    result = cleye.runSearch(space, syntheticOpenArea, strategy, maxScans=300)
+    assert(result['bestArea'] == 3000.0)
+    assert(result['scans'] == len(result['history']) <= 300)
+    assert(result['history'][-1] == (result['scans'], result['bestArea']))
+    assert(all(a[1] <= b[1] for a, b in zip(result['history'], result['history'][1:])))
+result = cleye.runSearch(space, syntheticOpenArea, 'coordinate', maxScans=10)
+assert(result['scans'] == 10)
+print(' [  OK  ]')
+
+
+print('Testnig scan result store...', end='')
+storeDir = tempfile.mkdtemp()
+try:
+    store = cleye.ScanResultStore(os.path.join(storeDir, 'results.sqlite'), ttl=3600)
+    settings = {'TXDIFFSWING': '{807 mV (1000)}', 'RXTERM': '{800 mV}'}
+    assert(store.lookup('TX', 'RX', settings, '2d_full_eye', 8, 8) is None)
+    store.record('TX', 'RX', settings, '2d_full_eye', 8, 8, None, 2496.0, True, 'runs/a.csv')
+    stored = store.lookup('TX', 'RX', dict(reversed(list(settings.items()))), '2d_full_eye', 8, 8)
+    assert(stored['openArea'] == 2496.0 and stored['validEye'] and stored['csvPath'] == 'runs/a.csv')
+    # Any difference in the key is a miss.
+    assert(store.lookup('TX', 'RX', settings, '2d_full_eye', 4, 8) is None)
+    assert(store.lookup('TX', 'RX', dict(settings, RXTERM='{900 mV}'), '2d_full_eye', 8, 8) is None)
+    # Stale results are not reused.
+    assert(store.lookup('TX', 'RX', settings, '2d_full_eye', 8, 8, ttl=-1) is None)
+    store.close()
+finally:
+    shutil.rmtree(storeDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig tracing spans...', end='')
+assert(cleye._commandVerb('run_scan "runs/a.csv" 8 8 2d_full_eye *') == 'run_scan')
+assert(cleye._commandVerb('set devices [fetch_devices]') == 'fetch_devices')
+assert(cleye._commandVerb('') == '<empty>')
+# The disabled tracer does not record.
+cleye.tracer.clear()
+cleye.getOpenArea(cleye.readCsv(os.path.join(test_path, 'resources', names[0] + '.csv'), useCache=False))
+assert(cleye.tracer.events == [])
+traceDir = tempfile.mkdtemp()
+try:
+    cleye.tracer.enable()
+    for name in names:
+        cleye.getOpenArea(cleye.readCsv(os.path.join(test_path, 'resources', name + '.csv'), useCache=False))
+    cleye.tracer.enable(False)
+    summary = dict((r['name'], r) for r in cleye.tracer.summary())
+    assert(summary['readCsv']['count'] == summary['getOpenArea']['count'] == len(names))
+    assert(summary['readCsv']['p50'] <= summary['readCsv']['p99'] <= summary['readCsv']['max'])
+    traceFile = os.path.join(traceDir, 'trace.json')
+    cleye.tracer.writeChromeTrace(traceFile)
+    with open(traceFile) as f:
+        events = json.load(f)['traceEvents']
+    assert(len(events) == 2 * len(names) and all(e['ph'] == 'X' for e in events))
+finally:
+    cleye.tracer.clear()
+    shutil.rmtree(traceDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig ordered search...', end='')
+for size in [16, 32]:
+    for peak in range(size):
+        calls = []
+        def unimodal(i):
+            calls.append(i)
+            return max(0.0, 3000.0 - 150.0 * abs(i - peak))
+        result = cleye.orderedSearch(unimodal, size)
+        assert(result['best'] == peak and result['unimodal'])
+        assert(result['scans'] == len(calls) == len(set(calls)) <= 10)
+# Two peaks: full sweep, the global maximum is found.
+bimodal = [5, 10, 20, 10, 5, 0, 0, 0, 0, 0, 0, 5, 40, 5, 0, 0]
+result = cleye.orderedSearch(lambda i: bimodal[i], len(bimodal))
+assert(result['best'] == 12 and result['scans'] == len(bimodal))
+print(' [  OK  ]')
+
+
+print('Testnig scans over the console...', end='')
+archiveDir = tempfile.mkdtemp()
+try:
+    output = 'Wait to finish...\r\n'
+    for name in names:
+        with open(os.path.join(test_path, 'resources', name + '.csv'), newline='') as f:
+            output += 'scan_data_begin\t' + name + '\r\n' + f.read() + 'scan_data_end\r\n'
+    blocks = cleye.scanBlocks(output)
+    assert([b[0] for b in blocks] == names)
+    for name, text in blocks:
+        fname = os.path.join(archiveDir, 'runs', name + '.csv')
+        scan = cleye.receiveScan(fname, text)
+        ref = cleye.readCsv(os.path.join(test_path, 'resources', name + '.csv'), useCache=False)
+        assert(scan['Open Area'] == ref['Open Area'])
+        assert((scan['scanData']['values'] == ref['scanData']['values']).all())
+        # Served from memory (the archive may not be written yet).
+        assert(cleye.readCsv(fname) is scan)
+    cleye.scanArchiver.flush()
+    for name, text in blocks:
+        fname = os.path.join(archiveDir, 'runs', name + '.csv')
+        with open(fname, newline='') as f:
+            assert(f.read() == text)
+        cleye.forgetScan(fname)
+finally:
+    shutil.rmtree(archiveDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig parameter space discovery...', end='')
+assert(cleye.physicalValue('{6.02 dB (10101)}') == '6.02 dB')
+assert(cleye.physicalValue('{800 mV}') == '800 mV')
+assert(len(cleye.collapseValues(cleye.TXPRE_values)) == 21)
+assert(cleye.collapseValues(cleye.TXPOST_values) == cleye.TXPOST_values)
+assert(cleye._parseTclList('{269 mV (0000)} {336 mV (0001)} X') == ['{269 mV (0000)}', '{336 mV (0001)}', '{X}'])
+
+class FakeConsole():
+    ''' Answers the batches of discoverParameterSpace. '''
+    def __init__(self):
+        self.listed = []
+    def doBatch(self, cmds, errmsgs=[], timeout=-1):
+        outputs = []
+        for cmd in cmds:
+            if cmd.startswith('get_property GT_TYPE'):
+                outputs.append('GTXE2')
+            elif cmd == 'version -short':
+                outputs.append('2017.4')
+            elif cmd.startswith('list_property_value TXPRE'):
+                self.listed.append('TXPRE')
+                outputs.append(' '.join(cleye.TXPRE_values))
+            else:
+                outputs.append('ERROR: not an enum property')
+        return outputs
+
+spaceDir = tempfile.mkdtemp()
+cacheDir = cleye.parameterSpaceCacheDir
+try:
+    cleye.parameterSpaceCacheDir = spaceDir
+    console = FakeConsole()
+    space = cleye.discoverParameterSpace(console, 'MGT_X0Y0', ['TXPRE', 'TXDIFFSWING'])
+    assert(list(space) == ['TXPRE', 'TXDIFFSWING'])
+    assert(space['TXPRE'] == cleye.collapseValues(cleye.TXPRE_values))
+    # Not listed: the built-in table.
+    assert(space['TXDIFFSWING'] == cleye.TXDIFFSWING_values)
+    # The second discovery of the same GT type and Vivado version is served from the cache.
+    assert(cleye.discoverParameterSpace(console, 'MGT_X0Y1', ['TXPRE'])['TXPRE'] == space['TXPRE'])
+    assert(console.listed == ['TXPRE'])
+finally:
+    cleye.parameterSpaceCacheDir = cacheDir
+    shutil.rmtree(spaceDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig progressive dwell...', end='')
+# The true open areas at the deep dwell BER: 'b' is the best, 'a' and 'c' tie at the screening.
+deepAreas = {1e-7: {'a': 900, 'b': 960, 'c': 940}, 1e-9: {'b': 700, 'c': 500}}
+measured = []
+def measureDwell(leaders, dwell):
+    measured.append((dwell, list(leaders)))
+    return dict((c, deepAreas[float(dwell)][c]) for c in leaders)
+screened = collections.OrderedDict([('a', 1000), ('b', 1000), ('c', 990), ('d', 600)])
+best, area, levels = cleye.progressiveDwell(measureDwell, screened, ['1e-7', '1e-9'])
+assert(best == 'b' and area == 700)
+assert(measured == [('1e-7', ['a', 'b', 'c']), ('1e-9', ['b', 'c'])])
+assert([dwell for dwell, areas in levels] == ['1e-5', '1e-7', '1e-9'])
+# A single leader needs no deeper scans.
+measured = []
+assert(cleye.progressiveDwell(measureDwell, {'a': 1000, 'd': 600}, ['1e-7'])[0] == 'a')
+assert(measured == [])
+# The deeper levels would not fit the time budget: the screening decides.
+best, area, levels = cleye.progressiveDwell(measureDwell, screened, ['1e-7'], timeBudget=10, scanTime=1.0)
+assert(measured == [] and best == 'a' and len(levels) == 1)
+# Every leader is closed at the deeper level: the last level with an open eye decides.
+deepAreas[1e-9] = {'b': 0, 'c': 0}
+best, area, levels = cleye.progressiveDwell(measureDwell, screened, ['1e-7', '1e-9'])
+assert(best == 'b' and area == 960 and len(levels) == 3)
+# No open eye at all.
+assert(cleye.progressiveDwell(measureDwell, {'a': 0, 'd': 0}, ['1e-7'])[:2] == (None, 0))
+print(' [  OK  ]')
+
+
+print('Testnig open area bound of partial scans...', end='')
+xCodes = np.arange(-64, 65, 8)
+eye = np.full((5, len(xCodes)), 0.5)
+eye[1:4, np.abs(xCodes) < 40] = 1e-9
+eye[2, np.abs(xCodes) < 56] = 1e-9
+def partialScan(values, columns):
+    return {'Horizontal Increment': 8.0, 'Vertical Increment': 8.0, 'Dwell BER': 1e-5,
+        'scanData': {'x': xCodes[:columns] / 128.0, 'values': values[:, :columns]}}
+fullArea = np.count_nonzero(eye < 1e-5) * 64
+bounds = [cleye.openAreaBound(partialScan(eye, columns)) for columns in range(2, len(xCodes) + 1)]
+assert(all(bound >= fullArea for bound in bounds))
+assert(bounds[-1] == fullArea)
+assert(bounds == sorted(bounds, reverse=True))
+# A closed eye is hopeless as soon as the center is scanned.
+closed = np.full(eye.shape, 0.5)
+assert(cleye.openAreaBound(partialScan(closed, 10)) == 4.0)
+# A clean edge is not an eye.
+clean = eye.copy()
+clean[:, 0] = 0.0
+assert(cleye.openAreaBound(partialScan(clean, 3)) == 0.0)
+# The lattice is anchored on the first column: parsed partial scans start at the edge (the first
+# column is the normalizer).
+parsed = cleye.parseScanText('\n'.join(['Dwell BER,1e-5', 'Horizontal Increment,8', 'Vertical Increment,8', 'Scan Start', '2d statistical,' + ','.join(str(c) for c in xCodes[:4])]
+    + ['{},{}'.format(y, ','.join(str(v) for v in eye[i, :4])) for i, y in enumerate(range(-16, 17, 8))]
+    + ['Scan End']), 'partial.csv')
+assert(parsed['scanData']['x'][0] == -0.5)
+assert(cleye.openAreaBound(parsed) == bounds[2])
+print(' [  OK  ]')
+
+
+print('Testnig eye metrics...', end='')
+metrics = cleye.eyeMetrics([scanStructures[name] for name in names])
+assert(list(metrics['validEye']) == ['non_valid' not in name for name in names])
+for i, name in enumerate(names):
+    # The deepest contour is the dwell BER: its inner area is at most the official open area.
+    assert(metrics['innerArea'][i, -1] <= scanStructures[name]['Open Area'])
+    if 'bath' not in name:
+        assert(all(np.diff(metrics['innerArea'][i]) <= 0))
+    # The width of a valid eye is bounded by its edges, 1D scans have no mask margin.
+    assert(math.isnan(metrics['width'][i, 0]) != metrics['validEye'][i])
+    assert(np.nanmax(metrics['width'][i], initial=0) < 1.0)
+    assert(math.isnan(metrics['maskMargin'][i]) == ('bath' in name))
+ranking = [names[i] for i in cleye.rankEyes(metrics)]
+assert(all('non_valid' in name for name in ranking[-4:]))
+assert(ranking.index('valid_eye_bathtub_sweep_02') < ranking.index('valid_eye_bathtub_sweep_01'))
+# Gaussian tails (Q rising by 20 per UI from the edges) extrapolated to 1e-12: Q = 7.034
+assert(abs(cleye.qFactor(1e-12) - 7.034) < 1e-3)
+x = np.linspace(-0.5, 0.5, 65)
+q = 20 * (0.5 - np.abs(x))
+bathtub = np.array([0.5 * math.erfc(v / math.sqrt(2)) for v in q])
+assert(abs(cleye.bathtubOpening(x, bathtub, 1e-12)[0] - (1 - 2 * 7.034 / 20)) < 0.01)
+print(' [  OK  ]')
+
+
+print('Testnig lazy scans and the scan catalog...', end='')
+lazy = cleye.readCsv(os.path.join(test_path, 'resources', names[0] + '.csv'), useCache=False, lazy=True)
+assert('scanData' not in lazy)
+assert(lazy.get('Missing Field') is None)
+assert(lazy.get('Missing Field', 42) == 42)
+assert(lazy['Open Area'] == scanStructures[names[0]]['Open Area'])
+assert(np.array_equal(lazy.get('scanData')['values'], scanStructures[names[0]]['scanData']['values']))
+lazy = cleye.readCsv(os.path.join(test_path, 'resources', names[0] + '.csv'), useCache=False, lazy=True)
+assert(np.array_equal(lazy['scanData']['values'], scanStructures[names[0]]['scanData']['values']))
+
+catalogDir = tempfile.mkdtemp()
+try:
+    shutil.copytree(os.path.join(test_path, 'resources'), os.path.join(catalogDir, 'resources'))
+    catalog = cleye.ScanCatalog(catalogDir)
+    assert(catalog.update() == (len(names) + 1, 0))
+    # Nothing changed: nothing is read.
+    assert(catalog.update() == (0, 0))
+    changed = os.path.join(catalogDir, 'resources', names[0] + '.csv')
+    with open(changed, 'a') as f:
+        f.write('\n')
+    os.remove(os.path.join(catalogDir, 'resources', names[1] + '.csv'))
+    assert(catalog.update() == (1, 1))
+    
+    rows = catalog.find(gtType='7 Series GTX', minOpenArea=2000)
+    expected = [n for n in names[2:] if scanStructures[n]['Open Area'] >= 2000 and scanStructures[n]['GT Type'] == '7 Series GTX']
+    assert(sorted(os.path.basename(row['path'])[:-4] for row in rows) == sorted(expected))
+    assert(all(row['startedTime'] >= rows[-1]['startedTime'] for row in rows))
+    assert(catalog.find(since=time.time()) == [])
+    catalog.close()
+finally:
+    shutil.rmtree(catalogDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig hardware topology cache...', end='')
+class FakeChild():
+    before = ''
+
+class FakeHardware():
+    ''' Answers the commands of HardwareTopology. '''
+    def __init__(self, targets):
+        self.targets = targets
+        self.opened = []
+        self.childProc = FakeChild()
+    def do(self, cmd, errmsgs=[], timeout=-1):
+        if cmd == 'get_hw_targets':
+            self.childProc.before = '\n' + ' '.join(self.targets) + '\n'
+        elif cmd.startswith('fetch_target_devices'):
+            target = cmd.split(' ', 1)[1].strip('{}')
+            self.opened.append(target)
+            self.childProc.before = '\nOpening target\ntarget_device\t{0}\txc7k325t_0\t43651093\n'.format(target)
+    def get_property(self, propName, objectName, puts=True):
+        return '43651093'
+
+topologyDir = tempfile.mkdtemp()
+try:
+    path = os.path.join(topologyDir, 'topology.json')
+    sessions = [FakeHardware(['T0', 'T1', 'T2']), FakeHardware(['T0', 'T1', 'T2'])]
+    devices = cleye.HardwareTopology(path).refresh(sessions)
+    assert(devices == ['T0 xc7k325t_0', 'T1 xc7k325t_0', 'T2 xc7k325t_0'])
+    # Spread across the sessions
+    assert(sessions[0].opened == ['T0', 'T2'] and sessions[1].opened == ['T1'])
+    # A new target is opened, a removed one is dropped, the others come from the cache.
+    session = FakeHardware(['T0', 'T2', 'T3'])
+    topology = cleye.HardwareTopology(path)
+    assert(topology.refresh([session]) == ['T0 xc7k325t_0', 'T2 xc7k325t_0', 'T3 xc7k325t_0'])
+    assert(session.opened == ['T3'])
+    assert(topology.verify(session, 'T0 xc7k325t_0') and session.opened == ['T3'])
+    topology.rememberSios('T0 xc7k325t_0', ['MGT_X0Y0/TX'])
+    assert(cleye.HardwareTopology(path).sios('T0 xc7k325t_0') == ['MGT_X0Y0/TX'])
+    session.get_property = lambda propName, objectName, puts=True: '13631093'
+    assert(not topology.verify(session, 'T0 xc7k325t_0') and session.opened == ['T3', 'T0'])
+    assert(topology.sios('T0 xc7k325t_0') is None)
+    session.opened = []
+    cleye.HardwareTopology(path).refresh([session], rediscover=True)
+    assert(session.opened == ['T0', 'T2', 'T3'])
+finally:
+    shutil.rmtree(topologyDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig session transcript and replay...', end='')
+replayDir = tempfile.mkdtemp()
+cwd = os.getcwd()
+try:
+    os.chdir(replayDir)
+    simulatorPath = os.path.join(test_path, 'vivado_sim.py')
+    transcriptFile = os.path.join(replayDir, 'session.jsonl')
+
+    def tuneSession(vivado):
+        device = cleye.HardwareTopology('topology.json').refresh([vivado])[0]
+        vivado.do('set_device ' + device, errmsgs=['ERROR: '])
+        vivado.do('get_hw_sio_gts')
+        sio = [x for x in vivado.childProc.before.splitlines() if x][0].split(' ')[0]
+        vivado.do('create_link ' + sio, errmsgs=['ERROR: '])
+        outputs = vivado.doBatch(['set_property TXDIFFSWING {{1018 mV (1111)}} ' + sio, 'commit_hw_sio ' + sio,
+            'get_property TXDIFFSWING ' + sio])
+        areas = [cleye.runScan(vivado, 'replay_{}.csv'.format(i), hincr=16, vincr=16)
+            for i in range(2)]
+        return outputs, areas
+
+    cleye.transcript.start(transcriptFile)
+    vivado = cleye.startVivado(sys.executable, [simulatorPath])
+    recorded = tuneSession(vivado)
+    vivado.exit()
+    cleye.transcript.close()
+    os.remove('topology.json')
+    scans = {}
+    for i in range(2):
+        fname = 'replay_{}.csv'.format(i)
+        with open(fname, newline='') as f:
+            scans[fname] = f.read()
+        os.remove(fname)
+        cleye.forgetScan(fname)
+
+    # The replay writes the scan files again and gives the same results without the simulator.
+    replay = cleye.replaySessions(transcriptFile)
+    assert(len(replay) == 1)
+    replay[0].waitStartup()
+    replay[0].do('source sourceme.tcl')
+    assert(tuneSession(replay[0]) == recorded)
+    for fname, data in scans.items():
+        with open(fname, newline='') as f:
+            assert(f.read() == data)
+    replay[0].exit()
+    # A diverging command is reported.
+    replay = cleye.replaySessions(transcriptFile)[0]
+    replay.do('source sourceme.tcl')
+    try:
+        replay.do('get_hw_devices')
+        assert(False)
+    except cleye.ReplayMismatch:
+        pass
+    # The lookup replay accepts the recorded commands in any order.
+    replay = cleye.replaySessions(transcriptFile, strict=False)[0]
+    replay.do('get_hw_sio_gts')
+    assert(replay.childProc.before == [e for e in map(json.loads, open(transcriptFile))
+        if e.get('cmd') == 'get_hw_sio_gts'][0]['before'])
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(replayDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig batched commands...', end='')
+batchDir = tempfile.mkdtemp()
+cwd = os.getcwd()
+try:
+    os.chdir(batchDir)
+    vivado = cleye.startVivado(sys.executable, [os.path.join(test_path, 'vivado_sim.py')])
+    assert(vivado.doBatch([]) == [])
+    # One output per command: its prints and its result. A failing command does not stop the batch.
+    outputs = vivado.doBatch(['puts a; puts b', 'expr {1 + 2}', 'error boom', 'set empty ""', 'puts done'])
+    assert(outputs == ['a\r\nb', '3', 'ERROR: boom', '', 'done'])
+    # The sentinels carry a new token per batch, so printed look-alikes are kept in the output.
+    token = vivado.doBatch(['set __cleye_batch'])[0]
+    outputs = vivado.doBatch(['puts "<<{}:0>>"'.format(token), 'puts "<<$__cleye_batch:x>>"'])
+    assert(outputs[0] == '<<{}:0>>'.format(token))
+    assert(outputs[1].endswith(':x>>') and token not in outputs[1])
+    try:
+        vivado.doBatch(['puts a', 'error boom', 'puts c'], errmsgs=['ERROR: '])
+        assert(False)
+    except Exception as e:
+        assert('error boom' in str(e))
+    # An unbalanced command breaks the whole line: no sentinels at all.
+    try:
+        vivado.doBatch(['puts {a'])
+        assert(False)
+    except Exception as e:
+        assert('Incomplete batch output' in str(e))
+    assert(vivado.doBatch(['puts ok']) == ['ok'])
+    vivado.exit()
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(batchDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig property sweeps inside Vivado...', end='')
+sweepDir = tempfile.mkdtemp()
+cwd = os.getcwd()
+try:
+    os.chdir(sweepDir)
+    vivado = cleye.startVivado(sys.executable, [os.path.join(test_path, 'vivado_sim.py')])
+    device = cleye.HardwareTopology('topology.json').refresh([vivado])[0]
+    vivado.do('set_device ' + device, errmsgs=['ERROR: '])
+    vivado.do('get_hw_sio_gts')
+    sio = [x for x in vivado.childProc.before.splitlines() if x][0].split(' ')[0]
+    vivado.do('create_link ' + sio, errmsgs=['ERROR: '])
+    sioGt = '[get_hw_sio_gts {}]'.format(sio)
+    # Near the optimal TXPOST the eye depends on TXDIFFSWING (see defaultOptimum of vivado_sim).
+    cleye.applySetting(vivado, sioGt, 'TXPOST', '{3.10 dB (01100)}')
+    values = ['{269 mV (0000)}', '{741 mV (0111)}', '{1119 mV (1111)}']
+    stage = {'scanType': '2d_full_eye', 'hincr': 8, 'vincr': 16}
+    
+    sent = []
+    do = vivado.do
+    vivado.do = lambda cmd, *args, **kwargs: (sent.append(cmd), do(cmd, *args, **kwargs))[1]
+    swept = cleye.sweepProperty(vivado, sio, 'TXDIFFSWING', [(v, 'sweep_{}.csv'.format(i)) for i, v in enumerate(values)], stage)
+    # The whole sweep is one round trip, the points are returned in order.
+    assert(len(sent) == 1 and sent[0].startswith('sweep_property '))
+    assert([(v, f) for v, f, _ in swept] == [(v, 'sweep_{}.csv'.format(i)) for i, v in enumerate(values)])
+    assert(all(area == cleye.scoreScanFile(f) for _, f, area in swept))
+    assert(swept[1][2] > max(swept[0][2], swept[2][2]))
+    vivado.do = do
+    vivado.do('get_property TXDIFFSWING ' + sioGt)
+    assert(values[-1].strip('{}') in vivado.childProc.before)
+    
+    # The same sweep point by point (the scans are noisy: only the ranking is compared).
+    pointAreas = []
+    for i, v in enumerate(values):
+        cleye.applySetting(vivado, sioGt, 'TXDIFFSWING', v)
+        pointAreas.append(cleye.runScan(vivado, 'point_{}.csv'.format(i), hincr=8, vincr=16))
+    assert(np.argmax(pointAreas) == 1)
+    
+    # Over the console the scans are received from the output and archived.
+    cleye.scanTransfer = 'console'
+    try:
+        streamed = cleye.sweepProperty(vivado, sio, 'TXDIFFSWING', [(v, 'stream_{}.csv'.format(i)) for i, v in enumerate(values)], stage)
+    finally:
+        cleye.scanTransfer = 'file'
+    assert([f for _, f, _ in streamed] == ['stream_{}.csv'.format(i) for i in range(len(values))])
+    assert(streamed[1][2] > max(streamed[0][2], streamed[2][2]))
+    cleye.scanArchiver.flush()
+    for _, f, area in streamed:
+        cleye.forgetScan(f)
+        assert(cleye.scoreScanFile(f) == area)
+    vivado.exit()
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(sweepDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig headless job runs...', end='')
+jobDir = tempfile.mkdtemp()
+cwd = os.getcwd()
+try:
+    os.chdir(jobDir)
+    simulatorPath = os.path.join(test_path, 'vivado_sim.py')
+    target = 'localhost:3121/xilinx_tcf/Digilent/SIM{:04d}A'
+    sio = '{}/0_1_0/IBERT/Quad_113/MGT_X0Y0'
+    with open('jobs.json', 'w') as f:
+        json.dump({
+            'defaults': {'stages': [{'scanType': '2d_full_eye', 'hincr': 16, 'vincr': 16}], 'space': {'TXDIFFSWING':
+                ['{269 mV (0000)}', '{1018 mV (1111)}']}},
+            'jobs': [{'name': 'board{}'.format(i), 'target': target.format(i), 'device': 'xc7k325t_0',
+                'txSio': sio.format(target.format(i)), 'rxSio': sio.format(target.format(i))} for i in range(2)],
+            }, f)
+    spawned, crashes = [], [True]
+    def crashingSession():
+        # The first session crashes at its 3rd command. (The lanes spawn concurrently: the crash is
+        # taken by an atomic pop.)
+        try:
+            crash = crashes.pop()
+        except IndexError:
+            crash = False
+        vivado = cleye.startVivado(sys.executable, [simulatorPath, '--targets', '2'])
+        if crash:
+            do, commands = vivado.do, []
+            def crashingDo(cmd, *args, **kwargs):
+                commands.append(cmd)
+                if len(commands) == 3:
+                    vivado.childProc.terminate(force=True)
+                return do(cmd, *args, **kwargs)
+            vivado.do = crashingDo
+        spawned.append(vivado)
+        return vivado
+
+    report = cleye.tuneLanes('jobs.json', 2, reportFile='results.json', retries=1, sessionFactory=crashingSession)
+    assert([e['name'] for e in report] == ['board0', 'board1'])
+    assert(len(spawned) == 3 and sorted(e['attempts'] for e in report) == [1, 2])
+    assert(all('error' not in e and e['openArea'] > 0 for e in report))
+    with open('results.json') as f:
+        assert(json.load(f) == json.loads(json.dumps(report)))
+    # Without retries the crashed job is reported.
+    spawned, crashes = [], [True]
+    report = cleye.tuneLanes('jobs.json', 2, sessionFactory=crashingSession)
+    assert(sorted('error' in e for e in report) == [False, True])
+    with open('jobs.json', 'w') as f:
+        json.dump([{'txDevice': 'T0 xc7k325t_0', 'txSio': 'MGT_X0Y0', 'rxSio': 'MGT_X0Y0', 'strategy': 'none'}], f)
+    try:
+        cleye.readJobFile('jobs.json')
+        assert(False)
+    except Exception as e:
+        assert('unknown strategy' in str(e))
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(jobDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig lane scheduler sessions...', end='')
+class FakeSession():
+    ''' Remembers the device set by set_device. '''
+    def __init__(self):
+        self.device = None
+        self.childProc = FakeChild()
+    def do(self, cmd, errmsgs=[], timeout=-1):
+        if cmd.startswith('set_device '):
+            self.device = cmd[len('set_device '):]
+    def exit(self):
+        return 0
+
+lanes = [{'name': 'lane{}'.format(i), 'txDevice': device, 'txSio': 'MGT_X0Y0', 'rxSio': 'MGT_X0Y0'}
+    for i, device in enumerate(['A devA', 'B devB', 'A devA', 'A devA'])]
+ranOn = []
+def fakeJob(vivadoTX, vivadoRX, job, prefix=''):
+    ranOn.append((job['txDevice'], vivadoTX.device, vivadoTX))
+    return {}, 1.0
+runJob = cleye.runJob
+try:
+    cleye.runJob = fakeJob
+    # One session: retargeted from A to B, then back to A, then reused on A.
+    spawned = []
+    scheduler = cleye.LaneScheduler(1, lambda: spawned.append(FakeSession()) or spawned[-1])
+    report = scheduler.run(lanes)
+    scheduler.close()
+    assert(len(spawned) == 1 and [e['openArea'] for e in report] == [1.0] * 4)
+    assert(all(device == current for device, current, session in ranOn))
+    # Two sessions: one per target, each reused.
+    spawned, ranOn = [], []
+    scheduler = cleye.LaneScheduler(2, lambda: spawned.append(FakeSession()) or spawned[-1])
+    scheduler.run(lanes)
+    scheduler.close()
+    assert(len(spawned) == 2 and all(device == current for device, current, session in ranOn))
+    assert(ranOn[0][2] is ranOn[2][2] is ranOn[3][2] and ranOn[1][2] is not ranOn[0][2])
+finally:
+    cleye.runJob = runJob
+print(' [  OK  ]')
+
+
+print('Testnig coarse-to-fine stages...', end='')
+# The ties of the open areas are broken by the margins, the remaining ties survive.
+assert(cleye._survivors(['a', 'b', 'c', 'd'], [40.0, 40.0, 40.0, 30.0], 2, [5.0, 6.0, 5.5, 7.0]) == ['b', 'c'])
+assert(cleye._survivors(['a', 'b', 'c', 'd'], [40.0, 40.0, 40.0, 30.0], 2, [5.0, 6.0, 5.0, 7.0]) == ['a', 'b', 'c'])
+assert(cleye._survivors(['a', 'b', 'c', 'd'], [40.0, 40.0, 40.0, 30.0], 1) == ['a', 'b', 'c'])
+assert(cleye._survivors(['a', 'b'], [1.0, 2.0], 4) == ['a', 'b'])
+margins = [cleye.berMargin(os.path.join(test_path, 'resources', name + '.csv')) for name in
+    ['valid_eye_bathtub_sweep_01', 'valid_eye_but_closed_sweep_01']]
+assert(margins[0] > margins[1] > 0)
+assert(cleye.berMargin(os.path.join(test_path, 'resources', 'no_such_scan.csv')) is None)
+stageDir = tempfile.mkdtemp()
+cwd = os.getcwd()
+try:
+    os.chdir(stageDir)
+    vivado = cleye.startVivado(sys.executable, [os.path.join(test_path, 'vivado_sim.py')])
+    try:
+        vivado.do('set_device ' + cleye.HardwareTopology('topology.json').refresh([vivado])[0], errmsgs=['ERROR: '])
+        vivado.do('get_hw_sio_gts')
+        sio = [x for x in vivado.childProc.before.splitlines() if x][0].split(' ')[0]
+        vivado.do('create_link ' + sio, errmsgs=['ERROR: '])
+        stages = [dict(stage, hincr=16, vincr=16) for stage in cleye.coarseToFineScanStages]
+        full = cleye.independent_finder(vivado, vivado, sio, stages[-1:], sio, prefix='full_')
+        staged = cleye.independent_finder(vivado, vivado, sio, stages, sio, prefix='staged_')
+        # The screens keep the best value, only the survivors are scanned in full.
+        assert(staged['openArea'] == full['openArea'])
+        assert(len([f for f in os.listdir('runs') if f.startswith('staged_') and f.endswith('stage1.csv')]) == stages[0]['keep'])
+    finally:
+        vivado.exit()
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(stageDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig session pool and daemon...', end='')
+class PoolChild():
+    def __init__(self):
+        self.before = ''
+        self.terminated = False
+
+class PoolSession():
+    ''' Echoes the commands. '''
+    def __init__(self):
+        self.childProc = PoolChild()
+        self.commands = []
+    def do(self, cmd, prompt=cleye.vivadoPrompt, puts=False, errmsgs=[], timeout=-1):
+        if self.childProc.terminated:
+            raise Exception('The process has been terminated.')
+        self.commands.append(cmd)
+        self.childProc.before = '\n' + cmd + '\n'
+    def exit(self):
+        self.childProc.terminated = True
+
+spawned = []
+pool = cleye.SessionPool(maxSessions=2, minSessions=1, idleTimeout=3600,
+    sessionFactory=lambda: spawned.append(PoolSession()) or spawned[-1])
+pool._fill()
+assert(pool.status() == {'sessions': 1, 'idle': 1, 'maxSessions': 2})
+# The warm session is leased first, then a new one is spawned, then the pool is full.
+first = pool.lease()
+second = pool.lease()
+assert(first is spawned[0] and second is spawned[1] and len(spawned) == 2)
+try:
+    pool.lease(timeout=0.01)
+    assert(False)
+except Exception as e:
+    assert('No free Vivado session' in str(e))
+pool.release(first)
+assert(pool.lease() is first)
+pool.release(first)
+pool.release(second)
+# A dead session is restarted, the sessions idle for too long are evicted (down to minSessions).
+first.childProc.terminated = True
+pool.check()
+assert(len(spawned) == 3 and pool.status()['sessions'] == 2)
+pool.idleTimeout = 0
+time.sleep(0.01)
+pool.check()
+assert(pool.status() == {'sessions': 1, 'idle': 1, 'maxSessions': 2})
+pool.discard(pool.lease())
+assert(pool.status()['sessions'] == 0)
+
+daemonDir = tempfile.mkdtemp()
+try:
+    tokenFile = os.path.join(daemonDir, 'daemon.token')
+    pool = cleye.SessionPool(maxSessions=1, minSessions=1, sessionFactory=PoolSession)
+    daemon = cleye.VivadoDaemon(('127.0.0.1', 0), pool, tokenFile)
+    if os.name == 'posix':
+        assert(os.stat(tokenFile).st_mode & 0o777 == 0o600)
+    thread = cleye.threading.Thread(target=daemon.serve)
+    thread.start()
+    try:
+        remote = cleye.RemoteVivado(daemon.server_address, tokenFile=tokenFile)
+        remote.do('puts hello')
+        assert(remote.childProc.before == '\nputs hello\n')
+        assert(pool.status()['idle'] == 0)
+        remote.exit()
+        # The lease is released, the session stays warm.
+        remote = cleye.RemoteVivado(daemon.server_address, tokenFile=tokenFile)
+        remote.do('puts again')
+        remote.exit()
+        assert(pool.status() == {'sessions': 1, 'idle': 1, 'maxSessions': 1})
+        # A client without the token is rejected.
+        with open(tokenFile, 'w') as f:
+            f.write('wrong')
+        try:
+            cleye.RemoteVivado(daemon.server_address, tokenFile=tokenFile)
+            assert(False)
+        except Exception as e:
+            assert('Wrong access token' in str(e))
+    finally:
+        daemon.shutdown()
+        thread.join()
+        daemon.server_close()
+finally:
+    shutil.rmtree(daemonDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig asyncio driver...', end='')
+asyncDir = tempfile.mkdtemp()
+cwd = os.getcwd()
+try:
+    os.chdir(asyncDir)
+
+    async def asyncSessions():
+        asyncTX, asyncRX = cleye.AsyncVivado(), cleye.AsyncVivado()
+        simulator = [os.path.join(test_path, 'vivado_sim.py'), '--shared-state', os.path.join(asyncDir, 'state.json')]
+        await cleye.asyncio.gather(asyncTX.spawn(sys.executable, simulator), asyncRX.spawn(sys.executable, simulator))
+        await cleye.asyncio.gather(asyncTX.startup(), asyncRX.startup())
+        device = cleye.HardwareTopology('topology.json').refresh([asyncRX.vivado])[0]
+        await cleye.asyncio.gather(asyncTX.do('set_device ' + device), asyncRX.do('set_device ' + device))
+        sio = [x for x in (await asyncTX.do('get_hw_sio_gts')).splitlines() if x][0].split(' ')[0]
+        await asyncRX.do('create_link ' + sio)
+        return asyncTX, asyncRX, sio
+
+    async def asyncFinders():
+        asyncTX, asyncRX, sio = await asyncSessions()
+        stages = [dict(stage, hincr=16, vincr=16) for stage in cleye.coarseToFineScanStages]
+        try:
+            store = cleye.ScanResultStore(os.path.join(asyncDir, 'results.sqlite'), ttl=3600)
+            finder = cleye.asyncio.ensure_future(
+                cleye.async_independent_finder(asyncTX, asyncRX, sio, stages, sio, store, prefix='async_'))
+            await cleye.asyncio.sleep(0)
+            # The finder holds the sessions: a concurrent command waits for it.
+            await asyncTX.do('puts waited')
+            assert(finder.done())
+            result = finder.result()
+            sync = cleye.independent_finder(asyncTX.vivado, asyncRX.vivado, sio, stages, sio, prefix='sync_')
+            # The second run reuses the stored results.
+            reused = await cleye.async_independent_finder(asyncTX, asyncRX, sio, stages, sio, store, prefix='again_')
+            # An unswept property is part of the key: its change is a miss.
+            sioGt = '[get_hw_sio_gts {}]'.format(sio)
+            txpre = (await asyncTX.doBatch(['list_property_value TXPRE ' + sioGt]))[0].split('} {')[1]
+            await asyncTX.applySetting(sioGt, 'TXPRE', '{' + txpre + '}')
+            await cleye.async_independent_finder(asyncTX, asyncRX, sio, stages, sio, store, prefix='changed_')
+        finally:
+            await cleye.asyncio.gather(asyncTX.exit(), asyncRX.exit())
+        return result, sync, reused
+
+    result, sync, reused = cleye.asyncio.run(asyncFinders())
+    assert(result['openArea'] == sync['openArea'] == reused['openArea'] > 0)
+    assert(result['best'] == reused['best'])
+    # The results are keyed by the full property vector of the link.
+    store = cleye.ScanResultStore(os.path.join(asyncDir, 'results.sqlite'))
+    keys = set(row[0] for row in store.db.execute('SELECT properties FROM results'))
+    store.close()
+    assert(keys and all([name for name, value in json.loads(key)] == sorted(cleye.jointParameterSpace) for key in keys))
+    files = os.listdir('runs')
+    assert([f for f in files if f.startswith('async_')] and not [f for f in files if f.startswith('again_')])
+    assert([f for f in files if f.startswith('changed_')])
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(asyncDir, ignore_errors=True)
+print(' [  OK  ]')
+
+
+print('Testnig joint search without RX SIO...', end='')
+jointDir = tempfile.mkdtemp()
+cwd = os.getcwd()
+try:
+    os.chdir(jointDir)
+    vivado = cleye.startVivado(sys.executable, [os.path.join(test_path, 'vivado_sim.py')])
+    try:
+        vivado.do('set_device ' + cleye.HardwareTopology('topology.json').refresh([vivado])[0], errmsgs=['ERROR: '])
+        vivado.do('get_hw_sio_gts')
+        sio = [x for x in vivado.childProc.before.splitlines() if x][0].split(' ')[0]
+        vivado.do('create_link ' + sio, errmsgs=['ERROR: '])
+        stage = cleye.defaultScanStages[-1]
+        cleye.defaultScanStages[-1] = dict(stage, hincr=16, vincr=16)
+        try:
+            # The RX side properties are left out, for the default and for a given space.
+            result = cleye.joint_finder(vivado, vivado, sio, None, maxScans=3)
+            assert(result['best'] is not None and 'RXTERM' not in result['best'])
+            result = cleye.joint_finder(vivado, vivado, sio, None, cleye.jointParameterSpace, maxScans=3)
+            assert(list(result['best']) == ['TXDIFFSWING', 'TXPRE', 'TXPOST'])
+        finally:
+            cleye.defaultScanStages[-1] = stage
+    finally:
+        vivado.exit()
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(jointDir, ignore_errors=True)
+print(' [  OK  ]')
@@ -0,0 +1,242 @@
+# This file is part of cleye.
+#
+#     Cleye is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Foobar is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+''' End-to-end benchmark of the tuning flow against the Vivado simulator (vivado_sim.py).
+
+Every scenario spawns simulated Vivado sessions, chooses the first device and SIO, then runs the
+optimizer and reports:
+ - round trips: console commands sent during the optimization (all sessions),
+ - scans: eye scans run by the optimization,
+ - stopped: scans stopped early (see monitoredScan of cleye),
+ - ms/point: wall time per scanned point,
+ - scans/optimum: scans used until the best result was found,
+ - best and its open area.
+
+The sessions of every scenario can be recorded (--record DIR, see TranscriptRecorder of cleye) and
+replayed later without the simulator (--replay DIR), which isolates the time spent in cleye.
+
+Usage:
+    python sweep_bench.py [--scan-latency S] [--command-latency S] [--only NAME ...] [-o results.json]
+    python sweep_bench.py [--record DIR | --replay DIR] [--only NAME ...]
+'''
+
+from __future__ import print_function
+
+# Import build in modules
+#  - sys manipulate python path
+#  - os needed for file and directory manipulation
+#  - io, contextlib silence the optimizers
+#  - argparse, json command line and the result file
+#  - time measure the wall time
+#  - shutil, tempfile run the scenarios in a temporary directory
+import sys
+import os
+import io
+import contextlib
+import argparse
+import json
+import time
+import shutil
+import tempfile
+
+# To import cleye we must add to path
+test_path = os.path.dirname(os.path.abspath(__file__))
+cleye_module_path = os.path.join(test_path, '..')
+sys.path.insert(0, cleye_module_path)
+
+# Import the DUT
+import cleye
+
+simulatorPath = os.path.join(test_path, 'vivado_sim.py')
+# The hardware topology is cached in the work directory of the scenarios.
+topologyCache = 'topology.json'
+
+
+def simStats(vivado):
+    ''' Returns the counters of a simulator session (see sim_stats of vivado_sim.py).
+    '''
+    vivado.do('sim_stats')
+    line = [x for x in vivado.childProc.before.splitlines() if x][0]
+    return dict((k, int(v)) for k, v in (item.strip('{}').split(' ') for item in line.split('} {')))
+
+
+def openSessions(simArgs, singleSession, replay=None):
+    ''' Spawns the TX/RX sessions (or takes them from the replayed sessions), chooses the first
+    device (of the cached hardware topology, which is kept across the scenarios) and SIO and creates
+    the link.
+    '''
+    def start():
+        if replay is None:
+            return cleye.startVivado(sys.executable, [simulatorPath] + simArgs)
+        vivado = replay.pop(0)
+        vivado.waitStartup()
+        vivado.do('source sourceme.tcl')
+        return vivado
+    vivadoTX = start()
+    vivadoRX = vivadoTX if singleSession else start()
+    sessions = [vivadoTX] if singleSession else [vivadoTX, vivadoRX]
+    device = cleye.HardwareTopology(topologyCache).refresh(sessions)[0]
+    for vivado in sessions:
+        vivado.do('set_device ' + device, errmsgs=['ERROR: '])
+    vivadoTX.do('get_hw_sio_gts')
+    sio = [x for x in vivadoTX.childProc.before.splitlines() if x][0].split(' ')[0]
+    vivadoRX.do('create_link ' + sio, errmsgs=['ERROR: '])
+    return vivadoTX, vivadoRX, sio, sessions
+
+
+def scansToBest(history):
+    ''' Returns the scans used until the final best area was reached.
+    '''
+    final = history[-1][1]
+    return min(scans for scans, bestArea in history if bestArea == final)
+
+
+def runScenario(scenario, simArgs, verbose=False, replay=None):
+    stateFile = os.path.abspath('shared_state.json')
+    if os.path.exists(stateFile):
+        os.remove(stateFile)
+    simArgs = simArgs + ['--shared-state', stateFile]
+
+    cleye.scanTransfer = scenario.get('transfer', 'file')
+    begin = time.time()
+    vivadoTX, vivadoRX, sio, sessions = openSessions(simArgs, scenario.get('singleSession', False), replay)
+    startup = time.time() - begin
+    try:
+        before = [simStats(v) for v in sessions]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            begin = time.time()
+            if scenario['finder'] == 'independent':
+                result = cleye.independent_finder(vivadoTX, vivadoRX, sio, scenario.get('stages'), sio,
+                    prefix=scenario['name'] + '_', ordered=scenario.get('ordered', False),
+                    dwellSchedule=scenario.get('dwellSchedule'), monitored=scenario.get('monitored', False))
+                best = result['best']
+                bestArea = result['openArea']
+                history = None
+            else:
+                result = cleye.joint_finder(vivadoTX, vivadoRX, sio, sio, strategy=scenario['finder'],
+                    maxScans=scenario.get('maxScans', 100))
+                best = result['best']
+                bestArea = result['bestArea']
+                history = result['history']
+            elapsed = time.time() - begin
+        after = [simStats(v) for v in sessions]
+    finally:
+        for v in sessions:
+            v.exit()
+        cleye.scanArchiver.flush()
+        cleye.scanTransfer = 'file'
+
+    # The sim_stats command itself is one round trip of every session.
+    roundTrips = sum(a['commands'] - b['commands'] - 1 for a, b in zip(after, before))
+    scans = sum(a['scans'] - b['scans'] for a, b in zip(after, before))
+    stopped = sum(a['stopped_scans'] - b['stopped_scans'] for a, b in zip(after, before))
+    return {
+        'name': scenario['name'],
+        'startup': startup,
+        'elapsed': elapsed,
+        'roundTrips': roundTrips,
+        'scans': scans,
+        'stopped': stopped,
+        'msPerPoint': 1000.0 * elapsed / scans if scans else None,
+        'scansPerOptimum': scansToBest(history) if history else scans,
+        'best': dict(best) if best else None,
+        'openArea': bestArea,
+        }
+
+
+scenarios = [
+    {'name': 'independent', 'finder': 'independent'},
+    {'name': 'independent_single_session', 'finder': 'independent', 'singleSession': True},
+    {'name': 'independent_coarse_to_fine', 'finder': 'independent', 'stages': cleye.coarseToFineScanStages},
+    {'name': 'independent_ordered', 'finder': 'independent', 'ordered': True},
+    {'name': 'independent_dwell', 'finder': 'independent', 'dwellSchedule': ['1e-6', '1e-7']},
+    {'name': 'independent_monitored', 'finder': 'independent', 'monitored': True},
+    {'name': 'independent_console', 'finder': 'independent', 'transfer': 'console'},
+    {'name': 'independent_single_session_console', 'finder': 'independent', 'singleSession': True, 'transfer': 'console'},
+    {'name': 'joint_coordinate', 'finder': 'coordinate', 'maxScans': 100},
+    {'name': 'joint_pattern', 'finder': 'pattern', 'maxScans': 100},
+    {'name': 'joint_surrogate', 'finder': 'surrogate', 'maxScans': 100},
+]
+
+
+def printReport(results):
+    print('{:<36} {:>9} {:>10} {:>6} {:>7} {:>9} {:>13} {:>9}'.format(
+        'scenario', 'startup', 'roundtrips', 'scans', 'stopped', 'ms/point', 'scans/optimum', 'openArea'))
+    for r in results:
+        print('{:<36} {:>8.2f}s {:>10} {:>6} {:>7} {:>9.1f} {:>13} {:>9.1f}'.format(
+            r['name'], r['startup'], r['roundTrips'], r['scans'], r['stopped'], r['msPerPoint'] or 0,
+            r['scansPerOptimum'], r['openArea'] or 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of the cleye tuning flow on the Vivado simulator.')
+    parser.add_argument('--only', nargs='*', default=None, help='run only these scenarios')
+    parser.add_argument('--command-latency', default='0', help='seconds per console line of the simulator')
+    parser.add_argument('--commit-latency', default='0', help='seconds per commit_hw_sio of the simulator')
+    parser.add_argument('--scan-latency', default='0.01', help='seconds per scan of the simulator')
+    parser.add_argument('--targets', default='1', help='number of the JTAG targets of the simulator')
+    parser.add_argument('--open-target-latency', default='0', help='seconds per open_hw_target of the simulator')
+    parser.add_argument('--scan-point-latency', default='0', help='seconds per scanned grid point of the simulator')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the output of the optimizers')
+    parser.add_argument('-o', '--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--trace', default=None, help='write the timing spans to this Chrome trace file')
+    parser.add_argument('--record', default=None, help='record the sessions of the scenarios to this directory')
+    parser.add_argument('--replay', default=None, help='replay the sessions recorded to this directory')
+    args = parser.parse_args(argv)
+
+    simArgs = ['--targets', args.targets, '--open-target-latency', args.open_target_latency,
+        '--command-latency', args.command_latency, '--commit-latency', args.commit_latency,
+        '--scan-latency', args.scan_latency, '--scan-point-latency', args.scan_point_latency]
+
+    # The monitored scans are polled ten times per scan.
+    cleye.scanPollInterval = float(args.scan_latency) / 10
+    if args.trace:
+        cleye.tracer.enable()
+    transcriptDir = os.path.abspath(args.record or args.replay or '.')
+    if args.record and not os.path.exists(transcriptDir):
+        os.makedirs(transcriptDir)
+    workDir = tempfile.mkdtemp(prefix='cleye_bench_')
+    cwd = os.getcwd()
+    results = []
+    try:
+        os.chdir(workDir)
+        for scenario in scenarios:
+            if args.only and scenario['name'] not in args.only:
+                continue
+            transcriptFile = os.path.join(transcriptDir, scenario['name'] + '.jsonl')
+            if args.record:
+                cleye.transcript.start(transcriptFile)
+            replay = cleye.replaySessions(transcriptFile) if args.replay else None
+            try:
+                results.append(runScenario(scenario, simArgs, args.verbose, replay))
+            finally:
+                cleye.transcript.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    printReport(results)
+    if args.trace:
+        print('')
+        cleye.tracer.printSummary()
+        cleye.tracer.writeChromeTrace(args.trace)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
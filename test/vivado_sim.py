@@ -0,0 +1,659 @@
+# This file is part of cleye.
+#
+#     Cleye is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     Foobar is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with Foobar.  If not, see <https://www.gnu.org/licenses/>.
+
+''' Stand-in of the Vivado Tcl console for running cleye without hardware.
+
+It speaks the 'Vivado% ' prompt protocol of 'vivado -mode tcl': the commands are evaluated by a
+real Tcl interpreter (tkinter), where the hardware manager commands used by sourceme.tcl
+(get_hw_targets, get_hw_sio_gts, create_hw_sio_scan, set_property, commit_hw_sio, ...) are
+emulated. The scans write synthetic eye CSVs (in the format of write_hw_sio_scan), whose eye
+opening depends on the TX (TXDIFFSWING, TXPRE, TXPOST) and RX (RXTERM) settings of the link.
+
+Usage:
+    python vivado_sim.py [--targets N] [--gts N] [--command-latency S] [--scan-latency S] ...
+
+The 'sim_stats' command returns the counters of the session (commands, commits, scans).
+'''
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import time
+import argparse
+import fnmatch
+import json
+import tkinter
+
+import numpy as np
+
+
+simRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The legal values of the properties are the built-in tables of cleye.
+sys.path.insert(0, simRoot)
+import cleye
+
+legalValues = dict((name, [v.strip('{}') for v in values]) for name, values in cleye.defaultParameterTables.items())
+gtType = 'GTXE2'
+vivadoVersion = '2017.4'
+
+# Default values of the transceiver properties.
+defaultProperties = {
+    'TXDIFFSWING': '807 mV (1000)',
+    'TXPRE': '0.00 dB (00000)',
+    'TXPOST': '0.00 dB (00000)',
+    'RXTERM': '800 mV',
+    'IDCODE': '43651093',
+}
+
+# The best code and the width (in codes) of the eye quality curve of the properties.
+defaultOptimum = {
+    'TXDIFFSWING': (9, 4.0),
+    'TXPRE': (5, 8.0),
+    'TXPOST': (12, 8.0),
+    'RXTERM': (8, 4.0),
+}
+
+# Floor of the measured BER (one error in the dwell).
+berFloor = 1.90738e-07
+
+
+def propertyCode(value):
+    ''' Returns the numeric code of a property value.
+    'TXDIFFSWING 269 mV (0000)' like values has their binary code in brackets, the others (eg. RXTERM
+    '800 mV') are coded by their first number (in hundreds).
+    '''
+    m = re.search(r'\(([01]+)\)', value)
+    if m:
+        return int(m.group(1), 2)
+    m = re.search(r'[-+]?\d+(\.\d+)?', value)
+    if m:
+        return float(m.group(0)) / 100
+    return 0
+
+
+def tclList(items):
+    return ' '.join('{' + x + '}' if (not x or re.search(r'[\s{}"\[\]$;\\]', x)) else x for x in items)
+
+
+def _positional(args, flagsWithValue=()):
+    ''' Drops the -flags (and the values of flagsWithValue) from the args of a Tcl command.
+    '''
+    ret = []
+    skip = False
+    for a in args:
+        if skip:
+            skip = False
+        elif a.startswith('-') and not re.match(r'-?\d', a):
+            skip = a in flagsWithValue
+        else:
+            ret.append(a)
+    return ret
+
+
+def scanAxes(scanType, hincr, vincr):
+    ''' Returns the horizontal and vertical codes of a scan (symmetric around 0 like in Vivado).
+    The 1D bathtub has only the 0 vertical code.
+    '''
+    xCodes = np.arange(-(64 // hincr) * hincr, 65, hincr)
+    if scanType == '2d_full_eye':
+        yCodes = np.arange((127 // vincr) * vincr, -128, -vincr)
+    else:
+        yCodes = np.array([0])
+    return xCodes, yCodes
+
+
+def eyeBer(quality, xCodes, yCodes, random=None, floor=berFloor):
+    ''' Returns the synthetic BER grid (one row per y code) of an eye of quality (0..1).
+    floor is the lowest measurable BER (it scales with the dwell BER of the scan).
+    '''
+    x = np.abs(xCodes) / 128.0
+    y = np.abs(yCodes).astype(float)
+    # Half width/height of the eye: the BER is rising from the floor to 0.25 towards the edges.
+    width = 0.45 * quality
+    height = 120.0 * quality
+    decades = np.log10(0.25 / floor)
+    berx = 0.25 * 10 ** (-(0.5 - x)[None, :] / ((0.5 - width) / decades))
+    bery = 0.25 * 10 ** (-(127.0 - y)[:, None] / ((127.0 - height) / decades))
+    ber = np.maximum(berx, bery)
+    # Measurement noise.
+    if random is not None:
+        ber = ber * 10 ** random.normal(0, 0.05, ber.shape)
+    return np.clip(ber, floor, 0.5)
+
+
+def writeScanFile(fname, ber, scanType, hincr, vincr, description='Scan 4', started='', ended='', dwellBer=1e-5,
+        columns=None):
+    ''' Writes a BER grid (see eyeBer) to a csv file in the format of write_hw_sio_scan.
+    If columns is given, only the first columns are written (the partial result of a running scan).
+    '''
+    full = scanType == '2d_full_eye'
+    xCodes, yCodes = scanAxes(scanType, hincr, vincr)
+    if columns is not None:
+        xCodes, ber = xCodes[:columns], ber[:, :columns]
+    isOpen = ber < dwellBer
+    openArea = int(isOpen.sum()) * hincr * (vincr if full else 1)
+    hOpening = int(isOpen[list(yCodes).index(0)].sum()) * hincr
+    center = list(xCodes).index(0) if 0 in xCodes else None
+    vOpening = (int(isOpen[:, center].sum()) * vincr if center is not None else 0) if full else 1
+
+    lines = [
+        'SW Version,2017.4',
+        'GT Type,7 Series GTX',
+        'Date and Time Started,' + started,
+        'Date and Time Ended,' + ended,
+        'Scan Name,' + description,
+        'Link Settings,',
+        'Reset RX After Applying Settings,false',
+        'Open Area,{}'.format(openArea),
+        'Horizontal Opening,{}'.format(hOpening),
+        'Horizontal Percentage,{:.2f}'.format(100.0 * hOpening / 129),
+        'Vertical Opening,{}'.format(vOpening),
+        'Vertical Percentage,{:.2f}'.format(100.0 * vOpening / 255 if full else 100.0),
+        'Dwell,BER',
+        'Dwell BER,{:g}'.format(dwellBer),
+        'Dwell Time,0',
+        'Horizontal Increment,{}'.format(hincr),
+        'Horizontal Range,-0.500 UI to 0.500 UI',
+        ]
+    if full:
+        lines += ['Vertical Increment,{}'.format(vincr), 'Vertical Range,100%']
+    lines += ['Misc Info,', 'Scan Start']
+    lines.append(('2d statistical,' if full else '1d bathtub,') + ','.join(str(x) for x in xCodes))
+    for yCode, row in zip(yCodes, ber):
+        lines.append(str(yCode) + ',' + ','.join('{:g}'.format(v) for v in row))
+    lines.append('Scan End')
+
+    with open(fname, 'w', newline='\r\n') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+class SimulatedHardware():
+    ''' The emulated hardware manager: targets, devices, GTs, links and scans.
+    '''
+    def __init__(self, targets=1, gts=4, optimum=None, latencies=None, seed=0, sharedState=None):
+        self.targets = ['localhost:3121/xilinx_tcf/Digilent/SIM{:04d}A'.format(i) for i in range(targets)]
+        self.gtCount = gts
+        self.optimum = optimum if optimum is not None else defaultOptimum
+        self.latencies = latencies if latencies is not None else {}
+        self.sharedState = sharedState
+        self.random = np.random.RandomState(seed)
+        self.openTarget = None
+        self.currentDevice = None
+        self.properties = {}
+        self.links = {}
+        self.scans = {}
+        self.createdScans = 0
+        self.stats = {'commands': 0, 'commits': 0, 'scans': 0, 'scan_points': 0, 'stopped_scans': 0, 'discoveries': 0}
+
+
+    def sleep(self, name, scale=1.0):
+        latency = self.latencies.get(name, 0.0) * scale
+        if latency > 0:
+            time.sleep(latency)
+
+
+    def devices(self, target):
+        return ['xc7k325t_0']
+
+
+    def gts(self):
+        if self.openTarget is None:
+            return []
+        prefix = '{}/0_1_0/IBERT/Quad_113/MGT_X0Y'.format(self.openTarget)
+        return [prefix + str(i) for i in range(self.gtCount)]
+
+
+    def objects(self, kind, patterns):
+        ''' Returns the objects of kind ('gt', 'tx', 'rx', 'link', 'scan') matching the patterns.
+        '''
+        if kind == 'gt':
+            names = self.gts()
+        elif kind == 'tx':
+            names = [gt + '/TX' for gt in self.gts()]
+        elif kind == 'rx':
+            names = [gt + '/RX' for gt in self.gts()]
+        elif kind == 'link':
+            names = list(self.links)
+        else:
+            names = list(self.scans)
+        if not patterns:
+            return names
+        ret = []
+        for pattern in patterns:
+            for p in pattern.split():
+                ret += [n for n in names if fnmatch.fnmatchcase(n, p) and n not in ret]
+        return ret
+
+
+    def publish(self):
+        ''' Writes the committed properties to the shared state file (if any), so the other
+        simulator sessions (eg. the TX side of a link scanned by an RX session) see them.
+        '''
+        if not self.sharedState:
+            return
+        state = self.loadState()
+        for obj, props in self.properties.items():
+            state.setdefault(obj, {}).update(props)
+        tmp = '{}.{}.tmp'.format(self.sharedState, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.sharedState)
+
+
+    def loadState(self):
+        if not self.sharedState or not os.path.exists(self.sharedState):
+            return {}
+        with open(self.sharedState) as f:
+            return json.load(f)
+
+
+    def getProperty(self, name, obj):
+        props = self.properties.setdefault(obj, {})
+        if name in props:
+            return props[name]
+        if name in defaultProperties:
+            return defaultProperties[name]
+        raise Exception("[Common 17-58] '{}' is not a valid property of '{}'".format(name, obj))
+
+
+    def quality(self, link):
+        ''' Returns the eye quality (0..1) of the link from the settings of its TX and RX side.
+        '''
+        tx, rx = self.links[link]
+        committed = self.loadState()
+        def get(name, obj):
+            return committed.get(obj, {}).get(name) or self.getProperty(name, obj)
+        settings = {}
+        for name in ['TXDIFFSWING', 'TXPRE', 'TXPOST']:
+            settings[name] = get(name, tx[:-len('/TX')])
+        settings['RXTERM'] = get('RXTERM', rx[:-len('/RX')])
+
+        distance = 0.0
+        for name, value in settings.items():
+            best, width = self.optimum[name]
+            distance += ((propertyCode(value) - best) / width) ** 2
+        return float(np.exp(-distance))
+
+
+    def runScan(self, scan):
+        ''' Starts a scan. The scan runs in the background: its columns are completed (from left to
+        right) in the time of the scan latencies, see progress.
+        '''
+        props = self.scans[scan]
+        xCodes, yCodes = scanAxes(props['TYPE'], int(props.get('HORIZONTAL_INCREMENT', 16)),
+            int(props.get('VERTICAL_INCREMENT', 16)))
+        # A deeper dwell BER measures lower BER, but the scan takes longer (proportionally).
+        depth = 1e-5 / float(props.get('DWELL_BER', 1e-5))
+        props['STARTED'] = time.strftime('%Y-%b-%d %H:%M:%S')
+        props['RESULT'] = eyeBer(self.quality(props['LINK']), xCodes, yCodes, self.random, berFloor / depth)
+        props['BEGIN'] = time.time()
+        props['DURATION'] = depth * (self.latencies.get('scan', 0.0) +
+            self.latencies.get('scan_point', 0.0) * props['RESULT'].size)
+        props['STATUS'] = 'In progress'
+        self.stats['scans'] += 1
+
+
+    def progress(self, scan):
+        ''' Returns the completed fraction of a scan.
+        '''
+        props = self.scans[scan]
+        if props['STATUS'] != 'In progress':
+            return props['DONE']
+        if props['DURATION'] <= 0:
+            return 1.0
+        return min(1.0, (time.time() - props['BEGIN']) / props['DURATION'])
+
+
+    def finishScan(self, scan, stop=False):
+        ''' Waits for a running scan (or stops it). '''
+        props = self.scans[scan]
+        if props.get('STATUS') != 'In progress':
+            return
+        if stop:
+            props['DONE'] = self.progress(scan)
+            props['STATUS'] = 'Stopped'
+            self.stats['stopped_scans'] += 1
+        else:
+            remaining = props['BEGIN'] + props['DURATION'] - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+            props['DONE'] = 1.0
+            props['STATUS'] = 'Done'
+        props['ENDED'] = time.strftime('%Y-%b-%d %H:%M:%S')
+        self.stats['scan_points'] += self.columns(scan) * props['RESULT'].shape[0]
+
+
+    def columns(self, scan):
+        ''' Returns the number of the completed columns of a scan. '''
+        return int(self.progress(scan) * self.scans[scan]['RESULT'].shape[1])
+
+
+    def writeScan(self, fname, scan):
+        props = self.scans[scan]
+        dirname = os.path.dirname(fname)
+        if dirname and not os.path.isdir(dirname):
+            raise Exception("[Labtoolstcl 44-156] Directory '{}' does not exist".format(dirname))
+        writeScanFile(fname, props['RESULT'], props['TYPE'], int(props.get('HORIZONTAL_INCREMENT', 16)),
+            int(props.get('VERTICAL_INCREMENT', 16)), props['DESCRIPTION'], props['STARTED'], props.get('ENDED', ''),
+            float(props.get('DWELL_BER', 1e-5)), self.columns(scan))
+
+
+class SimulatedVivado():
+    ''' The Tcl console: a Tcl interpreter with the hardware manager commands of SimulatedHardware.
+    '''
+    def __init__(self, hardware):
+        self.hw = hardware
+        self.tcl = tkinter.Tcl()
+        self.tcl.eval('set ::sim_root {{{}}}'.format(simRoot))
+        commands = {
+            'open_hw': self.nop,
+            'connect_hw_server': self.nop,
+            'disconnect_hw_server': self.nop,
+            'close_hw': self.nop,
+            'get_hw_targets': self.get_hw_targets,
+            'get_hw_target': self.get_hw_targets,
+            'open_hw_target': self.open_hw_target,
+            'close_hw_target': self.close_hw_target,
+            'get_hw_devices': self.get_hw_devices,
+            'current_hw_device': self.current_hw_device,
+            'refresh_hw_device': self.nop,
+            'get_hw_sio_gts': self.getter('gt'),
+            'get_hw_sio_txs': self.getter('tx'),
+            'get_hw_sio_rxs': self.getter('rx'),
+            'get_hw_sio_links': self.getter('link'),
+            'get_hw_sio_scans': self.getter('scan'),
+            'create_hw_sio_link': self.create_hw_sio_link,
+            'remove_hw_sio_link': self.remove_hw_sio_link,
+            'create_hw_sio_scan': self.create_hw_sio_scan,
+            'run_hw_sio_scan': self.run_hw_sio_scan,
+            'wait_on_hw_sio_scan': self.wait_on_hw_sio_scan,
+            'stop_hw_sio_scan': self.stop_hw_sio_scan,
+            'remove_hw_sio_scan': self.remove_hw_sio_scan,
+            'write_hw_sio_scan': self.write_hw_sio_scan,
+            'get_property': self.get_property,
+            'set_property': self.set_property,
+            'commit_hw_sio': self.commit_hw_sio,
+            'list_property_value': self.list_property_value,
+            'version': self.version,
+            'sim_stats': self.sim_stats,
+            '__sim_puts': self.puts,
+        }
+        for name, func in commands.items():
+            self.tcl.createcommand(name, func)
+        # puts must write to the same stream as the console.
+        self.tcl.eval('rename puts __tcl_puts; rename __sim_puts puts')
+        # The procedures are sourced relative to the repository if they are not found.
+        self.tcl.eval('rename source __tcl_source; '
+            'proc source { fname } { if {![file exists $fname]} {set fname [file join $::sim_root $fname]}; '
+            'uplevel #0 [list __tcl_source $fname] }')
+        # exit is handled by the console loop
+        self.tcl.eval('proc exit { args } { return -code error __sim_exit }')
+
+
+    def puts(self, *args):
+        args = list(args)
+        newline = True
+        if args and args[0] == '-nonewline':
+            newline = False
+            args = args[1:]
+        if len(args) == 2:
+            args = args[1:]
+        sys.stdout.write(args[0] + ('\n' if newline else ''))
+        return ''
+
+
+    def nop(self, *args):
+        return ''
+
+
+    def getter(self, kind):
+        def get(*args):
+            return tclList(self.hw.objects(kind, _positional(args)))
+        return get
+
+
+    def get_hw_targets(self, *args):
+        return tclList(self.hw.targets)
+
+
+    def open_hw_target(self, *args):
+        args = _positional(args)
+        target = args[0] if args else self.hw.targets[0]
+        if target not in self.hw.targets:
+            raise Exception("[Labtoolstcl 44-199] No matching hw_targets were found.")
+        self.hw.sleep('open_target')
+        self.hw.openTarget = target
+        return ''
+
+
+    def close_hw_target(self, *args):
+        self.hw.openTarget = None
+        return ''
+
+
+    def get_hw_devices(self, *args):
+        if self.hw.openTarget is None:
+            return ''
+        return tclList(self.hw.devices(self.hw.openTarget))
+
+
+    def current_hw_device(self, *args):
+        args = _positional(args)
+        if args:
+            self.hw.currentDevice = args[0]
+        return self.hw.currentDevice or ''
+
+
+    def create_hw_sio_link(self, *args):
+        args = _positional(args, ['-description'])
+        if len(args) != 2 or not args[0] or not args[1]:
+            raise Exception('[Labtoolstcl 44-246] A TX and an RX endpoint is required to create a link.')
+        name = 'link_{}'.format(len(self.hw.links))
+        self.hw.links[name] = (args[0], args[1])
+        return name
+
+
+    def remove_hw_sio_link(self, *args):
+        for link in _positional(args):
+            for name in link.split():
+                self.hw.links.pop(name, None)
+        return ''
+
+
+    def create_hw_sio_scan(self, *args):
+        description = 'Scan'
+        if '-description' in args:
+            description = args[list(args).index('-description') + 1]
+        args = _positional(args, ['-description'])
+        if len(args) != 2 or args[1] not in self.hw.links:
+            raise Exception('[Labtoolstcl 44-247] A scan type and a link is required to create a scan.')
+        name = 'SCAN_{}'.format(self.hw.createdScans)
+        self.hw.createdScans += 1
+        self.hw.scans[name] = {'TYPE': args[0], 'LINK': args[1], 'DESCRIPTION': description}
+        return name
+
+
+    def run_hw_sio_scan(self, *args):
+        for scan in _positional(args):
+            self.hw.runScan(scan)
+        return ''
+
+
+    def wait_on_hw_sio_scan(self, *args):
+        for scan in _positional(args):
+            for name in scan.split():
+                self.hw.finishScan(name)
+        return ''
+
+
+    def stop_hw_sio_scan(self, *args):
+        for scan in _positional(args):
+            for name in scan.split():
+                self.hw.finishScan(name, stop=True)
+        return ''
+
+
+    def remove_hw_sio_scan(self, *args):
+        for scan in _positional(args):
+            for name in scan.split():
+                self.hw.scans.pop(name, None)
+        return ''
+
+
+    def write_hw_sio_scan(self, *args):
+        args = _positional(args)
+        if 'RESULT' not in self.hw.scans.get(args[1], {}):
+            raise Exception('[Labtoolstcl 44-258] The scan has not been run.')
+        self.hw.writeScan(args[0], args[1])
+        return ''
+
+
+    def get_property(self, *args):
+        args = _positional(args)
+        if len(args) < 2 or not args[1]:
+            raise Exception('[Common 17-55] get_property: an object is required.')
+        name, obj = args[0], args[1]
+        if obj in self.hw.scans:
+            if name == 'PROGRESS' and 'RESULT' in self.hw.scans[obj]:
+                return '{:.0f}%'.format(100.0 * self.hw.progress(obj))
+            if name == 'STATUS' and self.hw.scans[obj].get(name) == 'In progress' and self.hw.progress(obj) >= 1.0:
+                return 'Done'
+            return str(self.hw.scans[obj].get(name, ''))
+        if name == 'GT_TYPE':
+            return gtType
+        return self.hw.getProperty(name, obj)
+
+
+    def list_property_value(self, *args):
+        args = _positional(args)
+        if len(args) < 2 or args[0] not in legalValues:
+            raise Exception("[Common 17-58] '{}' is not an enum property.".format(args[0] if args else ''))
+        self.hw.stats['discoveries'] += 1
+        self.hw.sleep('discovery')
+        return tclList(legalValues[args[0]])
+
+
+    def version(self, *args):
+        if '-short' in args:
+            return vivadoVersion
+        return 'Vivado v{} (64-bit) (cleye simulator)'.format(vivadoVersion)
+
+
+    def set_property(self, *args):
+        args = _positional(args)
+        if len(args) < 3 or not args[2]:
+            raise Exception('[Common 17-55] set_property: an object is required.')
+        name, value = args[0], args[1]
+        for obj in args[2].split():
+            if obj in self.hw.scans:
+                self.hw.scans[obj][name] = value
+            else:
+                self.hw.properties.setdefault(obj, {})[name] = value
+        return ''
+
+
+    def commit_hw_sio(self, *args):
+        self.hw.stats['commits'] += 1
+        self.hw.publish()
+        self.hw.sleep('commit')
+        return ''
+
+
+    def sim_stats(self, *args):
+        return tclList(['{} {}'.format(k, v) for k, v in self.hw.stats.items()])
+
+
+    def execute(self, line):
+        ''' Evaluates a console line. Returns False on exit.
+        '''
+        self.hw.stats['commands'] += 1
+        self.hw.sleep('command')
+        try:
+            result = self.tcl.eval(line)
+        except tkinter.TclError as e:
+            if str(e) == '__sim_exit':
+                return False
+            sys.stdout.write('ERROR: {}\n'.format(e))
+        else:
+            if result:
+                sys.stdout.write(result + '\n')
+        return True
+
+
+    def console(self, prompt='Vivado% '):
+        sys.stdout.write('\n****** Vivado v2017.4 (64-bit) (cleye simulator)\n\n')
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                break
+            # The newline of the command (as the terminal echoes it).
+            sys.stdout.write('\n')
+            if not self.execute(line.rstrip('\r\n')):
+                break
+            sys.stdout.write(prompt)
+            sys.stdout.flush()
+        sys.stdout.flush()
+
+
+def parseOptimum(text):
+    ''' Parses a 'NAME=code:width,...' list of the optimal codes (see defaultOptimum).
+    '''
+    optimum = dict(defaultOptimum)
+    for item in text.split(','):
+        name, value = item.split('=')
+        code, _, width = value.partition(':')
+        optimum[name] = (float(code), float(width) if width else defaultOptimum[name][1])
+    return optimum
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in of the Vivado Tcl console for cleye.')
+    parser.add_argument('-mode', default='tcl', help='ignored (the simulator is always in tcl mode)')
+    parser.add_argument('--targets', type=int, default=1, help='number of hw_targets (one device each)')
+    parser.add_argument('--gts', type=int, default=4, help='number of hw_sio_gts per device')
+    parser.add_argument('--optimum', default='', help='optimal property codes: NAME=code[:width],...')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the measurement noise')
+    parser.add_argument('--shared-state', default=None,
+        help='file of the committed properties shared by the sessions of the same hardware')
+    parser.add_argument('--startup-latency', type=float, default=0.0, help='seconds until the first prompt')
+    parser.add_argument('--command-latency', type=float, default=0.0, help='seconds per console line')
+    parser.add_argument('--discovery-latency', type=float, default=0.0, help='seconds per list_property_value')
+    parser.add_argument('--commit-latency', type=float, default=0.0, help='seconds per commit_hw_sio')
+    parser.add_argument('--open-target-latency', type=float, default=0.0, help='seconds per open_hw_target')
+    parser.add_argument('--scan-latency', type=float, default=0.0, help='seconds per scan')
+    parser.add_argument('--scan-point-latency', type=float, default=0.0, help='seconds per scanned grid point')
+    args = parser.parse_args(argv)
+
+    latencies = {
+        'command': args.command_latency,
+        'commit': args.commit_latency,
+        'discovery': args.discovery_latency,
+        'open_target': args.open_target_latency,
+        'scan': args.scan_latency,
+        'scan_point': args.scan_point_latency,
+    }
+    optimum = parseOptimum(args.optimum) if args.optimum else None
+    hardware = SimulatedHardware(args.targets, args.gts, optimum, latencies, args.seed, args.shared_state)
+    time.sleep(args.startup_latency)
+    SimulatedVivado(hardware).console()
+
+
+if __name__ == '__main__':
+    main()